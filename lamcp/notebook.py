@@ -1,7 +1,6 @@
 import sys
-
-# from functools import lru_cache
-from cache_to_disk import cache_to_disk
+import copy
+import asyncio
 import argparse
 
 from lamcp.sources.wikidata.fetcher import WikidataFetcher
@@ -16,6 +15,9 @@ from lamcp.sources.getty.searcher import GettySearcher
 from lamcp.sources.pleiades.fetcher import PleiadesFetcher
 from lamcp.sources.pleiades.mapper import PleiadesMapper
 from lamcp.sources.pleiades.searcher import PleiadesSearcher
+from lamcp.sources.base.cache import RecordCache, SingleFlight, cache_config
+from lamcp.sources.base.federated import FederatedSearch
+from lamcp.sources.base.network import configure_pools
 
 
 cfg = {
@@ -44,6 +46,13 @@ cfg4 = {
     "fetch": "http://vocab.getty.edu/{identifier}.jsonld",
 }
 
+# Process wide connection pool sizes, set before the fetchers make their sessions
+pools = {
+    "pool_size": 10,
+    "hosts": {"www.wikidata.org": 20},
+}
+configure_pools(pools)
+
 configs = {
     "wikidata": {"fetcher": WikidataFetcher(cfg), "mapper": WikidataMapper(cfg), "searcher": WikidataSearcher(cfg)},
     "pleiades": {
@@ -57,6 +66,10 @@ configs = {
 
 configs["wikidata"]["mapper"].fetcher = configs["wikidata"]["fetcher"]
 
+record_cache = RecordCache(cache_config(configs))
+# Search hits are expanded in threads, which often share references
+in_flight = SingleFlight()
+
 
 parser = argparse.ArgumentParser(prog="notebook", description="Generate candidate entries for a name of an entity")
 
@@ -83,29 +96,51 @@ def get_primary_name(names):
     return candidates[0] if candidates else None
 
 
-@cache_to_disk(5)
 def fetch_record(dataset, identifier, entity_type=""):
-    """Fetch a record from the dataset and map to linked art"""
+    """Fetch a record from the dataset, via the record cache"""
     if dataset not in configs:
         raise ValueError(f"Invalid dataset: {dataset}")
+    record = record_cache.get("raw", dataset, identifier)
+    if record is not None:
+        return record
+    return in_flight.call(("raw", dataset, identifier), fetch_raw_record, dataset, identifier)
+
+
+def fetch_raw_record(dataset, identifier):
     fetcher = configs[dataset]["fetcher"]
+    # Fetchers backed by a local db say not to bother caching
+    if not getattr(fetcher, "cache_raw", True):
+        return fetcher.fetch(identifier)
+    record = record_cache.get("raw", dataset, identifier)
+    if record is not None:
+        return record
     print(f"Fetching {identifier} from {dataset}")
     record = fetcher.fetch(identifier)
+    record_cache.set("raw", dataset, identifier, record)
     return record
 
 
 def map_record(dataset, record, entity_type):
+    la = record_cache.get("mapped", dataset, record["identifier"], entity_type)
+    if la is not None:
+        return la
+    key = ("mapped", dataset, record["identifier"], entity_type)
+    return in_flight.call(key, transform_record, dataset, record, entity_type)
+
+
+def transform_record(dataset, record, entity_type):
     print(f"Mapping to LA...")
     mapper = configs[dataset]["mapper"]
-    la = mapper.transform(record, entity_type)
+    # The cached raw record is shared, and some mappers change what they're given
+    la = mapper.transform(copy.deepcopy(record), entity_type)
     if la is not None:
+        record_cache.set("mapped", dataset, record["identifier"], la["data"], entity_type)
         return la["data"]
     else:
         print(f"Failed to map from {dataset} to LA")
         return None
 
 
-# @cache_to_disk(5)
 def make_simple_reference(dataset, identifier, entity_type=""):
     if identifier.startswith("http"):
         namespace = configs[dataset]["mapper"].namespace
@@ -290,6 +325,13 @@ def make_simple_record(dataset, uri, entity_type=""):
     return outrec
 
 
+async def expand_hit(dataset, uri, entity_type):
+    return await asyncio.to_thread(make_simple_record, dataset, uri, entity_type)
+
+
+federated = FederatedSearch(configs, expand_hit, max_hits=10)
+
+
 def do_basic_name_search(datasets: str, entity_name: str, name_lang: str, entity_type: str):
     """
     Search for the top 20 entities in the given scope by their exact name.
@@ -314,18 +356,14 @@ def do_basic_name_search(datasets: str, entity_name: str, name_lang: str, entity
 
     name = entity_name.lower()
     datasets = datasets.split(",")
-    recs = []
-
-    for ds in datasets:
-        searcher = configs.get(ds, {}).get("searcher", None)
-        if searcher is not None:
-            # Here search for matches on name
-            res = searcher.search(name, name_lang, entity_type)
-            for uri in res["results"][:10]:
-                outrec = make_simple_record(ds, uri, entity_type)
-                if outrec is not None:
-                    recs.append(outrec)
 
+    # Not asyncio.run, as that would wait for the threads of any source
+    # that missed its deadline
+    loop = asyncio.new_event_loop()
+    try:
+        recs = loop.run_until_complete(federated.search(datasets, name, name_lang, entity_type))
+    finally:
+        loop.close()
     return {"candidates": recs}
 
 
@@ -1,16 +1,21 @@
-from async_lru import alru_cache
-
+import copy
 import asyncio
+from typing import Optional
+import ujson as json
 import uvloop
 from hypercorn.config import Config as HyperConfig
 from hypercorn.asyncio import serve as hypercorn_serve
 
-from fastapi import FastAPI
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi_mcp import FastApiMCP
 
 from sources import configs
+from sources.base.cache import RecordCache, SingleFlight, cache_config
+from sources.base.federated import FederatedSearch
+from sources.base.network import request_priority, INTERACTIVE, configure_pools
+from sources.base.spatial import open_spatial_index, spatial_config, parse_bbox, containment_available
 
 
 # Query Wikidata by name
@@ -42,6 +47,23 @@ from sources import configs
 # Linked Art Constants
 #
 PRIMARY = "http://vocab.getty.edu/aat/300404670"
+ENGLISH = "http://vocab.getty.edu/aat/300388277"
+
+# Graph expansion resolves references in parallel, bounded per dataset
+# so that a single large record can't flood one upstream
+MAX_DATASET_CONCURRENCY = 8
+dataset_limits = {}
+
+# Process wide connection pool sizes, from the connection_pools config section
+configure_pools(getattr(configs, "connection_pools", None))
+
+record_cache = RecordCache(cache_config(configs))
+# Places from WoF, GeoNames and Pleiades by location, built with
+# python -m lamcp.sources.base.spatial; opened on first use
+spatial_settings = spatial_config(configs)
+spatial_index = None
+# Concurrent requests for the same record share one fetch and one mapping
+in_flight = SingleFlight()
 
 app = FastAPI()
 origins = ["*"]
@@ -54,6 +76,12 @@ app.add_middleware(
 )
 
 
+def get_dataset_limit(dataset):
+    if dataset not in dataset_limits:
+        dataset_limits[dataset] = asyncio.Semaphore(MAX_DATASET_CONCURRENCY)
+    return dataset_limits[dataset]
+
+
 def get_primary_name(names):
     candidates = []
     for name in names:
@@ -69,30 +97,59 @@ def get_primary_name(names):
     return candidates[0] if candidates else None
 
 
-def fetch_record(dataset, identifier, entity_type=""):
+async def fetch_record(dataset, identifier, entity_type=""):
     """Fetch a record from the dataset and map to linked art"""
 
     if dataset not in configs:
         raise ValueError(f"Invalid dataset: {dataset}")
+    la = record_cache.get("mapped", dataset, identifier, entity_type)
+    if la is not None:
+        return la
+    key = ("mapped", dataset, identifier, entity_type)
+    return await in_flight.do(key, load_record, dataset, identifier, entity_type)
+
+
+async def fetch_raw_record(dataset, identifier):
     fetcher = configs[dataset]["fetcher"]
+    # Fetchers backed by a local db say not to bother caching
+    if not getattr(fetcher, "cache_raw", True):
+        return await fetcher.afetch(identifier)
+    record = record_cache.get("raw", dataset, identifier)
+    if record is None:
+        print(f"Fetching {identifier} from {dataset}")
+        record = await fetcher.afetch(identifier)
+        record_cache.set("raw", dataset, identifier, record)
+    return record
+
+
+def transform_copy(mapper, record, entity_type):
+    # The raw record is shared through the cache, and some mappers change the
+    # record they're given (eg RorMapper adds labels to names), so map a copy
+    return mapper.transform(copy.deepcopy(record), entity_type)
+
+
+async def load_record(dataset, identifier, entity_type=""):
+    # The raw record is shared across entity types, so coalesce on it separately
+    record = await in_flight.do(("raw", dataset, identifier), fetch_raw_record, dataset, identifier)
+    if record is None:
+        return None
     mapper = configs[dataset]["mapper"]
-
-    print(f"Fetching {identifier} from {dataset}")
-    record = fetcher.fetch(identifier)
     print(f"Mapping to LA")
-    la = mapper.transform(record, entity_type)
+    # Mapping is CPU bound and may fetch references synchronously, so keep it off the loop
+    la = await asyncio.to_thread(transform_copy, mapper, record, entity_type)
     if la is not None:
         print(la["data"])
+        record_cache.set("mapped", dataset, identifier, la["data"], entity_type)
         return la["data"]
     else:
         print(f"Failed to map {identifier} to LA")
         return None
 
 
-def make_simple_reference(dataset, identifier, entity_type=""):
+async def make_simple_reference(dataset, identifier, entity_type=""):
     if identifier.startswith("http"):
         identifier = identifier.rsplit("/", 1)[-1]
-    rec = fetch_record(dataset, identifier, entity_type)
+    rec = await fetch_record(dataset, identifier, entity_type)
     if not rec:
         return None
     outrec = {}
@@ -102,19 +159,45 @@ def make_simple_reference(dataset, identifier, entity_type=""):
     return outrec, rec
 
 
-def make_simple_record(dataset, uri, entity_type=""):
-    try:
-        outrec, rec = make_simple_reference(dataset, uri, entity_type)
-    except Exception:
-        return None
+async def resolve_simple_reference(dataset, identifier):
+    # Failures become None rather than failing the whole record
+    async with get_dataset_limit(dataset):
+        try:
+            res = await make_simple_reference(dataset, identifier)
+        except Exception:
+            return None
+    return res[0] if res else None
+
+
+async def resolve_references(dataset, identifiers):
+    """Resolve many references concurrently, returning a dict of identifier to simple reference"""
+    results = await asyncio.gather(*[resolve_simple_reference(dataset, ident) for ident in identifiers])
+    return dict(zip(identifiers, results))
+
+
+async def resolve_records(dataset, identifiers):
+    """Resolve many embedded records concurrently, returning a dict of identifier to simple record"""
+    results = await asyncio.gather(*[make_simple_record(dataset, ident) for ident in identifiers])
+    return dict(zip(identifiers, results))
+
+
+def build_simple_record(outrec, rec, ref, record):
+    """Fill outrec from the mapped rec.
+    ref(identifier) returns a simple reference (or None) and record(identifier) a full simple record
+    """
+
+    def refs(nodes):
+        res = [ref(x["id"]) for x in nodes if "id" in x]
+        return [x for x in res if x is not None]
+
+    def set_ref(key, nodes):
+        if nodes and "id" in nodes[0]:
+            val = ref(nodes[0]["id"])
+            if val is not None:
+                outrec[key] = val
+
     if "classified_as" in rec:
-        outrec["classifications"] = []
-        for cxn in rec["classified_as"]:
-            if "id" in cxn:
-                try:
-                    outrec["classifications"].append(make_simple_reference(dataset, cxn["id"])[0])
-                except Exception:
-                    continue
+        outrec["classifications"] = refs(rec["classified_as"])
     if "referred_to_by" in rec:
         outrec["descriptions"] = []
         for stmt in rec["referred_to_by"]:
@@ -124,74 +207,45 @@ def make_simple_record(dataset, uri, entity_type=""):
                     continue
             desc = {"content": stmt["content"]}
             if "classified_as" in stmt:
-                desc["classifications"] = []
-                for cxn in stmt["classified_as"]:
-                    if "id" in cxn:
-                        try:
-                            desc["classifications"].append(make_simple_reference(dataset, cxn["id"])[0])
-                        except Exception:
-                            continue
+                desc["classifications"] = refs(stmt["classified_as"])
             outrec["descriptions"].append(desc)
         # Arbitrarily limit descriptions to 5
         if len(outrec["descriptions"]) > 5:
             outrec["descriptions"] = outrec["descriptions"][:5]
     if "part_of" in rec:
-        outrec["part_of"] = []
-        for parent in rec["part_of"]:
-            try:
-                outrec["part_of"].append(make_simple_reference(dataset, parent["id"])[0])
-            except Exception:
-                continue
+        outrec["part_of"] = refs(rec["part_of"])
     elif "broader" in rec:
-        outrec["part_of"] = []
-        for parent in rec["broader"]:
-            try:
-                outrec["part_of"].append(make_simple_reference(dataset, parent["id"])[0])
-            except Exception:
-                continue
+        outrec["part_of"] = refs(rec["broader"])
     if rec["type"] == "Person":
         if "born" in rec:
             # split into birthDate and birthPlace
             if "timespan" in rec["born"]:
                 if "begin_of_the_begin" in rec["born"]["timespan"]:
                     outrec["birthDate"] = rec["born"]["timespan"]["begin_of_the_begin"]
-            if "took_place_at" in rec["born"]:
-                outrec["birthPlace"] = make_simple_reference(dataset, rec["born"]["took_place_at"][0]["id"])[0]
+            set_ref("birthPlace", rec["born"].get("took_place_at", []))
         if "died" in rec:
             # split into deathDate and deathPlace
             if "timespan" in rec["died"]:
                 if "begin_of_the_begin" in rec["died"]["timespan"]:
                     outrec["deathDate"] = rec["died"]["timespan"]["begin_of_the_begin"]
-            if "took_place_at" in rec["died"]:
-                outrec["deathPlace"] = make_simple_reference(dataset, rec["died"]["took_place_at"][0]["id"])[0]
+            set_ref("deathPlace", rec["died"].get("took_place_at", []))
     elif rec["type"] == "Group":
         if "formed_by" in rec:
             # split into birthDate and birthPlace
             if "timespan" in rec["formed_by"]:
                 if "begin_of_the_begin" in rec["formed_by"]["timespan"]:
                     outrec["foundingDate"] = rec["formed_by"]["timespan"]["begin_of_the_begin"]
-            if "took_place_at" in rec["formed_by"]:
-                outrec["foundingPlace"] = make_simple_reference(dataset, rec["formed_by"]["took_place_at"][0]["id"])[
-                    0
-                ]
+            set_ref("foundingPlace", rec["formed_by"].get("took_place_at", []))
             if "carried_out_by" in rec["formed_by"]:
-                outrec["founder"] = [
-                    make_simple_reference(dataset, x["id"])[0] for x in rec["formed_by"]["carried_out_by"]
-                ]
+                outrec["founder"] = refs(rec["formed_by"]["carried_out_by"])
 
         if "dissolved_by" in rec:
             # split into deathDate and deathPlace
             if "timespan" in rec["dissolved_by"]:
                 if "begin_of_the_begin" in rec["dissolved_by"]["timespan"]:
                     outrec["dissolutionDate"] = rec["dissolved_by"]["timespan"]["begin_of_the_begin"]
-            if "took_place_at" in rec["dissolved_by"]:
-                outrec["dissolutionPlace"] = make_simple_reference(
-                    dataset, rec["dissolved_by"]["took_place_at"][0]["id"]
-                )[0]
-            if "carried_out_by" in rec["dissolved_by"]:
-                outrec["dissolver"] = make_simple_reference(dataset, rec["dissolved_by"]["carried_out_by"][0]["id"])[
-                    0
-                ]
+            set_ref("dissolutionPlace", rec["dissolved_by"].get("took_place_at", []))
+            set_ref("dissolver", rec["dissolved_by"].get("carried_out_by", []))
     elif rec["type"] == "HumanMadeObject":
         # made_of
         # carries/shows -- embed this
@@ -203,19 +257,12 @@ def make_simple_record(dataset, uri, entity_type=""):
                 dt = cre["timespan"].get("begin_of_the_begin", cre["timespan"].get("end_of_the_end", None))
                 if dt is not None:
                     outrec["creationDate"] = dt
-            if "took_place_at" in cre:
-                outrec["creationPlace"] = make_simple_reference(dataset, cre["took_place_at"][0]["id"])[0]
-            if "carried_out_by" in cre:
-                outrec["creator"] = [make_simple_reference(dataset, x["id"])[0] for x in cre["carried_out_by"]]
-            if "part" in cre:
-                who = []
-                for part in cre["part"]:
-                    if "carried_out_by" in part:
-                        who = [make_simple_reference(dataset, x["id"])[0] for x in part["carried_out_by"]]
-                if "creator" in outrec:
-                    outrec["creator"].extend(who)
-                elif who:
-                    outrec["creator"] = who
+            set_ref("creationPlace", cre.get("took_place_at", []))
+            who = refs(cre.get("carried_out_by", []))
+            for part in cre.get("part", []):
+                who.extend(refs(part.get("carried_out_by", [])))
+            if who:
+                outrec["creator"] = who
 
         if "encountered_by" in rec:
             cres = rec["encountered_by"]
@@ -224,46 +271,63 @@ def make_simple_record(dataset, uri, entity_type=""):
                     dt = cre["timespan"].get("begin_of_the_begin", cre["timespan"].get("end_of_the_end", None))
                     if dt is not None:
                         outrec["discoveryDate"] = dt
-                if "took_place_at" in cre:
-                    outrec["discoveryPlace"] = make_simple_reference(dataset, cre["took_place_at"][0]["id"])[0]
-                if "carried_out_by" in cre:
-                    outrec["discoverer"] = [make_simple_reference(dataset, x["id"])[0] for x in cre["carried_out_by"]]
-                if "part" in cre:
-                    who = []
-                    for part in cre["part"]:
-                        if "carried_out_by" in cre:
-                            who = [make_simple_reference(dataset, x["id"])[0] for x in cre["carried_out_by"]]
-                    if "discoverer" in outrec:
-                        outrec["discoverer"].extend(who)
-                    else:
-                        outrec["discoverer"] = who
+                set_ref("discoveryPlace", cre.get("took_place_at", []))
+                who = refs(cre.get("carried_out_by", []))
+                for part in cre.get("part", []):
+                    who.extend(refs(part.get("carried_out_by", [])))
+                if who:
+                    outrec["discoverer"] = who
 
         if "made_of" in rec:
-            outrec["material"] = [make_simple_reference(dataset, x["id"])[0] for x in rec["made_of"]]
+            outrec["material"] = refs(rec["made_of"])
         if "carries" in rec:
-            outrec["carries"] = [make_simple_record(dataset, x["id"]) for x in rec["carries"]]
+            outrec["carries"] = [record(x["id"]) for x in rec["carries"]]
         if "shows" in rec:
-            outrec["shows"] = [make_simple_record(dataset, x["id"]) for x in rec["shows"]]
+            outrec["shows"] = [record(x["id"]) for x in rec["shows"]]
 
     elif rec["type"] in ["LinguisticObject", "VisualItem"]:
         # about, represents
         # embed the HMO somehow? Would require a search...
         if "about" in rec:
-            outrec["about"] = [make_simple_reference(dataset, x["id"])[0] for x in rec["about"]]
+            outrec["about"] = refs(rec["about"])
         if "represents" in rec:
-            outrec["represents"] = [make_simple_reference(dataset, x["id"])[0] for x in rec["represents"]]
+            outrec["represents"] = refs(rec["represents"])
 
     if "member_of" in rec:
-        outrec["member_of"] = []
-        for parent in rec["member_of"]:
-            try:
-                outrec["member_of"].append(make_simple_reference(dataset, parent["id"])[0])
-            except Exception:
-                continue
+        outrec["member_of"] = refs(rec["member_of"])
 
     return outrec
 
 
+async def make_simple_record(dataset, uri, entity_type=""):
+    try:
+        outrec, rec = await make_simple_reference(dataset, uri, entity_type)
+    except Exception:
+        return None
+
+    # Walk the record once to collect every referenced id, resolve them all
+    # concurrently, and then walk again to assemble from the results
+    wanted_refs = {}
+    wanted_recs = {}
+
+    def collect(wanted):
+        def fn(ident):
+            wanted[ident] = None
+            return None
+
+        return fn
+
+    build_simple_record({}, rec, collect(wanted_refs), collect(wanted_recs))
+    refs, recs = await asyncio.gather(
+        resolve_references(dataset, list(wanted_refs)), resolve_records(dataset, list(wanted_recs))
+    )
+    return build_simple_record(outrec, rec, refs.get, recs.get)
+
+
+# Datasets are searched at once, each with its own deadline
+federated = FederatedSearch(configs, make_simple_record, max_hits=20)
+
+
 @app.get("/api/basic/search_by_name", operation_id="search_by_name")
 async def do_basic_name_search(datasets: str, entity_name: str, name_lang: str, entity_type: str):
     """
@@ -287,19 +351,28 @@ async def do_basic_name_search(datasets: str, entity_name: str, name_lang: str,
         - candidates (List[dict]): A list of candidate entity descriptions to choose from.
     """
 
+    request_priority.set(INTERACTIVE)
     name = entity_name.lower()
     datasets = datasets.split(",")
+    return await federated.search(datasets, name, name_lang, entity_type)
 
-    # Here search for matches
 
-    recs = []
-    for r in res["results"][:20]:
-        uri = r[0]
-        outrec = make_simple_record(uri)
-        if outrec is not None:
-            recs.append(outrec)
+@app.get("/api/basic/search_by_name/stream", operation_id="search_by_name_stream")
+async def do_basic_name_search_stream(datasets: str, entity_name: str, name_lang: str, entity_type: str):
+    """
+    As search_by_name, but stream each candidate as a line of JSON as soon as it is ready,
+    in whatever order the datasets answer.
+    """
+
+    request_priority.set(INTERACTIVE)
+    name = entity_name.lower()
+    datasets = datasets.split(",")
 
-    return recs
+    async def lines():
+        async for ds, rank, rec in federated.stream(datasets, name, name_lang, entity_type):
+            yield json.dumps({"dataset": ds, "rank": rank, "candidate": rec}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
 
 
 @app.get("/api/basic/get", operation_id="get_by_id")
@@ -314,13 +387,92 @@ async def do_basic_fetch(dataset: str, identifier: str, entity_type: str):
     Returns:
         - candidate (dict): The description of the entity, including links to other entities
     """
+    # Someone is waiting for this one, so it goes ahead of background fetches
+    request_priority.set(INTERACTIVE)
     identifier = str(identifier)
     print(f"Got: {dataset} , {identifier} , {entity_type}")
-    outrec = make_simple_record(dataset, identifier, entity_type)
+    outrec = await make_simple_record(dataset, identifier, entity_type)
     print(outrec)
     return JSONResponse(outrec)
 
 
+def get_places_index():
+    global spatial_index
+    if spatial_index is None:
+        spatial_index = open_spatial_index(spatial_settings)
+        if spatial_index is None:
+            raise HTTPException(
+                status_code=503,
+                detail=f"The places index {spatial_settings.get('path', '')} has not been built; see lamcp.sources.base.spatial",
+            )
+    return spatial_index
+
+
+@app.get("/api/basic/places_near", operation_id="search_places_near")
+async def do_places_near(
+    latitude: Optional[float] = None,
+    longitude: Optional[float] = None,
+    radius_km: float = 10,
+    bbox: str = "",
+    datasets: str = "",
+    limit: int = 20,
+):
+    """
+    Find places near a point, nearest first, from the local index of WoF, GeoNames and Pleiades places.
+    The `dataset` and `identifier` of each place can be used with the get_by_id tool to retrieve its full record.
+
+    Parameters:
+        - latitude (float): Latitude of the point, in decimal degrees; not needed with bbox
+        - longitude (float): Longitude of the point, in decimal degrees; not needed with bbox
+        - radius_km (float): How far from the point to look, in kilometres
+        - bbox (str): Optionally, "min_longitude,min_latitude,max_longitude,max_latitude" to search within instead of a point and radius
+        - datasets (str): Optionally, comma separated datasets to limit to: wof, geonames, pleiades
+        - limit (int): Maximum number of places to return
+
+    Returns:
+        - places (List[dict]): dataset, identifier, name, type, latitude, longitude and distance_km for each place
+    """
+    request_priority.set(INTERACTIVE)
+    dss = [x.strip() for x in datasets.split(",") if x.strip()]
+    if bbox:
+        try:
+            box = parse_bbox(bbox)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        index = get_places_index()
+        places = await asyncio.to_thread(index.within_bbox, *box, limit, dss)
+    elif latitude is None or longitude is None:
+        raise HTTPException(status_code=400, detail="Either latitude and longitude, or bbox, are required")
+    else:
+        index = get_places_index()
+        places = await asyncio.to_thread(index.nearby, latitude, longitude, radius_km, limit, dss)
+    return JSONResponse(places)
+
+
+@app.get("/api/basic/places_containing", operation_id="search_places_containing")
+async def do_places_containing(latitude: float, longitude: float, datasets: str = "", limit: int = 20):
+    """
+    Find the places whose boundaries contain a point, most specific (smallest) first,
+    eg the neighbourhood, city, region and country that a location is in.
+
+    Parameters:
+        - latitude (float): Latitude of the point, in decimal degrees
+        - longitude (float): Longitude of the point, in decimal degrees
+        - datasets (str): Optionally, comma separated datasets to limit to: wof, pleiades
+        - limit (int): Maximum number of places to return
+
+    Returns:
+        - places (List[dict]): dataset, identifier, name, type, latitude and longitude for each place
+    """
+    request_priority.set(INTERACTIVE)
+    dss = [x.strip() for x in datasets.split(",") if x.strip()]
+    if not containment_available():
+        raise HTTPException(status_code=503, detail="Finding the places that contain a point needs shapely installed")
+    index = get_places_index()
+    places = await asyncio.to_thread(index.containing, latitude, longitude, limit, dss)
+    return JSONResponse(places)
+
+
 # @app.get("/api/basic/explain", operation_id="get_schema")
 # async def do_explain_schema():
 #    pass
@@ -349,7 +501,10 @@ if __name__ == "__main__":
             "search",
             "facet",
             "search_by_name",
+            "search_by_name_stream",
             "get_by_id",
+            "search_places_near",
+            "search_places_containing",
         ],
     )
     mcp.mount_http()
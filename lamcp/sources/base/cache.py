@@ -0,0 +1,245 @@
+import os
+import time
+import asyncio
+import sqlite3
+import threading
+from collections import OrderedDict
+import ujson as json
+import logging
+
+logger = logging.getLogger("lamcp")
+
+# Two tier cache for fetched and mapped records:
+#   a bounded in-memory LRU in front of a persistent SQLite store
+# Keys are (kind, dataset, identifier, entity_type) where kind is "raw" for
+# the fetched record and "mapped" for the Linked Art output
+
+default_cache_path = os.path.join(os.path.expanduser("~"), ".cache", "lamcp", "records.sqlite")
+# Seconds to keep records per source, 0 = forever
+# Sources that change frequently get shorter lifetimes than the default
+default_ttl = 7 * 86400
+default_source_ttls = {
+    "wikidata": 86400,
+    "lux": 86400,
+}
+
+
+class LruCache(object):
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            try:
+                (value, expires) = self.data[key]
+            except KeyError:
+                return None
+            if expires and expires < time.time():
+                del self.data[key]
+                return None
+            self.data.move_to_end(key)
+            return value
+
+    def set(self, key, value, expires=0):
+        with self.lock:
+            self.data[key] = (value, expires)
+            self.data.move_to_end(key)
+            while len(self.data) > self.max_size:
+                self.data.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def __len__(self):
+        return len(self.data)
+
+
+class SqliteStore(object):
+    def __init__(self, path):
+        self.path = path
+        dirn = os.path.dirname(path)
+        if dirn and not os.path.exists(dirn):
+            os.makedirs(dirn)
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS records (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)"
+        )
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            row = self.conn.execute("SELECT value, expires FROM records WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        (value, expires) = row
+        if expires and expires < time.time():
+            self.delete(key)
+            return None
+        return (json.loads(value), expires)
+
+    def set(self, key, value, expires=0):
+        js = json.dumps(value)
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO records VALUES (?, ?, ?)", (key, js, expires))
+
+    def delete(self, key):
+        with self.lock:
+            self.conn.execute("DELETE FROM records WHERE key = ?", (key,))
+
+    def purge(self):
+        # Remove everything that has expired
+        with self.lock:
+            cur = self.conn.execute("DELETE FROM records WHERE expires > 0 AND expires < ?", (time.time(),))
+        return cur.rowcount
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM records")
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+
+def cache_config(configs):
+    # RecordCache settings from the all-configs object: its record_cache
+    # section, if any, with the store in temp_dir unless a path is given
+    config = dict(getattr(configs, "record_cache", None) or {})
+    temp_dir = getattr(configs, "temp_dir", None)
+    if "path" not in config and temp_dir:
+        config["path"] = os.path.join(temp_dir, "records.sqlite")
+    return config
+
+
+class RecordCache(object):
+    def __init__(self, config=None):
+        if config is None:
+            config = {}
+        self.default_ttl = config.get("ttl", default_ttl)
+        self.source_ttls = config.get("source_ttls", default_source_ttls)
+        self.memory = LruCache(config.get("memory_size", 10000))
+        # The store is opened on first use, so importing doesn't create it
+        # A path of "" is memory only
+        self.path = config.get("path", default_cache_path)
+        self._store = None
+        self.store_lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "store_hits": 0, "misses": 0, "sets": 0}
+
+    @property
+    def store(self):
+        if self._store is None and self.path:
+            with self.store_lock:
+                if self._store is None:
+                    self._store = SqliteStore(self.path)
+        return self._store
+
+    def make_key(self, kind, dataset, identifier, entity_type=""):
+        return f"{kind}|{dataset}|{identifier}|{entity_type or ''}"
+
+    def get_expires(self, dataset):
+        ttl = self.source_ttls.get(dataset, self.default_ttl)
+        return time.time() + ttl if ttl else 0
+
+    def get(self, kind, dataset, identifier, entity_type=""):
+        key = self.make_key(kind, dataset, identifier, entity_type)
+        value = self.memory.get(key)
+        if value is not None:
+            self.stats["memory_hits"] += 1
+            return value
+        if self.store is not None:
+            res = self.store.get(key)
+            if res is not None:
+                (value, expires) = res
+                self.memory.set(key, value, expires)
+                self.stats["store_hits"] += 1
+                return value
+        self.stats["misses"] += 1
+        return None
+
+    def set(self, kind, dataset, identifier, value, entity_type=""):
+        if value is None:
+            return
+        key = self.make_key(kind, dataset, identifier, entity_type)
+        expires = self.get_expires(dataset)
+        self.memory.set(key, value, expires)
+        if self.store is not None:
+            try:
+                self.store.set(key, value, expires)
+            except Exception as e:
+                logger.error(f"Failed to write {key} to record cache: {e}")
+        self.stats["sets"] += 1
+
+    def delete(self, kind, dataset, identifier, entity_type=""):
+        key = self.make_key(kind, dataset, identifier, entity_type)
+        self.memory.delete(key)
+        if self.store is not None:
+            self.store.delete(key)
+
+    def hit_rate(self):
+        hits = self.stats["memory_hits"] + self.stats["store_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+
+class SingleFlight(object):
+    # Concurrent requests for the same key share one in-flight call and its
+    # result (or exception), rather than each going upstream.
+    # `do` is for coroutines on the event loop, `call` for plain functions in threads
+
+    def __init__(self):
+        self.flights = {}
+        self.threaded = {}
+        self.lock = threading.Lock()
+        self.stats = {"calls": 0, "shared": 0}
+
+    async def do(self, key, fn, *args):
+        self.stats["calls"] += 1
+        fut = self.flights.get(key, None)
+        if fut is None:
+            fut = asyncio.ensure_future(fn(*args))
+            self.flights[key] = fut
+
+            def done(f):
+                if self.flights.get(key, None) is f:
+                    del self.flights[key]
+
+            fut.add_done_callback(done)
+        else:
+            self.stats["shared"] += 1
+        # One waiter giving up shouldn't cancel the call for everyone else
+        return await asyncio.shield(fut)
+
+    def call(self, key, fn, *args):
+        with self.lock:
+            self.stats["calls"] += 1
+            flight = self.threaded.get(key, None)
+            leader = flight is None
+            if leader:
+                flight = {"event": threading.Event(), "result": None, "error": None}
+                self.threaded[key] = flight
+            else:
+                self.stats["shared"] += 1
+        if not leader:
+            flight["event"].wait()
+            if flight["error"] is not None:
+                raise flight["error"]
+            return flight["result"]
+        try:
+            flight["result"] = fn(*args)
+            return flight["result"]
+        except Exception as e:
+            flight["error"] = e
+            raise
+        finally:
+            with self.lock:
+                del self.threaded[key]
+            flight["event"].set()
@@ -0,0 +1,208 @@
+import re
+
+# Compact form for the identifiers in the equivalence indexes, which are
+# otherwise stored as full strings like "lcnaf:n79021164" or
+# "http://vocab.getty.edu/ulan/500115393".
+# A known prefix becomes a one byte code, and a numeric local part is packed
+# as a big-endian integer:
+#   code | 0x80, int bytes      --> prefix + str(int)
+#   code, utf-8 bytes           --> prefix + text
+# Code 0 is no prefix.
+#
+# The codes are stored in the indexes, so only ever append to this list
+
+prefixes = (
+    # short names, as used in the csv files and index keys
+    "lc:",
+    "lcnaf:",
+    "lcsh:",
+    "lcvoc:",
+    "lcc:",
+    "lcpm:",
+    "lcmp:",
+    "fast:",
+    "viaf:",
+    "aat:",
+    "ulan:",
+    "tgn:",
+    "wikidata:",
+    "wikidata:Q",
+    "gnd:",
+    "dnb:",
+    "bnf:",
+    "isni:",
+    "japan:",
+    "ndl:",
+    "geonames:",
+    "wof:",
+    "aspace:",
+    "gbif:",
+    "eol:",
+    "bionomia:",
+    "oclcnum:",
+    "lang:",
+    "idref:",
+    "nsf:",
+    "ringgold:",
+    "ror:",
+    "snac:",
+    "orcid:",
+    "mimo:",
+    "osm:",
+    "snl:",
+    # letters that start LC identifiers
+    "lc:n",
+    "lc:nr",
+    "lc:no",
+    "lc:nb",
+    "lc:sh",
+    "lcnaf:n",
+    "lcnaf:nr",
+    "lcnaf:no",
+    "lcnaf:nb",
+    "lcsh:sh",
+    # bare local identifiers
+    "Q",
+    "n",
+    "nr",
+    "no",
+    "nb",
+    "sh",
+    # namespaces
+    "http://www.wikidata.org/entity/",
+    "http://www.wikidata.org/entity/Q",
+    "https://www.wikidata.org/entity/Q",
+    "http://viaf.org/viaf/",
+    "https://viaf.org/viaf/",
+    "http://id.loc.gov/authorities/names/",
+    "http://id.loc.gov/authorities/names/n",
+    "http://id.loc.gov/authorities/names/nr",
+    "http://id.loc.gov/authorities/names/no",
+    "http://id.loc.gov/authorities/names/nb",
+    "http://id.loc.gov/authorities/subjects/",
+    "http://id.loc.gov/authorities/subjects/sh",
+    "http://id.loc.gov/rwo/agents/",
+    "http://id.loc.gov/vocabulary/",
+    "https://id.loc.gov/vocabulary/",
+    "https://id.loc.gov/authorities/performanceMediums/",
+    "http://id.worldcat.org/fast/",
+    "http://vocab.getty.edu/aat/",
+    "http://vocab.getty.edu/ulan/",
+    "http://vocab.getty.edu/tgn/",
+    "https://d-nb.info/gnd/",
+    "http://d-nb.info/gnd/",
+    "https://data.bnf.fr/",
+    "http://isni.org/isni/",
+    "https://isni.org/isni/",
+    "http://id.ndl.go.jp/auth/entity/",
+    "http://id.ndl.go.jp/auth/ndlna/",
+    "http://id.ndl.go.jp/auth/ndlsh/",
+    "https://sws.geonames.org/",
+    "http://sws.geonames.org/",
+    "http://data.whosonfirst.org/",
+    "https://www.idref.fr/",
+    "https://archives.yale.edu/agents/",
+    "https://www.gbif.org/species/",
+    "https://eol.org/pages/",
+    "https://www.worldcat.org/oclc/",
+    "https://ror.org/",
+    "https://snaccooperative.org/ark:/99166/",
+    "https://orcid.org/",
+    "http://www.mimo-db.eu/InstrumentsKeywords/",
+    "https://libris.kb.se/",
+    "https://bionomia.net/",
+    "https://nsf.gov/data/awards/",
+    "https://ringgold.com/",
+)
+
+prefix_codes = {p: i + 1 for i, p in enumerate(prefixes)}
+separators = re.compile("[:/#=]")
+numeric_re = re.compile("^(?:0|[1-9][0-9]{0,18})$")
+alpha_re = re.compile("[A-Za-z]+")
+
+
+def split_prefix(value):
+    # Longest known prefix of value, and the rest
+    for m in reversed(list(separators.finditer(value))):
+        p = value[: m.end()]
+        if p in prefix_codes:
+            break
+    else:
+        p = ""
+    # Some namespaces also have a fixed letter before the number
+    m = alpha_re.match(value, len(p))
+    if m is not None and value[: m.end()] in prefix_codes:
+        p = value[: m.end()]
+    return (p, value[len(p) :])
+
+
+def encode(value):
+    (p, local) = split_prefix(value)
+    code = prefix_codes.get(p, 0)
+    if numeric_re.match(local):
+        n = int(local)
+        return bytes([code | 0x80]) + n.to_bytes(max(1, (n.bit_length() + 7) // 8), "big")
+    return bytes([code]) + local.encode("utf-8")
+
+
+def decode(data):
+    code = data[0]
+    p = prefixes[(code & 0x7F) - 1] if code & 0x7F else ""
+    if code & 0x80:
+        return p + str(int.from_bytes(data[1:], "big"))
+    return p + data[1:].decode("utf-8")
+
+
+# As str, for stores that only take text: one char per byte
+def encode_text(value):
+    return encode(value).decode("latin-1")
+
+
+def decode_text(value):
+    return decode(value.encode("latin-1"))
+
+
+class CompactIndex(object):
+    # Wraps a str keyed and valued index (eg the equivalents index) so that
+    # keys and string values are stored encoded; everything else is passed through
+
+    def __init__(self, store):
+        self.store = store
+
+    def __getitem__(self, key):
+        return self.decode_value(self.store[encode_text(key)])
+
+    def __setitem__(self, key, value):
+        self.store[encode_text(key)] = self.encode_value(value)
+
+    def __delitem__(self, key):
+        del self.store[encode_text(key)]
+
+    def __contains__(self, key):
+        return encode_text(key) in self.store
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def update(self, values):
+        self.store.update({encode_text(k): self.encode_value(v) for k, v in values.items()})
+
+    def encode_value(self, value):
+        return encode_text(value) if type(value) == str else value
+
+    def decode_value(self, value):
+        return decode_text(value) if type(value) == str else value
+
+    def __getattr__(self, name):
+        return getattr(self.store, name)
+
+
+def compact_store(store, config):
+    # Indexes are only compact if configured to be, as the index has to be
+    # built and read the same way; turning it on needs a rebuild
+    if store is not None and config.get("compactEquivalents", False):
+        return CompactIndex(store)
+    return store
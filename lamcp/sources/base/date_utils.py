@@ -7,6 +7,7 @@ from datetime import datetime, timedelta
 from edtf.parser.parser_classes import UncertainOrApproximate as UOA, PartialUncertainOrApproximate as PUOA
 import numpy as np
 import warnings
+from .cache import LruCache
 
 warnings.filterwarnings("ignore", category=UserWarning)
 
@@ -34,6 +35,13 @@ max_life_delta = np.datetime64("2122-01-01") - np.datetime64("2000-01-01")
 non_four_year_date = re.compile("(-?)([0-9]{2,3})(-[0-9][0-9]-[0-9][0-9]([^0-9].*|$))")
 de_bc_abbr = re.compile("(([0-9][0-9]).([0-9][0-9]).)?v([0-9]{2,3})$")
 valid_date_re = re.compile(r"([0-2][0-9]{3})(-[0-1][0-9]-[0-3][0-9]([ T][0-2][0-9]:[0-5][0-9]:[0-5][0-9]Z?$|$))")
+# YYYY, YYYY-MM, YYYY-MM-DD, optionally signed, optionally at midnight
+iso_date_re = re.compile(r"(-?)([0-2][0-9]{3})(?:-([0-1][0-9])(?:-([0-3][0-9])(T00:00:00)?)?)?$")
+month_days = [0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+iso_precisions = ["Y", "M", "D"]
+
+# (value, precision) --> (begin, end), or False if not parsable
+datetime_cache = LruCache(200000)
 
 time_rectype = {
     "Person": ["born", "died", "carried_out", "participated_in"],
@@ -119,7 +127,54 @@ def get_year_from_timespan(event):
     return dt
 
 
-def test_birth_death(person):
+def collect_timespans(nodes, found):
+    # As walk_for_timespan, but only gather (timespan, prop, value)
+    # so that the values can be normalized in one batch
+    if type(nodes) != list:
+        nodes = [nodes]
+    for node in nodes:
+        if "timespan" in node:
+            ts = node["timespan"]
+            for tsp in timestamp_props:
+                if tsp in ts:
+                    found.append((ts, tsp, ts[tsp]))
+        if "part" in node:
+            collect_timespans(node["part"], found)
+        if node["type"] in time_rectype:
+            for p in time_rectype[node["type"]]:
+                if p in node:
+                    collect_timespans(node[p], found)
+
+
+def validate_timespans_many(recs):
+    # validate_timespans for a batch of records, e.g. from a dump
+    found = []
+    for rec in recs:
+        if not rec["type"] in time_rectype:
+            logger.debug(f"Couldn't find timespan paths for {rec['type']} in utils.date_utils")
+        else:
+            for p in time_rectype[rec["type"]]:
+                if p in rec:
+                    collect_timespans(rec[p], found)
+    if not found:
+        return
+
+    values = [dt[:-1] if dt.endswith("Z") else dt for (ts, tsp, dt) in found]
+    ranges = make_datetimes(values)
+    for (ts, tsp, orig), dt, res in zip(found, values, ranges):
+        if not res:
+            if not dt.startswith("9999"):
+                logger.warning(f"Failed to make a date from {dt} ; stripping")
+            del ts[tsp]
+        elif tsp.startswith("begin"):
+            if dt != res[0]:
+                ts[tsp] = res[0]
+        elif dt != res[1]:
+            ts[tsp] = res[1]
+
+
+def get_birth_death(person):
+    # (begin of birth, end of death) or None if either is missing
     if type(person) == dict:
         # JSON serialization
         if "born" in person and "timespan" in person["born"]:
@@ -127,19 +182,17 @@ def test_birth_death(person):
             if "begin_of_the_begin" in bts:
                 b = bts["begin_of_the_begin"]
             else:
-                return True
+                return None
         else:
-            return True
+            return None
         if "died" in person and "timespan" in person["died"]:
             dts = person["died"]["timespan"]
             if "end_of_the_end" in dts:
                 d = dts["end_of_the_end"]
             else:
-                return True
+                return None
         else:
-            return True
-        # if delta birth, death > 122 years, then fail
-        # use np to deal with BC dates
+            return None
     else:
         # it's a crom instance being built by a mapper
         if (
@@ -149,7 +202,7 @@ def test_birth_death(person):
         ):
             b = person.born.timespan.begin_of_the_begin
         else:
-            return True
+            return None
         if (
             hasattr(person, "died")
             and hasattr(person.died, "timespan")
@@ -157,8 +210,18 @@ def test_birth_death(person):
         ):
             d = person.died.timespan.end_of_the_end
         else:
-            return True
+            return None
+    return (b, d)
 
+
+def test_birth_death(person):
+    bd = get_birth_death(person)
+    if bd is None:
+        return True
+    (b, d) = bd
+
+    # if delta birth, death > 122 years, then fail
+    # use np to deal with BC dates
     # This can generate a UserWarning
     try:
         start = np.datetime64(b)
@@ -175,6 +238,42 @@ def test_birth_death(person):
         return True
 
 
+def to_datetime_array(values):
+    # Parse all at once if possible, otherwise item by item with NaT for failures
+    try:
+        return np.array(values, dtype="M8[s]")
+    except:
+        pass
+    arr = np.empty(len(values), dtype="M8[s]")
+    for i, value in enumerate(values):
+        try:
+            arr[i] = np.datetime64(value)
+        except:
+            arr[i] = np.datetime64("NaT")
+    return arr
+
+
+def test_birth_death_many(persons):
+    # test_birth_death for a batch of people, returns a list of booleans
+    results = np.ones(len(persons), dtype=bool)
+    idx = []
+    births = []
+    deaths = []
+    for i, person in enumerate(persons):
+        bd = get_birth_death(person)
+        if bd is not None:
+            idx.append(i)
+            births.append(bd[0])
+            deaths.append(bd[1])
+    if idx:
+        start = to_datetime_array(births)
+        end = to_datetime_array(deaths)
+        # Comparisons with NaT are False, so unparsable dates pass as before
+        bad = (end - start > max_life_delta) | (end < start)
+        results[idx] = ~bad
+    return results.tolist()
+
+
 def convert_hebrew_date(dt):
     if HebrewDate is not None and int(dt[:4]) > 4500:
         # most likely hebrew calendar ; 4500 = 740 CE
@@ -216,10 +315,147 @@ def process_np_datetime(dt, value):
     return (start, end)
 
 
+def iso_precision(m, precision=""):
+    # The precision of a value matched by iso_date_re, or None if the
+    # requested precision doesn't fit the shape of the value
+    (sign, year, month, day, midnight) = m.groups()
+    if year == "0000":
+        return None
+    if midnight:
+        prec = "s"
+    elif day:
+        prec = "D"
+    elif month:
+        prec = "M"
+    else:
+        prec = "Y"
+    if precision and precision != prec:
+        if not midnight or precision != "D":
+            return None
+        prec = "D"
+    return prec
+
+
+def fast_iso_datetime(value, precision=""):
+    # Well formed ISO dates don't need any of the parsers below
+    # Returns None if the value isn't one, to fall through to parse_datetime
+    m = iso_date_re.match(value)
+    if not m:
+        return None
+    prec = iso_precision(m, precision)
+    if prec is None:
+        return None
+    (sign, year, month, day, midnight) = m.groups()
+    yy = int(year)
+    if sign:
+        yy = -yy
+    mm = int(month) if month else 1
+    if not 1 <= mm <= 12:
+        return None
+    dim = month_days[mm]
+    if mm == 2 and yy % 4 == 0 and (yy % 100 != 0 or yy % 400 == 0):
+        dim = 29
+    if day:
+        dd = int(day)
+        if not 1 <= dd <= dim:
+            return None
+
+    year = sign + year
+    if prec == "Y":
+        return (f"{year}-01-01T00:00:00", f"{year}-12-31T23:59:59")
+    elif prec == "M":
+        return (f"{year}-{month}-01T00:00:00", f"{year}-{month}-{dim}T23:59:59")
+    elif prec == "D":
+        return (f"{year}-{month}-{day}T00:00:00", f"{year}-{month}-{day}T23:59:59")
+    else:
+        start = f"{year}-{month}-{day}T00:00:00"
+        return (start, start)
+
+
 def make_datetime(value, precision=""):
     # given a date / datetime string
     # and maybe a precision from wikidata
     # return (begin, end) range
+    if not value:
+        return None
+    res = fast_iso_datetime(value, precision)
+    if res is not None:
+        return res
+    key = (value, precision)
+    res = datetime_cache.get(key)
+    if res is None:
+        res = parse_datetime(value, precision)
+        datetime_cache.set(key, res if res is not None else False)
+        return res
+    return res if res else None
+
+
+def make_datetimes(values, precisions=None):
+    # Batch version of make_datetime, returning a list of (begin, end) or None
+    # ISO values are grouped by precision and each group converted with a single
+    # numpy operation; only the residue goes through make_datetime one by one
+    if precisions is None:
+        precisions = [""] * len(values)
+    results = [None] * len(values)
+    groups = {}
+    residue = []
+    for i, (value, precision) in enumerate(zip(values, precisions)):
+        m = iso_date_re.match(value) if value else None
+        prec = iso_precision(m, precision) if m else None
+        if prec is None:
+            residue.append(i)
+            continue
+        if prec == "D" and m.group(5):
+            value = value[:-9]
+        if not prec in groups:
+            groups[prec] = ([], [])
+        groups[prec][0].append(i)
+        groups[prec][1].append(value)
+
+    for prec, (idx, vals) in groups.items():
+        try:
+            # Parsing the whole group validates every month and day at once
+            dts = np.array(vals, dtype=f"M8[{prec}]")
+        except:
+            # At least one bad day or month in the group, so split those out
+            good = []
+            for i, value in zip(idx, vals):
+                try:
+                    np.datetime64(value, prec)
+                    good.append((i, value))
+                except:
+                    residue.append(i)
+            if not good:
+                continue
+            idx = [x[0] for x in good]
+            vals = [x[1] for x in good]
+            dts = np.array(vals, dtype=f"M8[{prec}]")
+        # Values are already zero padded ISO, so only the length of the month
+        # needs computing, rather than formatting every timestamp
+        if prec == "Y":
+            for i, value in zip(idx, vals):
+                results[i] = (f"{value}-01-01T00:00:00", f"{value}-12-31T23:59:59")
+        elif prec == "M":
+            dim = ((dts + 1).astype("M8[D]") - dts.astype("M8[D]")).astype(int).tolist()
+            for i, value, days in zip(idx, vals, dim):
+                results[i] = (f"{value}-01T00:00:00", f"{value}-{days}T23:59:59")
+        elif prec == "D":
+            for i, value in zip(idx, vals):
+                results[i] = (f"{value}T00:00:00", f"{value}T23:59:59")
+        else:
+            for i, value in zip(idx, vals):
+                results[i] = (value, value)
+
+    for i in residue:
+        try:
+            results[i] = make_datetime(values[i], precisions[i])
+        except:
+            results[i] = None
+    return results
+
+
+def parse_datetime(value, precision=""):
+    # The slow path for make_datetime
 
     initialValue = value
     # allow 0000-01-01
@@ -321,6 +557,7 @@ def make_datetime(value, precision=""):
 
     # First try dateutil's parser
     end = None
+    prec_dt = None
     try:
         begin = parser.parse(value, default=default_dt)
     except:
@@ -404,6 +641,7 @@ def make_datetime(value, precision=""):
                 dt3 = dp_parser.get_date_data(value)
                 if dt3.period == "day" and dt3.locale != "en":
                     begin = dt3.date_obj
+                    prec_dt = dt3
                     end = begin + timedelta(days=1)
                 elif dt3:
                     logger.debug(f"dateparser found: {dt3} from {value} ?")
@@ -417,7 +655,8 @@ def make_datetime(value, precision=""):
 
     if not precision:
         # Now we will have begin
-        prec_dt = dp_parser.get_date_data(value)
+        if prec_dt is None:
+            prec_dt = dp_parser.get_date_data(value)
         if prec_dt.date_obj:
             prec = prec_dt.period[0].upper()
             if prec == "D":
@@ -0,0 +1,375 @@
+import os
+import sys
+import zlib
+import gzip
+import heapq
+import shutil
+import argparse
+import subprocess
+import multiprocessing
+from collections import deque
+import ujson as json
+import logging
+
+logger = logging.getLogger("lamcp")
+
+# Helpers for loaders that stream very large, usually gzipped, dump files:
+# decompress once, hand the lines out in chunks to a pool of processes,
+# and get the results back in order with a bounded number of chunks in flight
+#
+# Dumps can also be indexed (python -m lamcp.sources.base.dump <dumps dir>):
+# a gzip file made of independent members that each end at the end of a line
+# can be read from any member, so the index of (offset, length, first line)
+# per block lets loaders jump to their slice, or resume, without decompressing
+# everything before it. Dumps that are a single member are rechunked into
+# such a file (still a valid gzip file) next to the original
+
+block_level = 6
+default_block_bytes = 1 << 24
+
+
+class DumpPipe(object):
+    # File-like wrapper around a decompressing subprocess
+    def __init__(self, proc):
+        self.proc = proc
+        self.fh = proc.stdout
+
+    def readline(self):
+        return self.fh.readline()
+
+    def readlines(self, hint=-1):
+        return self.fh.readlines(hint)
+
+    def __iter__(self):
+        return iter(self.fh)
+
+    def close(self):
+        self.fh.close()
+        if self.proc.poll() is None:
+            self.proc.terminate()
+        self.proc.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def open_dump(path):
+    # Binary reader over the decompressed dump
+    # pigz, if installed, decompresses in its own process (and faster than zlib)
+    # which leaves this one free to feed the workers
+    if path.endswith(".gz"):
+        pigz = shutil.which("pigz")
+        if pigz:
+            proc = subprocess.Popen([pigz, "-dc", path], stdout=subprocess.PIPE, bufsize=1 << 20)
+            return DumpPipe(proc)
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+def iter_chunks(fh, chunk_bytes=1 << 23, slicen=None, max_slice=None):
+    # Yield lists of lines of about chunk_bytes each
+    # If max_slice is given, only lines where line number % max_slice == slicen
+    x = 0
+    while True:
+        lines = fh.readlines(chunk_bytes)
+        if not lines:
+            break
+        n = len(lines)
+        if max_slice is not None:
+            lines = [l for i, l in enumerate(lines, x) if i % max_slice == slicen]
+        x += n
+        if lines:
+            yield lines
+
+
+def run_parallel(fn, chunks, processes=None, max_pending=None, initializer=None, initargs=()):
+    # Yield fn(chunk) for each chunk, in order, computed in a pool of processes.
+    # fn must be a module level function; worker state is set up by initializer.
+    # Workers are forked, so initargs don't need to be picklable
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if processes <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        for chunk in chunks:
+            yield fn(chunk)
+        return
+
+    if max_pending is None:
+        max_pending = processes * 2
+    ctx = multiprocessing.get_context("fork")
+    with ctx.Pool(processes, initializer, initargs) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.apply_async(fn, (chunk,)))
+            if len(pending) >= max_pending:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+
+def sort_runs(paths, temp_dir, max_bytes=1 << 28, prefix="sort"):
+    # Sort the lines of the files into runs of about max_bytes of memory each,
+    # written to temp_dir; returns the paths of the runs
+    runs = []
+    lines = []
+    size = 0
+
+    def flush():
+        lines.sort()
+        path = os.path.join(temp_dir, f"{prefix}_{len(runs)}.run")
+        with open(path, "wb") as out:
+            out.writelines(lines)
+        runs.append(path)
+        lines.clear()
+
+    for path in paths:
+        with open(path, "rb") as fh:
+            for l in fh:
+                if not l.endswith(b"\n"):
+                    l += b"\n"
+                lines.append(l)
+                # rough size of a short bytes object in a list
+                size += len(l) + 50
+                if size >= max_bytes:
+                    flush()
+                    size = 0
+    if lines:
+        flush()
+    return runs
+
+
+def merge_runs(runs):
+    # Yield the lines of the sorted runs in order, without duplicates
+    fhs = [open(r, "rb") for r in runs]
+    try:
+        last = None
+        for l in heapq.merge(*fhs):
+            if l != last:
+                yield l
+                last = l
+    finally:
+        for fh in fhs:
+            fh.close()
+
+
+def reduce_runs(runs, temp_dir, prefix="sort", max_merge=256, merge=None):
+    # Keep the number of open files down with passes of partial merges if needed.
+    # Neighbouring runs are merged, so the runs stay in the same order; merge
+    # takes a list of runs and yields the lines to write, merge_runs by default
+    if merge is None:
+        merge = merge_runs
+    level = 0
+    while len(runs) > max_merge:
+        merged = []
+        for i in range(0, len(runs), max_merge):
+            group = runs[i : i + max_merge]
+            if len(group) == 1:
+                merged.append(group[0])
+                continue
+            path = os.path.join(temp_dir, f"{prefix}_{level}_{len(merged)}_merged.run")
+            with open(path, "wb") as out:
+                out.writelines(merge(group))
+            for r in group:
+                os.remove(r)
+            merged.append(path)
+        runs = merged
+        level += 1
+    return runs
+
+
+def external_sort(paths, temp_dir, max_bytes=1 << 28, prefix="sort", max_merge=256):
+    # Yield the distinct lines of all the files in (byte) order, holding only
+    # about max_bytes of them in memory at once
+    runs = reduce_runs(sort_runs(paths, temp_dir, max_bytes, prefix), temp_dir, prefix, max_merge)
+    try:
+        yield from merge_runs(runs)
+    finally:
+        for r in runs:
+            os.remove(r)
+
+
+def index_path(path):
+    return path + ".idx"
+
+
+class DumpIndex(object):
+    def __init__(self, path, blocks):
+        # path of the blocked gzip; blocks are [offset, length, first line]
+        self.path = path
+        self.blocks = blocks
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def save(self, idx_path, source=None):
+        # source is the dump the index is for, if the blocks are in a rechunked
+        # copy of it; a change to either makes the index out of date
+        st = os.stat(self.path)
+        info = {"path": self.path, "size": st.st_size, "mtime": st.st_mtime, "blocks": self.blocks}
+        if source is not None and source != self.path:
+            sst = os.stat(source)
+            info["source"] = {"path": source, "size": sst.st_size, "mtime": sst.st_mtime}
+        with open(idx_path + ".tmp", "w") as fh:
+            json.dump(info, fh)
+        os.replace(idx_path + ".tmp", idx_path)
+
+    def slice_range(self, slicen=None, max_slice=None):
+        # Contiguous run of blocks [first, last) for the slice
+        if max_slice is None:
+            return (0, len(self.blocks))
+        n = len(self.blocks)
+        return (n * slicen // max_slice, n * (slicen + 1) // max_slice)
+
+    def read_block(self, n):
+        (offset, length, line) = self.blocks[n]
+        with open(self.path, "rb") as fh:
+            fh.seek(offset)
+            data = fh.read(length)
+        # May be several gzip members
+        return gzip.decompress(data)
+
+
+def load_index(path):
+    # The index for the dump at path, or None if there isn't a current one
+    idx_path = index_path(path)
+    if not os.path.exists(idx_path):
+        return None
+    try:
+        with open(idx_path) as fh:
+            info = json.load(fh)
+        files = [info]
+        if info["path"] != path:
+            # Blocks are in a rechunked copy, so the dump itself must not have changed either
+            if info.get("source", {}).get("path", None) != path:
+                logger.warning(f"Dump index {idx_path} doesn't record the state of {path}; ignoring")
+                return None
+            files.append(info["source"])
+        for f in files:
+            st = os.stat(f.get("path", info["path"]))
+            if st.st_size != f["size"] or st.st_mtime != f["mtime"]:
+                logger.warning(f"Dump index {idx_path} is out of date; ignoring")
+                return None
+    except Exception as e:
+        logger.warning(f"Could not read dump index {idx_path}: {e}")
+        return None
+    return DumpIndex(info["path"], info["blocks"])
+
+
+def index_members(path, block_bytes=default_block_bytes):
+    # Index an existing multi-member gzip. Members are grouped into blocks of
+    # at least block_bytes uncompressed, and only split where a member ends a line.
+    # A plain single-member gzip can't be indexed, so stop as soon as that's clear
+    # (first member runs to EOF, or is far bigger than a block) rather than
+    # decompressing all of it here and again in rechunk_dump
+    single_limit = block_bytes * 8
+    first = True
+    blocks = []
+    start = 0
+    pos = 0
+    line = 0
+    lines = 0
+    size = 0
+    last = b"\n"
+    d = zlib.decompressobj(31)
+    with open(path, "rb") as fh:
+        while True:
+            buf = fh.read(1 << 20)
+            if not buf:
+                break
+            while buf:
+                out = d.decompress(buf)
+                if out:
+                    lines += out.count(b"\n")
+                    size += len(out)
+                    last = out[-1:]
+                if not d.eof:
+                    pos += len(buf)
+                    if first and size > single_limit:
+                        return DumpIndex(path, [[0, os.path.getsize(path), 0]])
+                    break
+                used = len(buf) - len(d.unused_data)
+                pos += used
+                buf = d.unused_data
+                d = zlib.decompressobj(31)
+                if first:
+                    first = False
+                    if not buf and not fh.peek(1):
+                        return DumpIndex(path, [[0, pos, 0]])
+                if last == b"\n" and size >= block_bytes:
+                    blocks.append([start, pos - start, line])
+                    line += lines
+                    start = pos
+                    lines = 0
+                    size = 0
+    if pos > start:
+        blocks.append([start, pos - start, line])
+    return DumpIndex(path, blocks)
+
+
+def compress_block(lines):
+    data = b"".join(lines)
+    return (gzip.compress(data, block_level, mtime=0), len(lines))
+
+
+def rechunk_dump(in_path, out_path, block_bytes=default_block_bytes, processes=None):
+    # Recompress into independent gzip members of about block_bytes each,
+    # in parallel, and return the index
+    blocks = []
+    offset = 0
+    line = 0
+    with open_dump(in_path) as fh, open(out_path + ".tmp", "wb") as out:
+        for data, n in run_parallel(compress_block, iter_chunks(fh, block_bytes), processes):
+            out.write(data)
+            blocks.append([offset, len(data), line])
+            offset += len(data)
+            line += n
+    os.replace(out_path + ".tmp", out_path)
+    return DumpIndex(out_path, blocks)
+
+
+def build_index(path, block_bytes=default_block_bytes, processes=None, replace=False):
+    if path.endswith(".gz"):
+        index = index_members(path, block_bytes)
+    else:
+        index = DumpIndex(path, [])
+    if len(index) < 2:
+        # A single member can only be read from the start
+        if replace:
+            out_path = path if path.endswith(".gz") else path + ".gz"
+        else:
+            out_path = path[:-3] + ".blocks.gz" if path.endswith(".gz") else path + ".blocks.gz"
+        logger.info(f"Rechunking {path} --> {out_path}")
+        index = rechunk_dump(path, out_path, block_bytes, processes)
+        if out_path != path:
+            index.save(index_path(out_path))
+    index.save(index_path(path), source=path)
+    return index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build block indexes for dump files so loaders can seek and resume")
+    parser.add_argument("paths", nargs="+", help="Dump files, or directories of them")
+    parser.add_argument("--block-mb", type=int, default=16, help="Uncompressed size of each block")
+    parser.add_argument("--processes", type=int, default=None, help="Processes for recompressing")
+    parser.add_argument("--replace", action="store_true", help="Replace single member dumps rather than writing .blocks.gz")
+    args = parser.parse_args()
+
+    paths = []
+    for p in args.paths:
+        if os.path.isdir(p):
+            paths.extend(
+                [os.path.join(p, x) for x in sorted(os.listdir(p)) if x.endswith(".gz") and not x.endswith(".blocks.gz")]
+            )
+        else:
+            paths.append(p)
+    for p in paths:
+        if load_index(p) is not None:
+            print(f"{p} already indexed")
+            continue
+        index = build_index(p, args.block_mb << 20, args.processes, args.replace)
+        print(f"{p}: {len(index)} blocks")
+    sys.exit(0)
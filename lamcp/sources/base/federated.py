@@ -0,0 +1,93 @@
+import time
+import asyncio
+import logging
+
+logger = logging.getLogger("lamcp")
+
+
+class FederatedSearch(object):
+    # Query the searchers of several datasets at once, and expand each source's
+    # hits into records as soon as that source answers.
+    # Every source has its own deadline (search_deadline in its config), after
+    # which its unfinished work is abandoned rather than holding up the others
+
+    def __init__(self, configs, expand, max_hits=20, deadline=10):
+        self.configs = configs
+        # async fn(dataset, uri, entity_type) --> record or None
+        self.expand = expand
+        self.max_hits = max_hits
+        self.default_deadline = deadline
+
+    def get_deadline(self, searcher):
+        config = getattr(searcher, "config", None) or {}
+        return config.get("search_deadline", self.default_deadline)
+
+    async def search_source(self, dataset, searcher, query, lang, entity_type, queue):
+        # Put (dataset, rank, record) on the queue for each hit, then (dataset, None, None)
+        pending = set()
+        try:
+            # Inside the try, so the end marker is queued whatever goes wrong
+            deadline = time.monotonic() + self.get_deadline(searcher)
+            try:
+                res = await asyncio.wait_for(
+                    searcher.asearch(query, lang, entity_type), deadline - time.monotonic()
+                )
+            except asyncio.TimeoutError:
+                logger.warning(f"Search in {dataset} timed out")
+                return
+            except Exception as e:
+                logger.error(f"Search in {dataset} failed: {e}")
+                return
+
+            ranks = {}
+            for rank, uri in enumerate(res["results"][: self.max_hits]):
+                task = asyncio.ensure_future(self.expand(dataset, uri, entity_type))
+                ranks[task] = rank
+                pending.add(task)
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logger.warning(f"Search in {dataset} ran out of time with {len(pending)} hits left")
+                    break
+                done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    try:
+                        rec = task.result()
+                    except Exception as e:
+                        logger.error(f"Failed to expand hit from {dataset}: {e}")
+                        rec = None
+                    if rec is not None:
+                        queue.put_nowait((dataset, ranks[task], rec))
+        finally:
+            for task in pending:
+                task.cancel()
+            queue.put_nowait((dataset, None, None))
+
+    async def stream(self, datasets, query, lang="", entity_type=""):
+        """Yield (dataset, rank, record) as each hit is expanded, from all datasets at once"""
+        queue = asyncio.Queue()
+        tasks = []
+        for ds in datasets:
+            searcher = self.configs.get(ds, {}).get("searcher", None)
+            if searcher is not None:
+                tasks.append(
+                    asyncio.ensure_future(self.search_source(ds, searcher, query, lang, entity_type, queue))
+                )
+        try:
+            running = len(tasks)
+            while running:
+                (ds, rank, rec) = await queue.get()
+                if rec is None:
+                    running -= 1
+                else:
+                    yield (ds, rank, rec)
+        finally:
+            # Client went away, or we finished
+            for task in tasks:
+                task.cancel()
+
+    async def search(self, datasets, query, lang="", entity_type=""):
+        """Collect all of the hits, in dataset order and then rank order within the dataset"""
+        hits = [x async for x in self.stream(datasets, query, lang, entity_type)]
+        hits.sort(key=lambda x: (datasets.index(x[0]), x[1]))
+        return [x[2] for x in hits]
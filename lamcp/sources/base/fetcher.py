@@ -1,23 +1,50 @@
-import requests
+import asyncio
 import ujson as json
 import logging
+from .network import NetworkMap, circuit_breaker, get_host, connection_pools, pool_config, accept_encoding, h2
+from .network import get_rate_limiter
+
+try:
+    import httpx
+except:
+    httpx = None
 
 logger = logging.getLogger("lamcp")
 
+# One async client (and thus connection pool) per event loop, shared by all fetchers
+async_clients = {}
+
+
+def get_async_client():
+    loop = asyncio.get_running_loop()
+    if loop not in async_clients:
+        limits = httpx.Limits(
+            max_connections=pool_config["max_connections"],
+            max_keepalive_connections=pool_config["max_keepalive"],
+            keepalive_expiry=pool_config["keepalive_expiry"],
+        )
+        # HTTP/2 is negotiated per host, so hosts without it stay on 1.1
+        http2 = pool_config["http2"] and h2 is not None
+        async_clients[loop] = httpx.AsyncClient(limits=limits, http2=http2)
+    return async_clients[loop]
+
 
 class Fetcher(object):
     def __init__(self, config):
         self.name = config["name"]
         self.fetch_uri = config["fetch"]
-        self.headers = config.get("fetch_headers", {"Accept-Encoding": "gzip,deflate", "User-Agent": "Mozilla/5.0"})
+        self.headers = config.get("fetch_headers", {"Accept-Encoding": accept_encoding, "User-Agent": "Mozilla/5.0"})
         self.allow_redirects = True
-        self.networkmap = {}
+        self.networkmap = NetworkMap(config.get("networkmap_size", 100000), config.get("networkmap_ttls", None))
         self.timeout = 5
         self.refetch = False
         self.enabled = True
-        self.use_networkmap = False
-        self.session = requests.Session()
-        self.session.headers.update(self.headers)
+        # Remember failed URLs and skip them until they expire; opt in per source
+        self.use_networkmap = config.get("use_networkmap", False)
+        # Own headers, but connections are shared with every other session to the host
+        connection_pools.configure_host(get_host(self.fetch_uri), config.get("pool_size", 0))
+        self.session = connection_pools.make_session(self.headers)
+        self.limiter = get_rate_limiter(self.name, config)
 
     def post_process(self, data, identifier):
         return data
@@ -45,13 +72,78 @@ class Fetcher(object):
             logger.error(f"Invalid identifier for {self.name}: {identifier}")
             return None
 
+        known = self.check_networkmap(url, identifier)
+        if type(known) == str:
+            return self.fetch(known)
+        elif known is not None:
+            return None
+
         try:
-            resp = self.session.get(url, allow_redirects=self.allow_redirects, timeout=self.timeout)
+            with self.limiter.limit():
+                resp = self.session.get(url, allow_redirects=self.allow_redirects, timeout=self.timeout)
         except:
             # Failed to open network, resolve DNS, or similar
             logger.error(f"Failed to get response from {url}")
-            self.networkmap[url] = 0
+            self.record_failure(url, 0)
+            return None
+        return self.process_response(resp, url, identifier)
+
+    async def afetch(self, identifier):
+        # Non-blocking version of fetch for use within an event loop
+        if httpx is None or type(self).fetch is not Fetcher.fetch:
+            # Subclasses with their own fetch logic are still synchronous
+            return await asyncio.to_thread(self.fetch, identifier)
+
+        if not self.enabled:
+            logger.error(f"Called fetch for {self.name}:{identifier} but network is disabled")
             return None
+
+        url = self.make_fetch_uri(identifier)
+        if not url:
+            logger.error(f"Invalid identifier for {self.name}: {identifier}")
+            return None
+
+        known = self.check_networkmap(url, identifier)
+        if type(known) == str:
+            return await self.afetch(known)
+        elif known is not None:
+            return None
+
+        try:
+            async with self.limiter.alimit():
+                resp = await get_async_client().get(
+                    url, headers=self.headers, follow_redirects=self.allow_redirects, timeout=self.timeout
+                )
+        except:
+            # Failed to open network, resolve DNS, or similar
+            logger.error(f"Failed to get response from {url}")
+            self.record_failure(url, 0)
+            return None
+        return self.process_response(resp, url, identifier)
+
+    def check_networkmap(self, url, identifier):
+        # Returns None if the fetch should go ahead, a new identifier if the URL
+        # is known to redirect, or otherwise the reason to not even try
+        if self.use_networkmap:
+            known = self.networkmap.get(url, None)
+            if known is not None:
+                if type(known) == str and known != identifier:
+                    return known
+                logger.debug(f"Not fetching {url}; recently failed with {known}")
+                return -1
+        host = get_host(url)
+        if not circuit_breaker.allow(host):
+            logger.debug(f"Not fetching {url}; circuit open for {host}")
+            return -1
+        return None
+
+    def record_failure(self, url, status):
+        self.networkmap[url] = status
+        if status == 0 or status == 429 or status >= 500:
+            circuit_breaker.record_failure(get_host(url))
+
+    def process_response(self, resp, url, identifier):
+        # resp is either a requests or an httpx response
         if resp.status_code == 200:
             # Got a response
             ct = resp.headers.get("content-type", "")
@@ -64,11 +156,14 @@ class Fetcher(object):
             else:
                 # Might still be json
                 data = {"value": resp.text, "ct": ct}
+            circuit_breaker.record_success(get_host(url))
             data = self.post_process(data, identifier)
+            if data is None:
+                return None
         else:
             # URL returned fail status
             logger.error(f"Got failure {resp.status_code} from {url}")
-            self.networkmap[url] = resp.status_code
+            self.record_failure(url, resp.status_code)
             return None
 
         # return a real record structure
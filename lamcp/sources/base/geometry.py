@@ -0,0 +1,345 @@
+import heapq
+import numpy as np
+from .cache import LruCache
+
+import logging
+
+logger = logging.getLogger("lamcp")
+
+# GeoJSON --> WKT for the mappers that have place geometries (WoF, Pleiades)
+# Coordinates are handled as numpy arrays, each ring or line is simplified so
+# that the whole geometry fits in one vertex budget, and then rounded.
+# Islands, archipelagos and polygons with holes come out as real
+# MULTIPOLYGONs and interior rings, not bounding boxes.
+
+# The recursive ramerdouglas hit the recursion limit (and divided by zero on closed rings)
+
+
+def ramerdouglas(line, dist):
+    # Ramer-Douglas-Peucker with a stack of segments rather than recursion,
+    # and the distances for each segment computed at once
+    if len(line) < 3:
+        return line
+    pts = np.asarray(line, dtype=float)
+    keep = np.zeros(len(pts), dtype=bool)
+    keep[0] = keep[-1] = True
+    distsq = dist**2
+    stack = [(0, len(pts) - 1)]
+    while stack:
+        (i, j) = stack.pop()
+        if j - i < 2:
+            continue
+        rel = pts[i + 1 : j] - pts[i]
+        seg = pts[j] - pts[i]
+        seglen = seg @ seg
+        if seglen:
+            # perpendicular distance to the line through the ends
+            cross = rel[:, 0] * seg[1] - rel[:, 1] * seg[0]
+            dsq = cross * cross / seglen
+        else:
+            dsq = (rel * rel).sum(axis=1)
+        k = int(dsq.argmax())
+        if dsq[k] >= distsq:
+            k += i + 1
+            keep[k] = True
+            stack.append((i, k))
+            stack.append((k, j))
+    return pts[keep].tolist()
+
+
+def triangle_area(pts, a, b, c):
+    (ax, ay) = pts[a]
+    (bx, by) = pts[b]
+    (cx, cy) = pts[c]
+    return abs(ax * (by - cy) + bx * (cy - ay) + cx * (ay - by)) / 2
+
+
+def visvalingam(line, target):
+    # Visvalingam-Whyatt down to target points: repeatedly drop the point that
+    # makes the smallest triangle with its neighbours. The ends are kept
+    n = len(line)
+    if n <= max(target, 4):
+        return line
+    # A closed ring needs at least a triangle plus the closing point
+    target = max(target, 4)
+    arr = np.asarray(line, dtype=float)
+    x = arr[:, 0]
+    y = arr[:, 1]
+    # Initial areas for every interior point at once
+    areas = np.zeros(n)
+    areas[1:-1] = np.abs(x[:-2] * (y[1:-1] - y[2:]) + x[1:-1] * (y[2:] - y[:-2]) + x[2:] * (y[:-2] - y[1:-1])) / 2
+    pts = arr.tolist()
+    areas = areas.tolist()
+    prev = list(range(-1, n - 1))
+    nxt = list(range(1, n + 1))
+    removed = [False] * n
+    heap = [(areas[i], i) for i in range(1, n - 1)]
+    heapq.heapify(heap)
+    left = n
+    while left > target and heap:
+        (area, i) = heapq.heappop(heap)
+        if removed[i] or area != areas[i]:
+            # stale entry
+            continue
+        removed[i] = True
+        left -= 1
+        (p, q) = (prev[i], nxt[i])
+        nxt[p] = q
+        prev[q] = p
+        for k in (p, q):
+            if 0 < k < n - 1:
+                # Never less than the area just removed, so the order holds
+                areas[k] = max(triangle_area(pts, prev[k], k, nxt[k]), area)
+                heapq.heappush(heap, (areas[k], k))
+    return [pts[i] for i in range(n) if not removed[i]]
+
+
+def ring_area(arr):
+    # Shoelace, unsigned
+    x = arr[:, 0]
+    y = arr[:, 1]
+    return abs(float(np.dot(x[:-1], y[1:]) - np.dot(x[1:], y[:-1]))) / 2
+
+
+def drop_repeats(arr):
+    # Consecutive duplicate points, eg after rounding
+    if len(arr) < 2:
+        return arr
+    keep = np.ones(len(arr), dtype=bool)
+    keep[1:] = (arr[1:] != arr[:-1]).any(axis=1)
+    return arr[keep]
+
+
+def as_array(coords):
+    try:
+        arr = np.asarray(coords, dtype=float)
+    except:
+        return None
+    if arr.ndim != 2 or arr.shape[0] == 0 or arr.shape[1] < 2:
+        return None
+    return arr[:, :2]
+
+
+def as_ring(coords):
+    arr = as_array(coords)
+    if arr is None:
+        return None
+    if (arr[0] != arr[-1]).any():
+        arr = np.vstack([arr, arr[:1]])
+    if len(arr) < 4:
+        return None
+    return arr
+
+
+class GeometryWriter(object):
+    def __init__(self, config):
+        # Vertices for the whole geometry, across all of its rings and lines
+        self.max_points = config.get("polygon_points", 350)
+        # Decimal places; 5 is about a metre
+        self.precision = config.get("geometry_precision", 5)
+        self.tolerance = 0.5 * 10 ** -self.precision
+        self.cache = LruCache(config.get("geometry_cache_size", 10000))
+
+    def to_wkt(self, geom, identifier=None, min_area=0):
+        # WKT for a GeoJSON geometry, or None if it has nothing usable
+        # Polygonal geometries with less than min_area (in square degrees)
+        # are also None, so the caller can fall back to a point
+        if not geom:
+            return None
+        key = (identifier, min_area)
+        if identifier:
+            wkt = self.cache.get(key)
+            if wkt is not None:
+                return wkt or None
+        try:
+            wkt = self.convert(geom, min_area)
+        except Exception as e:
+            logger.warning(f"Failed to convert geometry for {identifier}: {e}")
+            wkt = None
+        if identifier:
+            # Remember failures too, as ""
+            self.cache.set(key, wkt or "")
+        return wkt
+
+    def convert(self, geom, min_area=0):
+        shape = self.read(geom)
+        if shape is None:
+            return None
+        if min_area and self.polygons(shape) and self.area(shape) < min_area:
+            return None
+        shape = self.simplify(shape)
+        if shape is None:
+            return None
+        return self.format(shape)
+
+    def read(self, geom):
+        # GeoJSON to (type, parts) with numpy arrays for the coordinates
+        # Polygons are lists of rings, the first being the exterior
+        t = geom.get("type")
+        if t == "GeometryCollection":
+            parts = [self.read(g) for g in geom.get("geometries", [])]
+            parts = [p for p in parts if p is not None]
+            return (t, parts) if parts else None
+        coords = geom.get("coordinates")
+        if not coords:
+            return None
+        if t == "Point":
+            arr = as_array([coords])
+            return (t, arr) if arr is not None else None
+        elif t in ["MultiPoint", "LineString"]:
+            arr = as_array(coords)
+            if arr is None or (t == "LineString" and len(arr) < 2):
+                return None
+            return (t, arr)
+        elif t == "MultiLineString":
+            lines = [as_array(l) for l in coords]
+            lines = [l for l in lines if l is not None and len(l) > 1]
+            return (t, lines) if lines else None
+        elif t in ["Polygon", "MultiPolygon"]:
+            polys = [coords] if t == "Polygon" else coords
+            out = []
+            for poly in polys:
+                if not poly:
+                    continue
+                rings = [as_ring(r) for r in poly]
+                if rings[0] is None:
+                    continue
+                out.append([rings[0]] + [r for r in rings[1:] if r is not None])
+            if not out:
+                return None
+            # Many "MultiPolygons" are really just one polygon
+            return ("Polygon", out[0]) if len(out) == 1 else ("MultiPolygon", out)
+        return None
+
+    def polygons(self, shape):
+        (t, parts) = shape
+        if t == "Polygon":
+            return [parts]
+        elif t == "MultiPolygon":
+            return parts
+        elif t == "GeometryCollection":
+            return [p for s in parts for p in self.polygons(s)]
+        return []
+
+    def area(self, shape):
+        # Exterior minus holes, for all the polygons
+        total = 0
+        for rings in self.polygons(shape):
+            total += ring_area(rings[0]) - sum(ring_area(r) for r in rings[1:])
+        return total
+
+    def simplify(self, shape):
+        # Share the budget over every ring and line by its size, after
+        # dropping the smallest polygons and holes if there are too many to
+        # each get a minimal ring.  Then round and drop repeated points
+        budget = self.max_points
+        keep = None
+        polys = self.polygons(shape)
+        if polys:
+            rings = [(ring_area(r), id(r)) for p in polys for r in p]
+            # Half the budget at most goes on the minimal rings
+            if len(rings) * 8 > budget:
+                rings.sort(reverse=True)
+                keep = set(x[1] for x in rings[: max(budget // 8, 1)])
+                if not any(id(p[0]) in keep for p in polys):
+                    # Always keep the largest polygon, even if it's all holes
+                    keep.add(id(max(polys, key=lambda p: ring_area(p[0]))[0]))
+        (total, paths) = self.count(shape, keep)
+        # What's left after every path has its minimum, shared by size
+        spare = max(budget - 4 * paths, 0)
+        return self.reduce(shape, keep, total, spare)
+
+    def count(self, shape, keep):
+        # (vertices, paths) that will be simplified
+        (t, parts) = shape
+        if t == "LineString":
+            return (len(parts), 1)
+        elif t == "MultiLineString":
+            return (sum(len(l) for l in parts), len(parts))
+        elif t == "Polygon":
+            rings = [r for r in parts if keep is None or id(r) in keep]
+            return (sum(len(r) for r in rings), len(rings))
+        elif t in ["MultiPolygon", "GeometryCollection"]:
+            if t == "MultiPolygon":
+                parts = [("Polygon", p) for p in parts]
+            counts = [self.count(s, keep) for s in parts]
+            return (sum(c[0] for c in counts), sum(c[1] for c in counts))
+        return (0, 0)
+
+    def reduce_path(self, arr, total, spare, minimum):
+        target = minimum + int(spare * len(arr) / total)
+        if len(arr) > target:
+            # Points that are within rounding of a straight line add nothing,
+            # so drop them first, which also keeps the heap small
+            pre = ramerdouglas(arr, self.tolerance)
+            if len(pre) >= minimum:
+                arr = np.asarray(pre)
+        if len(arr) > target:
+            arr = np.asarray(visvalingam(arr, target))
+        return drop_repeats(np.round(arr, self.precision))
+
+    def reduce(self, shape, keep, total, spare):
+        (t, parts) = shape
+        if t == "Point":
+            return (t, np.round(parts, self.precision))
+        elif t == "MultiPoint":
+            if len(parts) > self.max_points:
+                parts = parts[:: -(-len(parts) // self.max_points)]
+            return (t, np.round(parts, self.precision))
+        elif t == "LineString":
+            arr = self.reduce_path(parts, total, spare, 2)
+            return (t, arr) if len(arr) > 1 else None
+        elif t == "MultiLineString":
+            lines = [self.reduce_path(l, total, spare, 2) for l in parts]
+            lines = [l for l in lines if len(l) > 1]
+            return (t, lines) if lines else None
+        elif t == "Polygon":
+            rings = []
+            for i, r in enumerate(parts):
+                if keep is not None and not id(r) in keep:
+                    if i == 0:
+                        return None
+                    continue
+                r = self.reduce_path(r, total, spare, 4)
+                if len(r) < 4:
+                    if i == 0:
+                        # Rounded down to nothing
+                        return None
+                    continue
+                rings.append(r)
+            return (t, rings)
+        elif t == "MultiPolygon":
+            polys = [self.reduce(("Polygon", p), keep, total, spare) for p in parts]
+            polys = [p[1] for p in polys if p is not None]
+            if not polys:
+                return None
+            return ("Polygon", polys[0]) if len(polys) == 1 else (t, polys)
+        elif t == "GeometryCollection":
+            shapes = [self.reduce(s, keep, total, spare) for s in parts]
+            shapes = [s for s in shapes if s is not None]
+            return (t, shapes) if shapes else None
+        return None
+
+    def format_path(self, arr):
+        return ", ".join(f"{x} {y}" for x, y in arr.tolist())
+
+    def format_polygon(self, rings):
+        return ", ".join(f"({self.format_path(r)})" for r in rings)
+
+    def format(self, shape):
+        (t, parts) = shape
+        if t == "Point":
+            return f"POINT ({self.format_path(parts)})"
+        elif t == "MultiPoint":
+            return f"MULTIPOINT ({', '.join(f'({x} {y})' for x, y in parts.tolist())})"
+        elif t == "LineString":
+            return f"LINESTRING ({self.format_path(parts)})"
+        elif t == "MultiLineString":
+            return f"MULTILINESTRING ({', '.join(f'({self.format_path(l)})' for l in parts)})"
+        elif t == "Polygon":
+            return f"POLYGON ({self.format_polygon(parts)})"
+        elif t == "MultiPolygon":
+            return f"MULTIPOLYGON ({', '.join(f'({self.format_polygon(p)})' for p in parts)})"
+        elif t == "GeometryCollection":
+            return f"GEOMETRYCOLLECTION ({', '.join(self.format(s) for s in parts)})"
+        return None
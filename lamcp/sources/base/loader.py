@@ -0,0 +1,124 @@
+import io
+import os
+import ujson as json
+import logging
+from .dump import load_index, open_dump, iter_chunks, run_parallel
+
+logger = logging.getLogger("lamcp")
+
+# The loader instance in each worker process, see init_worker
+worker = None
+
+
+def init_worker(loader):
+    global worker
+    worker = loader
+
+
+def process_work(chunk):
+    (n, work) = chunk
+    return (n,) + worker.process_lines(worker.read_lines(work))
+
+
+class DumpLoader(object):
+    # Mixin for loaders that read a dump line by line.
+    # If the dump has been indexed (python -m lamcp.sources.base.dump), each
+    # slice seeks straight to its own run of blocks, and a restarted load carries
+    # on after the last block that was committed. Without an index the whole
+    # dump is streamed and sliced by line number, and resuming only saves the
+    # processing, not the decompression, of the chunks already done
+    #
+    # Expects self.in_path and self.configs (for temp_dir), as Loader sets, and
+    # a process_lines(lines) method that runs in the worker processes and
+    # returns a tuple of results for the (bytes) lines it is given
+
+    dump_index = None
+    load_chunk_bytes = 1 << 23
+    processes = 1
+
+    def get_checkpoint_path(self, slicen=None):
+        name = os.path.basename(self.in_path)
+        return os.path.join(self.configs.temp_dir, f"{name}_{slicen}.checkpoint")
+
+    def read_checkpoint(self, slicen=None):
+        path = self.get_checkpoint_path(slicen)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path) as fh:
+                return json.load(fh)
+        except:
+            logger.warning(f"Could not read checkpoint {path}; starting from the beginning")
+            return None
+
+    def write_checkpoint(self, slicen, block):
+        # Call only once everything before block has been committed
+        path = self.get_checkpoint_path(slicen)
+        info = {
+            "block": block,
+            "index": self.dump_index.path if self.dump_index is not None else None,
+            "chunk_bytes": self.load_chunk_bytes,
+        }
+        with open(path + ".tmp", "w") as fh:
+            json.dump(info, fh)
+        os.replace(path + ".tmp", path)
+
+    def clear_checkpoint(self, slicen=None):
+        path = self.get_checkpoint_path(slicen)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def start_load(self, slicen=None, max_slice=None, resume=True):
+        # Work out which blocks this slice covers and where to start from
+        # Returns True if carrying on from a checkpoint
+        if not callable(getattr(self, "process_lines", None)):
+            raise TypeError(f"{self.__class__.__name__} must define process_lines() to use DumpLoader")
+        self.dump_index = load_index(self.in_path)
+        checkpoint = self.read_checkpoint(slicen) if resume else None
+        if self.dump_index is not None:
+            (first, last) = self.dump_index.slice_range(slicen, max_slice)
+            self.load_range = (first, last)
+            if checkpoint is not None and checkpoint.get("index", None) == self.dump_index.path:
+                if checkpoint["block"] > first:
+                    self.load_start = min(checkpoint["block"], last)
+                    logger.info(f"Resuming {self.in_path} slice {slicen} at block {self.load_start} of {last}")
+                    return True
+            self.load_start = first
+        else:
+            self.load_range = None
+            if (
+                checkpoint is not None
+                and checkpoint.get("index", None) is None
+                and checkpoint.get("chunk_bytes", None) == self.load_chunk_bytes
+                and checkpoint["block"] > 0
+            ):
+                self.load_start = checkpoint["block"]
+                logger.info(f"Resuming {self.in_path} slice {slicen} after chunk {self.load_start}")
+                return True
+            self.load_start = 0
+        return False
+
+    def iter_work(self, slicen=None, max_slice=None):
+        # Yield (block number, work) from where start_load left off
+        # work is passed to read_lines, possibly in another process; for an
+        # indexed dump it's just the block number, so it's cheap to send
+        if self.dump_index is not None:
+            for n in range(self.load_start, self.load_range[1]):
+                yield (n, n)
+        else:
+            with open_dump(self.in_path) as fh:
+                for n, lines in enumerate(iter_chunks(fh, self.load_chunk_bytes, slicen, max_slice)):
+                    if n >= self.load_start:
+                        yield (n, lines)
+
+    def read_lines(self, work):
+        if type(work) is int:
+            return io.BytesIO(self.dump_index.read_block(work)).readlines()
+        return work
+
+    def run_work(self, slicen=None, max_slice=None):
+        # Yield (block number, *process_lines results) in order, from a pool of
+        # self.processes workers
+        return run_parallel(
+            process_work, self.iter_work(slicen, max_slice), self.processes, initializer=init_worker, initargs=(self,)
+        )
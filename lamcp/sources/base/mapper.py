@@ -1,6 +1,8 @@
 import re
+from types import MappingProxyType
 from cromulent import model, vocab
 from lxml import etree
+from .reference import ReferenceResolver
 
 import logging
 
@@ -12,104 +14,144 @@ mebInfo = model.PropInfo("members_exemplified_by", "la:members_exemplified_by",
 model.Set._all_properties["members_exemplified_by"] = mebInfo
 model.Group._all_properties["members_exemplified_by"] = mebInfo
 
-
-class Mapper(object):
-    def __init__(self, config):
+# ISO 639-2 (B and T) codes to the two letter codes used in process_langs
+lang_three_to_two = MappingProxyType(
+    {
+        "por": "pt",
+        "deu": "de",
+        "ger": "de",
+        "eng": "en",
+        "fra": "fr",
+        "fre": "fr",
+        "spa": "es",
+        "zho": "zh",
+        "chi": "zh",
+        "hin": "hi",
+        "afr": "af",
+        "alb": "sq",
+        "sqi": "sq",
+        "ara": "ar",
+        "bul": "bg",
+        "bos": "bs",
+        "cat": "ca",
+        "ben": "bn",
+        "rus": "ru",
+        "nld": "nl",
+        "dut": "nl",
+        "fin": "fi",
+        "ile": "is",
+        "gle": "ga",
+        "ita": "it",
+        "fas": "fa",
+        "per": "fa",
+        "guj": "gu",
+        "kor": "ko",
+        "lat": "la",
+        "lit": "lt",
+        "mac": "mk",
+        "mkd": "mk",
+        "jpn": "ja",
+        "hrv": "hr",
+        "ces": "cs",
+        "cze": "cs",
+        "dan": "da",
+        "ell": "el",
+        "gre": "el",
+        "kat": "ka",
+        "geo": "ka",
+        "heb": "he",
+        "hun": "hu",
+        "nor": "no",
+        "pol": "pl",
+        "ron": "ro",
+        "rum": "ro",
+        "slk": "sk",
+        "slo": "sk",
+        "slv": "sl",
+        "srp": "sr",
+        "swe": "sv",
+        "tur": "tr",
+        "cym": "cy",
+        "wel": "cy",
+        "urd": "ur",
+        "swa": "sw",
+        "ind": "id",
+        "tel": "te",
+        "tam": "ta",
+        "tha": "th",
+        "mar": "mr",
+        "pan": "pa",
+    }
+)
+
+# Languages to always try to include
+must_have = ("en", "es", "fr", "pt", "de", "nl", "zh", "ja", "ar", "hi")
+
+
+class MapperConstants(object):
+    # Vocabulary derived tables shared by every mapper instance.
+    # Built once, on first use, and read-only so they are safe to share
+
+    def __init__(self):
         # Not sure if this is useful, but worth configuration once
-        self.factory = model.factory
-        self.factory.auto_assign_id = False
-        self.factory.validate_properties = False
-        self.factory.validate_profile = False
-        self.factory.validate_range = False
-        self.factory.validate_multiplicity = False
-        self.factory.json_serializer = "fast"
-        self.factory.order_json = False
-        self.factory.cache_hierarchy()
-
-        ### FIXME: How much of this is actually needed for *all* mappers?
-        ### shouldn't they be instantiated on some constants instance
-        ### and then referenced?
-
-        self.process_langs = {}
-        self.aat_material_ids = []
-        self.aat_unit_ids = []
+        factory = model.factory
+        factory.auto_assign_id = False
+        factory.validate_properties = False
+        factory.validate_profile = False
+        factory.validate_range = False
+        factory.validate_multiplicity = False
+        factory.json_serializer = "fast"
+        factory.order_json = False
+        factory.cache_hierarchy()
+
+        process_langs = {}
+        aat_material_ids = set()
+        aat_unit_ids = set()
         for i in vocab.instances.values():
             if isinstance(i, model.Language):
                 if hasattr(i, "notation"):
-                    self.process_langs[i.notation] = i
+                    process_langs[i.notation] = i
             elif isinstance(i, model.Material):
-                self.aat_material_ids.append(i.id)
+                aat_material_ids.add(i.id)
             elif isinstance(i, model.MeasurementUnit):
-                self.aat_unit_ids.append(i.id)
-
-        self.lang_three_to_two = {
-            "por": "pt",
-            "deu": "de",
-            "ger": "de",
-            "eng": "en",
-            "fra": "fr",
-            "fre": "fr",
-            "spa": "es",
-            "zho": "zh",
-            "chi": "zh",
-            "hin": "hi",
-            "afr": "af",
-            "alb": "sq",
-            "sqi": "sq",
-            "ara": "ar",
-            "bul": "bg",
-            "bos": "bs",
-            "cat": "ca",
-            "ben": "bn",
-            "rus": "ru",
-            "nld": "nl",
-            "dut": "nl",
-            "fin": "fi",
-            "ile": "is",
-            "gle": "ga",
-            "ita": "it",
-            "fas": "fa",
-            "per": "fa",
-            "guj": "gu",
-            "kor": "ko",
-            "lat": "la",
-            "lit": "lt",
-            "mac": "mk",
-            "mkd": "mk",
-            "jpn": "ja",
-            "hrv": "hr",
-            "ces": "cs",
-            "cze": "cs",
-            "dan": "da",
-            "ell": "el",
-            "gre": "el",
-            "kat": "ka",
-            "geo": "ka",
-            "heb": "he",
-            "hun": "hu",
-            "nor": "no",
-            "pol": "pl",
-            "ron": "ro",
-            "rum": "ro",
-            "slk": "sk",
-            "slo": "sk",
-            "slv": "sl",
-            "srp": "sr",
-            "swe": "sv",
-            "tur": "tr",
-            "cym": "cy",
-            "wel": "cy",
-            "urd": "ur",
-            "swa": "sw",
-            "ind": "id",
-            "tel": "te",
-            "tam": "ta",
-            "tha": "th",
-            "mar": "mr",
-            "pan": "pa",
-        }
-
-        self.must_have = ["en", "es", "fr", "pt", "de", "nl", "zh", "ja", "ar", "hi"]
+                aat_unit_ids.add(i.id)
+        self.process_langs = MappingProxyType(process_langs)
+        self.aat_language_ids = frozenset([x.id for x in process_langs.values()])
+        self.aat_material_ids = frozenset(aat_material_ids)
+        self.aat_unit_ids = frozenset(aat_unit_ids)
+
+        # AAT id --> vocab class for brief text statements
+        statement_classes = {}
+        for name, thing in vocab.inst_js.items():  ### FIXME: This is terrible and will break
+            if "metatype" in thing and thing["metatype"] == "brief text":
+                statement_classes[thing["id"]] = getattr(vocab, name)
+        self.statement_classes = MappingProxyType(statement_classes)
+
+        self.lang_three_to_two = lang_three_to_two
+        self.must_have = must_have
+
+
+constants = None
+
+
+def get_constants():
+    global constants
+    if constants is None:
+        constants = MapperConstants()
+    return constants
+
+
+class Mapper(object):
+    def __init__(self, config):
+        self.factory = model.factory
+
+        # Shared, read-only tables; see MapperConstants
+        consts = get_constants()
+        self.process_langs = consts.process_langs
+        self.aat_material_ids = consts.aat_material_ids
+        self.aat_unit_ids = consts.aat_unit_ids
+        self.lang_three_to_two = consts.lang_three_to_two
+        self.must_have = consts.must_have
 
         self.config = config
 
@@ -118,6 +160,10 @@ class Mapper(object):
         self.name = config["name"]
         self.debug = False
         self.acquirer = None
+        self.resolver = self.make_resolver(config)
+
+    def make_resolver(self, config):
+        return ReferenceResolver(self, config)
 
     def make_export_filename(self, name, my_slice):
         return f"export_{name}_{my_slice}.jsonl"
@@ -146,19 +192,12 @@ class Mapper(object):
         return {}
 
     def get_reference(self, identifier):
-        try:
-            fdata = self.fetcher.fetch(identifier)
-            frec = self.transform(fdata, reference=True)
-        except:
-            raise
-            return None
-
-        if frec is not None:
-            rectype = frec["data"]["type"]
-            crmcls = getattr(model, rectype)
-            return crmcls(ident=self.expand_uri(identifier), label=frec["data"].get("_label", ""))
-        else:
+        ref = self.resolver.resolve(identifier)
+        if not ref:
             return None
+        (rectype, label) = ref
+        crmcls = getattr(model, rectype)
+        return crmcls(ident=self.expand_uri(identifier), label=label)
 
     def transform(self, record, rectype, reference=False):
         # No op
@@ -0,0 +1,46 @@
+import sys
+import time
+import tracemalloc
+from . import mapper as base_mapper
+from ..getty.mapper import GettyMagicMapper
+from ..wikidata.mapper import WikidataMapper
+from ..pleiades.mapper import PleiadesMapper
+
+# Micro-benchmark for mapper construction, as the server and notebook do at startup
+#   python -m lamcp.sources.base.mapper_bench [rounds]
+# "rebuilt" throws away the shared MapperConstants before each round, which is
+# what every construction used to cost; "shared" reuses them
+
+configs = [
+    (GettyMagicMapper, {"name": "ulan", "namespace": "http://vocab.getty.edu/", "fetch": ""}),
+    (WikidataMapper, {"name": "wikidata", "namespace": "http://www.wikidata.org/entity/", "fetch": ""}),
+    (PleiadesMapper, {"name": "pleiades", "namespace": "https://pleiades.stoa.org/places/", "fetch": ""}),
+]
+
+
+def construct(rounds, rebuild):
+    mappers = []
+    tracemalloc.start()
+    start = time.perf_counter()
+    for r in range(rounds):
+        if rebuild:
+            base_mapper.constants = None
+        for cls, cfg in configs:
+            mappers.append(cls(cfg))
+    elapsed = time.perf_counter() - start
+    (current, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return (elapsed, current)
+
+
+def run(rounds=50):
+    # The first construction loads cromulent's vocabulary either way
+    base_mapper.get_constants()
+    print(f"{'':10} {'ms/round':>10} {'KiB/round':>10}")
+    for name, rebuild in [("rebuilt", True), ("shared", False)]:
+        (elapsed, mem) = construct(rounds, rebuild)
+        print(f"{name:10} {elapsed / rounds * 1000:>10.2f} {mem / rounds / 1024:>10.1f}")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
@@ -0,0 +1,391 @@
+import time
+import heapq
+import asyncio
+import itertools
+import threading
+import contextvars
+from contextlib import contextmanager, asynccontextmanager
+from collections import OrderedDict
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from requests.utils import DEFAULT_ACCEPT_ENCODING
+from urllib3.poolmanager import PoolManager
+import logging
+
+try:
+    import h2
+except:
+    h2 = None
+
+logger = logging.getLogger("lamcp")
+
+
+def get_host(url):
+    return urlparse(url).netloc
+
+
+# Includes br (and zstd) when urllib3 can decode them
+accept_encoding = DEFAULT_ACCEPT_ENCODING
+
+# Process wide connection pool settings, see configure_pools
+pool_config = {
+    # connections kept open per host, unless set for the host
+    "pool_size": 10,
+    # number of hosts to keep pools for
+    "max_hosts": 100,
+    # for the async client, which can't size per host
+    "max_connections": 200,
+    "max_keepalive": 50,
+    "keepalive_expiry": 30,
+    "http2": True,
+}
+# host --> connections kept open for it
+host_pool_sizes = {}
+
+
+class HostPoolManager(PoolManager):
+    # urllib3 keeps one pool per (scheme, host, port) already, but with a single
+    # size; let busy hosts have bigger pools
+
+    def _new_pool(self, scheme, host, port, request_context=None):
+        if request_context is None:
+            request_context = self.connection_pool_kw.copy()
+        size = host_pool_sizes.get(host, None) or host_pool_sizes.get(f"{host}:{port}", None)
+        if size:
+            request_context = dict(request_context)
+            request_context["maxsize"] = size
+        return PoolManager._new_pool(self, scheme, host, port, request_context)
+
+
+class PooledAdapter(HTTPAdapter):
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        self._pool_connections = connections
+        self._pool_maxsize = maxsize
+        self._pool_block = block
+        self.poolmanager = HostPoolManager(num_pools=connections, maxsize=maxsize, block=block, **pool_kwargs)
+
+
+class ConnectionPools(object):
+    # A single adapter, and so a single set of keep-alive connections per host,
+    # mounted on every session in the process. Sessions keep their own headers
+    # and cookies, but reuse each other's connections and TLS sessions
+
+    def __init__(self):
+        self.adapter = None
+        self.session = None
+        self.lock = threading.Lock()
+
+    def get_adapter(self):
+        with self.lock:
+            if self.adapter is None:
+                self.adapter = PooledAdapter(
+                    pool_connections=pool_config["max_hosts"], pool_maxsize=pool_config["pool_size"]
+                )
+        return self.adapter
+
+    def mount(self, session):
+        adapter = self.get_adapter()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def make_session(self, headers=None):
+        session = requests.Session()
+        session.headers["Accept-Encoding"] = accept_encoding
+        if headers:
+            session.headers.update(headers)
+        return self.mount(session)
+
+    def get_session(self):
+        # Shared session for code that doesn't need its own headers
+        if self.session is None:
+            self.session = self.make_session()
+        return self.session
+
+    def resize(self):
+        # Sessions made before configure_pools share the adapter, so give it
+        # new pools at the configured sizes rather than replacing it
+        with self.lock:
+            if self.adapter is not None:
+                self.adapter.init_poolmanager(pool_config["max_hosts"], pool_config["pool_size"])
+
+    def configure_host(self, host, pool_size):
+        # Only affects pools created after the call; take the largest asked for
+        if pool_size and pool_size > host_pool_sizes.get(host, 0):
+            host_pool_sizes[host] = pool_size
+
+
+connection_pools = ConnectionPools()
+
+
+def configure_pools(config):
+    # Call at startup, before the first request, to change the process wide sizes
+    # config is eg {"pool_size": 20, "hosts": {"www.wikidata.org": 40}}
+    if not config:
+        return
+    pool_config.update({k: v for k, v in config.items() if k in pool_config})
+    for host, size in config.get("hosts", {}).items():
+        connection_pools.configure_host(host, size)
+    connection_pools.resize()
+
+
+def make_session(headers=None):
+    return connection_pools.make_session(headers)
+
+
+def get_session():
+    return connection_pools.get_session()
+
+
+class NetworkMap(object):
+    # Bounded, expiring map of URL to the result of a failed fetch.
+    # Values are the HTTP status (0 for network failures and timeouts)
+    # or a string if the URL is known to redirect to a new identifier.
+    # Behaves like the plain dict it replaces for `in`, [] and get()
+
+    def __init__(self, max_size=100000, ttls=None):
+        self.max_size = max_size
+        # seconds to remember each class of result
+        self.ttls = {"redirect": 30 * 86400, "gone": 7 * 86400, "client": 3600, "server": 300, "network": 60}
+        if ttls:
+            self.ttls.update(ttls)
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def classify(self, value):
+        if type(value) == str:
+            return "redirect"
+        elif value in [404, 410]:
+            return "gone"
+        elif value == 429:
+            return "server"
+        elif 400 <= value < 500:
+            return "client"
+        elif value >= 500:
+            return "server"
+        else:
+            return "network"
+
+    def __setitem__(self, url, value):
+        expires = time.time() + self.ttls[self.classify(value)]
+        with self.lock:
+            self.data[url] = (value, expires)
+            self.data.move_to_end(url)
+            while len(self.data) > self.max_size:
+                self.data.popitem(last=False)
+
+    def get(self, url, default=None):
+        with self.lock:
+            try:
+                (value, expires) = self.data[url]
+            except KeyError:
+                return default
+            if expires < time.time():
+                del self.data[url]
+                return default
+            return value
+
+    def __getitem__(self, url):
+        value = self.get(url, KeyError)
+        if value is KeyError:
+            raise KeyError(url)
+        return value
+
+    def __contains__(self, url):
+        return self.get(url, KeyError) is not KeyError
+
+    def __delitem__(self, url):
+        with self.lock:
+            del self.data[url]
+
+    def __len__(self):
+        return len(self.data)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+class CircuitBreaker(object):
+    # Per host breaker: after `threshold` consecutive failures (network errors,
+    # 5xx, 429) the host is skipped entirely until the cool down has passed.
+    # Hosts can also be tripped explicitly, e.g. on a throttling message
+
+    def __init__(self, threshold=5, cooldown=60):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = {}
+        self.open_until = {}
+        self.lock = threading.Lock()
+
+    def allow(self, host):
+        until = self.open_until.get(host, 0)
+        if not until:
+            return True
+        if until > time.time():
+            return False
+        # Half open: let requests through again, one more failure reopens
+        with self.lock:
+            self.open_until.pop(host, None)
+            self.failures[host] = self.threshold - 1
+        return True
+
+    def record_success(self, host):
+        if self.failures.get(host, 0):
+            with self.lock:
+                self.failures[host] = 0
+
+    def record_failure(self, host):
+        with self.lock:
+            n = self.failures.get(host, 0) + 1
+            self.failures[host] = n
+        if n >= self.threshold:
+            self.trip(host)
+
+    def trip(self, host, cooldown=None):
+        if cooldown is None:
+            cooldown = self.cooldown
+        logger.warning(f"Circuit open for {host} for {cooldown} seconds")
+        with self.lock:
+            self.open_until[host] = time.time() + cooldown
+
+
+# Shared across fetchers, as several fetchers can talk to the same host
+circuit_breaker = CircuitBreaker()
+
+
+# Request priorities for RateLimiter, lower goes first
+INTERACTIVE = 0
+BACKGROUND = 1
+
+# Set to INTERACTIVE for work done on behalf of a waiting client.
+# Copied into asyncio tasks and asyncio.to_thread, so it follows the request
+request_priority = contextvars.ContextVar("request_priority", default=BACKGROUND)
+
+# Starting points for upstreams known to throttle, overridden by source config
+#   rate_limit: requests per second (0 = unlimited), rate_burst: bucket size,
+#   max_concurrency: requests in flight at once (0 = unlimited)
+default_rate_limits = {
+    "wikidata": {"rate_limit": 10, "rate_burst": 20, "max_concurrency": 5},
+    "geonames": {"rate_limit": 0.25, "rate_burst": 5, "max_concurrency": 1},
+    "viaf": {"rate_limit": 5, "rate_burst": 10, "max_concurrency": 4},
+    "lcnaf": {"rate_limit": 5, "rate_burst": 10, "max_concurrency": 4},
+    "lcsh": {"rate_limit": 5, "rate_burst": 10, "max_concurrency": 4},
+}
+
+
+class RateLimiter(object):
+    # Token bucket of `rate` requests per second holding up to `burst` tokens,
+    # plus at most `concurrency` requests in flight.
+    # Waiters are served in priority order, then first come first served,
+    # so interactive requests jump the queue of background ones
+
+    def __init__(self, rate=0, burst=1, concurrency=0):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.concurrency = concurrency
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.active = 0
+        self.waiting = []
+        self.abandoned = set()
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+        # How long to wait before checking again when blocked on concurrency or queue position
+        self.poll = 0.01
+
+    def unlimited(self):
+        return not self.rate and not self.concurrency
+
+    def enqueue(self, priority):
+        ticket = (priority, next(self.counter))
+        with self.lock:
+            heapq.heappush(self.waiting, ticket)
+        return ticket
+
+    def abandon(self, ticket):
+        with self.lock:
+            self.abandoned.add(ticket)
+
+    def try_acquire(self, ticket):
+        # Returns 0 if the ticket may go now, or how long to wait before asking again
+        with self.lock:
+            while self.waiting and self.waiting[0] in self.abandoned:
+                self.abandoned.discard(heapq.heappop(self.waiting))
+            if self.waiting[0] != ticket:
+                return self.poll
+            if self.concurrency and self.active >= self.concurrency:
+                return self.poll
+            if self.rate:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens < 1:
+                    return (1 - self.tokens) / self.rate
+                self.tokens -= 1
+            heapq.heappop(self.waiting)
+            self.active += 1
+            return 0
+
+    def release(self):
+        with self.lock:
+            self.active -= 1
+
+    @contextmanager
+    def limit(self, priority=None):
+        if self.unlimited():
+            yield
+            return
+        if priority is None:
+            priority = request_priority.get()
+        ticket = self.enqueue(priority)
+        try:
+            delay = self.try_acquire(ticket)
+            while delay:
+                time.sleep(delay)
+                delay = self.try_acquire(ticket)
+        except BaseException:
+            self.abandon(ticket)
+            raise
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def alimit(self, priority=None):
+        if self.unlimited():
+            yield
+            return
+        if priority is None:
+            priority = request_priority.get()
+        ticket = self.enqueue(priority)
+        try:
+            delay = self.try_acquire(ticket)
+            while delay:
+                await asyncio.sleep(delay)
+                delay = self.try_acquire(ticket)
+        except BaseException:
+            self.abandon(ticket)
+            raise
+        try:
+            yield
+        finally:
+            self.release()
+
+
+# source name --> RateLimiter, shared by the source's fetcher, searcher and resolver
+rate_limiters = {}
+rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(name, config):
+    with rate_limiters_lock:
+        if not name in rate_limiters:
+            limits = dict(default_rate_limits.get(name, {}))
+            limits.update({k: v for k, v in config.items() if k in ["rate_limit", "rate_burst", "max_concurrency"]})
+            rate_limiters[name] = RateLimiter(
+                limits.get("rate_limit", 0), limits.get("rate_burst", 1), limits.get("max_concurrency", 0)
+            )
+        return rate_limiters[name]
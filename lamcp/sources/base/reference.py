@@ -0,0 +1,71 @@
+import time
+import logging
+from .cache import LruCache
+from .network import get_rate_limiter
+
+logger = logging.getLogger("lamcp")
+
+
+class ReferenceResolver(object):
+    # Resolve identifiers to just the (class name, label) pair needed to build
+    # a reference, fetching as little as possible.
+    # Subclasses override lookup_many to use a cheaper query than the full record;
+    # the default fetches and maps the full record as Mapper.get_reference used to
+
+    def __init__(self, mapper, config):
+        self.mapper = mapper
+        self.config = config
+        # identifier --> (class name, label), or False if not resolvable
+        self.cache = LruCache(config.get("reference_cache_size", 50000))
+        self.failure_ttl = 60
+        self.batch_size = 50
+        self.timeout = 10
+        # Lookups count against the same limits as the source's fetcher
+        self.limiter = get_rate_limiter(mapper.name, config)
+
+    def resolve(self, identifier):
+        return self.resolve_many([identifier])[identifier]
+
+    def resolve_many(self, identifiers):
+        results = {}
+        todo = []
+        for ident in identifiers:
+            ref = self.cache.get(ident)
+            if ref is not None:
+                results[ident] = ref
+            elif not ident in todo:
+                todo.append(ident)
+
+        for start in range(0, len(todo), self.batch_size):
+            chunk = todo[start : start + self.batch_size]
+            try:
+                found = self.lookup_many(chunk)
+            except Exception as e:
+                logger.error(f"Failed to resolve references {chunk}: {e}")
+                found = {}
+            for ident in chunk:
+                ref = found.get(ident, None)
+                if ref:
+                    self.cache.set(ident, ref)
+                else:
+                    # Don't remember failures for long, they might be network related
+                    ref = False
+                    self.cache.set(ident, ref, time.time() + self.failure_ttl)
+                results[ident] = ref
+        return results
+
+    def lookup_many(self, identifiers):
+        fetcher = self.mapper.fetcher
+        return {ident: self.lookup_record(fetcher.fetch(ident)) for ident in identifiers}
+
+    def lookup_record(self, record):
+        # Slow path: map the full record to find the class and label
+        if not record:
+            return None
+        frec = self.mapper.transform(record, None, reference=True)
+        if frec is None:
+            return None
+        return (frec["data"]["type"], frec["data"].get("_label", ""))
+
+    def get_session(self):
+        return self.mapper.fetcher.session
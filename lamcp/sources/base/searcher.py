@@ -1,4 +1,7 @@
-import requests
+import asyncio
+
+from .fetcher import httpx, get_async_client
+from .network import make_session, get_rate_limiter
 
 
 class Searcher:
@@ -7,14 +10,35 @@ class Searcher:
         self.headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3"
         }
+        self.session = make_session(self.headers)
+        self.limiter = get_rate_limiter(config.get("name", ""), config)
+
+    def process_results(self, results):
+        # Turn the raw response into {"results": [uri, ...]}
+        return results
 
     def search(self, query, lang="", entity_type=""):
         # Implement base search logic here
         """Run the query and return URI results"""
 
         qurl = self.endpoint.format(QUERY=query, LANG=lang, ENTITY_TYPE=entity_type)
-        resp = requests.get(qurl, headers=self.headers)
+        with self.limiter.limit():
+            resp = self.session.get(qurl)
+        if resp.status_code == 200:
+            return self.process_results(resp.json())
+        else:
+            raise Exception(f"Request failed with status code {resp.status_code}")
+
+    async def asearch(self, query, lang="", entity_type=""):
+        """Non-blocking version of search for use within an event loop"""
+        if httpx is None or type(self).search is not Searcher.search:
+            # Subclasses with their own search logic are still synchronous
+            return await asyncio.to_thread(self.search, query, lang, entity_type)
+
+        qurl = self.endpoint.format(QUERY=query, LANG=lang, ENTITY_TYPE=entity_type)
+        async with self.limiter.alimit():
+            resp = await get_async_client().get(qurl, headers=self.headers)
         if resp.status_code == 200:
-            return resp.json()
+            return self.process_results(resp.json())
         else:
             raise Exception(f"Request failed with status code {resp.status_code}")
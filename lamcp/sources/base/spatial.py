@@ -0,0 +1,386 @@
+import os
+import sys
+import math
+import time
+import sqlite3
+import argparse
+import threading
+import numpy as np
+import ujson as json
+from .cache import LruCache
+from .dump import open_dump
+from .geometry import GeometryWriter
+
+try:
+    import shapely
+    from shapely import wkt as shapely_wkt
+except:
+    shapely = None
+
+import logging
+
+logger = logging.getLogger("lamcp")
+
+# Local spatial index over places from WoF, GeoNames and Pleiades, to find
+# places near a point or in a box, and the polygons that contain a point,
+# without any remote calls.
+# Each place has a representative point, and a bounding box in an sqlite
+# R*Tree; places with polygons also keep a simplified WKT shape that the
+# containment check is done against.
+#   python -m lamcp.sources.base.spatial --path P [--wof db] [--geonames allCountries.txt] [--pleiades json.gz]
+# The server reads it from the path in its spatial_index config section, or
+# places.sqlite in temp_dir. GeoNames can also add its places while loading,
+# see spatialIndexPath; WoF and Pleiades have no bulk loader, so they're only
+# added by this script, straight from their dump files
+
+earth_radius_km = 6371.0088
+km_per_degree = 111.32
+
+
+def haversine_km(lat, lng, lats, lngs):
+    # Distance from one point to arrays of points
+    lat1 = math.radians(lat)
+    lat2 = np.radians(lats)
+    dlat = lat2 - lat1
+    dlng = np.radians(lngs) - math.radians(lng)
+    a = np.sin(dlat / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin(dlng / 2) ** 2
+    return 2 * earth_radius_km * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def geojson_bbox(geom):
+    try:
+        arr = np.asarray(flatten_coords(geom.get("coordinates", [])), dtype=float).reshape(-1, 2)
+    except:
+        return None
+    if not len(arr):
+        return None
+    return [float(arr[:, 0].min()), float(arr[:, 1].min()), float(arr[:, 0].max()), float(arr[:, 1].max())]
+
+
+def flatten_coords(coords):
+    # Nested GeoJSON coordinates --> flat list of lng, lat
+    out = []
+    stack = [coords]
+    while stack:
+        c = stack.pop()
+        if c and type(c[0]) in [int, float]:
+            out.extend(c[:2])
+        else:
+            stack.extend(c)
+    return out
+
+
+def spatial_config(configs):
+    # SpatialIndex settings from the all-configs object: its spatial_index
+    # section, if any, with the index in temp_dir unless a path is given
+    config = dict(getattr(configs, "spatial_index", None) or {})
+    temp_dir = getattr(configs, "temp_dir", None)
+    if "path" not in config and temp_dir:
+        config["path"] = os.path.join(temp_dir, "places.sqlite")
+    return config
+
+
+def containment_available():
+    return shapely is not None
+
+
+def parse_bbox(bbox):
+    # "min_longitude,min_latitude,max_longitude,max_latitude" --> 4 floats
+    try:
+        box = [float(x) for x in bbox.split(",")]
+    except ValueError:
+        box = []
+    if len(box) != 4 or not all(math.isfinite(x) for x in box) or box[0] > box[2] or box[1] > box[3]:
+        raise ValueError(f"Invalid bbox {bbox!r}: expected min_longitude,min_latitude,max_longitude,max_latitude")
+    return box
+
+
+def open_spatial_index(config):
+    # An existing index to query, or None if it hasn't been built
+    path = config.get("path", None)
+    if not path or not os.path.exists(path):
+        return None
+    return SpatialIndex(config)
+
+
+class SpatialIndex(object):
+    def __init__(self, config):
+        self.path = config["path"]
+        dirn = os.path.dirname(self.path)
+        if dirn and not os.path.exists(dirn):
+            os.makedirs(dirn)
+        # Loader slices in other processes may be writing at the same time, so
+        # wait for their transactions rather than failing with "locked"
+        self.conn = sqlite3.connect(self.path, timeout=config.get("busy_timeout", 300), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS places (id INTEGER PRIMARY KEY, dataset TEXT, identifier TEXT, "
+            "name TEXT, type TEXT, lng REAL, lat REAL, area REAL, shape TEXT)"
+        )
+        self.conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS places_ident ON places (dataset, identifier)")
+        self.conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS boxes USING rtree(id, minx, maxx, miny, maxy)")
+        self.conn.commit()
+        self.lock = threading.Lock()
+        # Shapes are simplified harder than for records, they're only for containment
+        self.geometry = GeometryWriter({"polygon_points": config.get("shape_points", 200)})
+        # Parsed shapes for the containment check
+        self.shapes = LruCache(config.get("shape_cache_size", 2000))
+        self.max_candidates = config.get("max_candidates", 100000)
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM places").fetchone()[0]
+
+    def write(self, fn, *args):
+        # Run fn in one write transaction. Other processes (eg loader slices)
+        # may be writing to the same index, so take sqlite's write lock up
+        # front, before anything is read, and wait for it if need be
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                res = fn(*args)
+                self.conn.commit()
+            except:
+                self.conn.rollback()
+                raise
+        return res
+
+    def clear(self, dataset):
+        self.write(self.delete_dataset, dataset)
+
+    def delete_dataset(self, dataset):
+        self.conn.execute("DELETE FROM boxes WHERE id IN (SELECT id FROM places WHERE dataset = ?)", (dataset,))
+        self.conn.execute("DELETE FROM places WHERE dataset = ?", (dataset,))
+
+    def start_bulk(self):
+        # Nothing reads the index while it's built, so skip the safety nets
+        self.conn.execute("PRAGMA synchronous=OFF")
+
+    def end_bulk(self):
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+
+    def add_many(self, dataset, rows):
+        # rows of (identifier, name, type, lng, lat, bbox, geom)
+        # bbox is [minx, miny, maxx, maxy] or None for a point, and geom a
+        # GeoJSON polygon geometry or None. Places already there are replaced
+        # Shapes are made before taking the write lock, so other writers
+        # only wait for the inserts
+        places = []
+        for identifier, name, typ, lng, lat, bbox, geom in rows:
+            shape = None
+            area = 0
+            if geom:
+                shape = self.geometry.to_wkt(geom)
+                if shape and not shape.startswith(("POLYGON", "MULTIPOLYGON")):
+                    shape = None
+                if bbox is None:
+                    bbox = geojson_bbox(geom)
+            if bbox is None:
+                if lng is None or lat is None:
+                    continue
+                bbox = [lng, lat, lng, lat]
+            elif lng is None or lat is None:
+                lng = (bbox[0] + bbox[2]) / 2
+                lat = (bbox[1] + bbox[3]) / 2
+            if shape:
+                area = (bbox[2] - bbox[0]) * (bbox[3] - bbox[1])
+            places.append(((dataset, identifier, name, typ, lng, lat, area, shape), bbox))
+        self.write(self.insert_places, dataset, [r[0] for r in rows], places)
+        return len(places)
+
+    def insert_places(self, dataset, idents, places):
+        old = []
+        for i in range(0, len(idents), 500):
+            chunk = idents[i : i + 500]
+            marks = ",".join(["?"] * len(chunk))
+            old.extend(
+                self.conn.execute(f"SELECT id FROM places WHERE dataset = ? AND identifier IN ({marks})", [dataset] + chunk)
+            )
+        if old:
+            self.conn.executemany("DELETE FROM boxes WHERE id = ?", old)
+            self.conn.executemany("DELETE FROM places WHERE id = ?", old)
+        # sqlite picks the ids, so concurrent writers can't collide
+        boxes = []
+        cur = self.conn.cursor()
+        for place, bbox in places:
+            cur.execute("INSERT INTO places VALUES (NULL, ?, ?, ?, ?, ?, ?, ?, ?)", place)
+            boxes.append((cur.lastrowid, bbox[0], bbox[2], bbox[1], bbox[3]))
+        self.conn.executemany("INSERT INTO boxes VALUES (?, ?, ?, ?, ?)", boxes)
+
+    def build(self, dataset, rows, batch=50000):
+        # Replace the dataset's places with rows from an iterator
+        start = time.time()
+        self.clear(dataset)
+        self.start_bulk()
+        n = 0
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= batch:
+                n += self.add_many(dataset, chunk)
+                chunk = []
+                print(f"{dataset}: {n} places in {time.time() - start}")
+        if chunk:
+            n += self.add_many(dataset, chunk)
+        self.end_bulk()
+        print(f"Indexed {n} {dataset} places in {time.time() - start}")
+        return n
+
+    def candidates(self, sql, params, datasets=None):
+        if datasets:
+            sql += f" AND p.dataset IN ({','.join(['?'] * len(datasets))})"
+            params = list(params) + list(datasets)
+        sql += f" LIMIT {self.max_candidates}"
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def make_result(self, row, distance=None):
+        res = {"dataset": row[1], "identifier": row[2], "name": row[3], "type": row[4], "longitude": row[5], "latitude": row[6]}
+        if distance is not None:
+            res["distance_km"] = round(float(distance), 3)
+        return res
+
+    def nearby(self, lat, lng, radius_km=10, limit=20, datasets=None):
+        # Places with their point within radius_km, nearest first
+        # Boxes don't wrap around the antimeridian
+        dlat = radius_km / km_per_degree
+        dlng = radius_km / (km_per_degree * max(math.cos(math.radians(lat)), 0.01))
+        rows = self.candidates(
+            "SELECT p.id, p.dataset, p.identifier, p.name, p.type, p.lng, p.lat FROM places p "
+            "WHERE p.id IN (SELECT id FROM boxes WHERE maxx >= ? AND minx <= ? AND maxy >= ? AND miny <= ?) "
+            "AND p.lng BETWEEN ? AND ? AND p.lat BETWEEN ? AND ?",
+            [lng - dlng, lng + dlng, lat - dlat, lat + dlat] * 2,
+            datasets,
+        )
+        if not rows:
+            return []
+        dists = haversine_km(lat, lng, [r[6] for r in rows], [r[5] for r in rows])
+        order = np.argsort(dists, kind="stable")
+        return [self.make_result(rows[i], dists[i]) for i in order[:limit] if dists[i] <= radius_km]
+
+    def within_bbox(self, minx, miny, maxx, maxy, limit=20, datasets=None):
+        # Places with their point in the box, nearest the centre first
+        rows = self.candidates(
+            "SELECT p.id, p.dataset, p.identifier, p.name, p.type, p.lng, p.lat FROM places p "
+            "WHERE p.id IN (SELECT id FROM boxes WHERE maxx >= ? AND minx <= ? AND maxy >= ? AND miny <= ?) "
+            "AND p.lng BETWEEN ? AND ? AND p.lat BETWEEN ? AND ?",
+            [minx, maxx, miny, maxy] * 2,
+            datasets,
+        )
+        if not rows:
+            return []
+        (lat, lng) = ((miny + maxy) / 2, (minx + maxx) / 2)
+        dists = haversine_km(lat, lng, [r[6] for r in rows], [r[5] for r in rows])
+        order = np.argsort(dists, kind="stable")
+        return [self.make_result(rows[i], dists[i]) for i in order[:limit]]
+
+    def get_shape(self, pid, wkt):
+        shape = self.shapes.get(pid)
+        if shape is None:
+            shape = shapely_wkt.loads(wkt)
+            shapely.prepare(shape)
+            self.shapes.set(pid, shape)
+        return shape
+
+    def containing(self, lat, lng, limit=20, datasets=None):
+        # Places whose polygon contains the point, smallest first
+        # Without shapely there's only the bounding box, which isn't an answer
+        if shapely is None:
+            raise RuntimeError("Finding the places that contain a point needs shapely")
+        rows = self.candidates(
+            "SELECT p.id, p.dataset, p.identifier, p.name, p.type, p.lng, p.lat, p.area, p.shape FROM places p "
+            "WHERE p.id IN (SELECT id FROM boxes WHERE minx <= ? AND maxx >= ? AND miny <= ? AND maxy >= ?) "
+            "AND p.shape IS NOT NULL",
+            [lng, lng, lat, lat],
+            datasets,
+        )
+        rows.sort(key=lambda r: r[7])
+        results = []
+        for r in rows:
+            try:
+                if not shapely.contains_xy(self.get_shape(r[0], r[8]), lng, lat):
+                    continue
+            except Exception as e:
+                logger.warning(f"Bad shape for {r[1]}:{r[2]}: {e}")
+                continue
+            results.append(self.make_result(r))
+            if len(results) >= limit:
+                break
+        return results
+
+
+# Row iterators for build(), one per source
+
+
+def wof_places(dumpdb):
+    # The WoF sqlite distribution, as used by WofFetcher
+    conn = sqlite3.connect(f"file:{dumpdb}?mode=ro", uri=True)
+    for ident, body in conn.execute("SELECT id, body FROM geojson"):
+        try:
+            rec = json.loads(body)
+        except:
+            continue
+        props = rec.get("properties", {})
+        if props.get("mz:is_current", 1) == 0 or props.get("edtf:deprecated", ""):
+            continue
+        (lng, lat) = (props.get("lbl:longitude", None), props.get("lbl:latitude", None))
+        if lng is None or lat is None:
+            (lng, lat) = (props.get("geom:longitude", None), props.get("geom:latitude", None))
+        geom = rec.get("geometry", {})
+        bbox = rec.get("bbox", None)
+        if not geom or not geom.get("type") in ["Polygon", "MultiPolygon"]:
+            geom = None
+        yield (str(ident), props.get("wof:name", ""), props.get("wof:placetype", ""), lng, lat, bbox, geom)
+    conn.close()
+
+
+def geonames_places(path):
+    # allCountries.txt: id, name, ..., latitude, longitude, feature class, feature code
+    with open_dump(path) as fh:
+        for l in fh:
+            cols = l.split(b"\t", 8)
+            try:
+                (lat, lng) = (float(cols[4]), float(cols[5]))
+            except:
+                continue
+            yield (cols[0].decode("utf-8"), cols[1].decode("utf-8"), cols[7].decode("utf-8"), lng, lat, None, None)
+
+
+def pleiades_places(path):
+    # pleiades-places-latest.json.gz
+    with open_dump(path) as fh:
+        data = json.loads(fh.read())
+    for rec in data.get("@graph", []):
+        point = rec.get("reprPoint", None) or [None, None]
+        bbox = rec.get("bbox", None) or rec.get("boundingBox", None)
+        geom = rec.get("geometry", None)
+        if geom and not geom.get("type") in ["Polygon", "MultiPolygon"]:
+            geom = None
+        typ = ",".join(x.rsplit("/", 1)[-1] for x in rec.get("placeTypeURIs", []))
+        yield (str(rec.get("id", "")), rec.get("title", ""), typ, point[0], point[1], bbox, geom)
+
+
+def get_spatial_index(config):
+    # Index for a source config that should add its places while loading, or None
+    path = config.get("spatialIndexPath", None)
+    if path:
+        return SpatialIndex({"path": path})
+    return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the local spatial index of places")
+    parser.add_argument("--path", required=True, help="Index to build, eg places.sqlite in temp_dir")
+    parser.add_argument("--wof", help="WoF sqlite dump")
+    parser.add_argument("--geonames", help="GeoNames allCountries.txt")
+    parser.add_argument("--pleiades", help="Pleiades places json(.gz)")
+    args = parser.parse_args()
+
+    index = SpatialIndex({"path": args.path})
+    if args.wof:
+        index.build("wof", wof_places(args.wof))
+    if args.geonames:
+        index.build("geonames", geonames_places(args.geonames))
+    if args.pleiades:
+        index.build("pleiades", pleiades_places(args.pleiades))
+    print(f"{args.path}: {len(index)} places")
+    sys.exit(0)
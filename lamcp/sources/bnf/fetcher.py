@@ -1,6 +1,6 @@
 
-import requests
-from lux_pipeline.process.base.fetcher import Fetcher
+from ..base.fetcher import Fetcher
+from ..base.network import circuit_breaker, get_host
 
 
 class BnfXmlFetcher(Fetcher):
@@ -12,9 +12,12 @@ class BnfXmlFetcher(Fetcher):
             return None
 
         url = self.make_fetch_uri(identifier)
+        if not url or self.check_networkmap(url, identifier) is not None:
+            return None
 
         try:
-            resp = requests.get(url, headers=self.headers, timeout=self.timeout)
+            with self.limiter.limit():
+                resp = self.session.get(url, headers=self.headers, timeout=self.timeout)
         except:
             return None
         if resp.history:
@@ -27,16 +30,18 @@ class BnfXmlFetcher(Fetcher):
             return None
 
         try:
-            resp = requests.get(url, headers=self.headers, 
-                allow_redirects=self.allow_redirects, timeout=self.timeout)
+            with self.limiter.limit():
+                resp = self.session.get(url, headers=self.headers, 
+                    allow_redirects=self.allow_redirects, timeout=self.timeout)
         except:
             # Failed to open network, resolve DNS, or similar
             # FIXME: log
             print(f"Failed to get response from {url}")
-            self.networkmap[url] = 0
+            self.record_failure(url, 0)
             return None
         if resp.status_code == 200:
             # Got a response
+            circuit_breaker.record_success(get_host(url))
             ct = resp.headers.get('content-type', '')
             expected_ct = "application/rdf+xml"
             data = {'xml': resp.text}            
@@ -44,7 +49,7 @@ class BnfXmlFetcher(Fetcher):
         else:
             # URL returned fail status
             print(f"Got failure {resp.status_code} from {url}")
-            self.networkmap[url] = resp.status_code
+            self.record_failure(url, resp.status_code)
             return None
 
         # return a real record structure
@@ -62,13 +67,11 @@ class BnfFetcher(Fetcher):
         url = self.make_fetch_uri(identifier)
         url = url.replace("/12148/12148/", "/12148/")
 
-        if url in self.networkmap:
-            return None
-
-        if not url:
+        if not url or self.check_networkmap(url, identifier) is not None:
             return None
         try:
-            resp = requests.get(url)
+            with self.limiter.limit():
+                resp = self.session.get(url)
         except:
             return None
         if resp.history:
@@ -82,16 +85,18 @@ class BnfFetcher(Fetcher):
 
         try:
             print(f"Fetching {url}")
-            resp = requests.get(url, headers=self.headers, 
-                allow_redirects=self.allow_redirects, timeout=self.timeout)
+            with self.limiter.limit():
+                resp = self.session.get(url, headers=self.headers, 
+                    allow_redirects=self.allow_redirects, timeout=self.timeout)
         except:
             # Failed to open network, resolve DNS, or similar
             # FIXME: log
             print(f"Failed to get response from {url}")
-            self.networkmap[url] = 0
+            self.record_failure(url, 0)
             return None
         if resp.status_code == 200:
             # Got a response
+            circuit_breaker.record_success(get_host(url))
             ct = resp.headers.get('content-type', '')
             if 'json' in ct:
                 # good to store
@@ -108,7 +113,7 @@ class BnfFetcher(Fetcher):
             # URL returned fail status
             # FIXME: log
             print(f"Got failure {resp.status_code} from {url}")
-            self.networkmap[url] = resp.status_code
+            self.record_failure(url, resp.status_code)
             return None
 
         if '@context' in data:
@@ -1,6 +1,6 @@
 
-import requests
-from lux_pipeline.process.base.fetcher import Fetcher
+from ..base.fetcher import Fetcher
+from ..base.network import circuit_breaker, get_host
 
 class DnbFetcher(Fetcher):
     def validate_identifier(self, identifier):
@@ -17,24 +17,26 @@ class DnbFetcher(Fetcher):
             # try the d-nb.info version
             newurl = f"https://d-nb.info/gnd/{identifier}/about/lds.jsonld"
 
-            if newurl in self.networkmap:
+            if self.check_networkmap(newurl, identifier) is not None:
                 return None
 
             # FIXME: This should also be more robust
             try:
                 print(f"Fetching {newurl}")
-                resp = requests.get(newurl)
+                with self.limiter.limit():
+                    resp = self.session.get(newurl)
             except:
                 # FIXME: Log network failure
-                self.networkmap[newurl] = 0
+                self.record_failure(newurl, 0)
                 return None
             if resp.status_code == 200:
+                circuit_breaker.record_success(get_host(newurl))
                 data = resp.json()
                 if type(data) == list:
                     data = {'list': data}
                 return {'data': data, 'identifier': identifier, 'source': self.name}
             else:
-                self.networkmap[newurl] = resp.status_code
+                self.record_failure(newurl, resp.status_code)
                 return None                
         else:
             return result
@@ -4,6 +4,7 @@ import ujson as json
 import gzip
 import time
 from lux_pipeline.process.base.loader import Loader
+from ..base.loader import DumpLoader
 
 
 class DnbLoader(Loader):
@@ -25,7 +26,7 @@ class DnbLoader(Loader):
 
 
 
-class OldDnbLoader:
+class OldDnbLoader(DumpLoader):
 
     def __init__(self, config):
         Loader.__init__(self, config)
@@ -76,28 +77,27 @@ class OldDnbLoader:
                 print(f"Got {outer} in outer")
 
 
-    def load(self):
+    def load(self, slicen=None, maxSlice=None):
 
         # load the subject headings
-        self.load_sachbegriff()
+        if not self.start_load(slicen, maxSlice):
+            self.load_sachbegriff()
 
         # And now load the entityfacts
 
-        with gzip.open(self.in_path) as fh:
-            start = time.time()
-            x = 0 
-            done_x = 0
-            l = 1
-            while l:
-                l = fh.readline()
-                if not l:
-                    break
+        start = time.time()
+        x = 0 
+        done_x = 0
+        for n, work in self.iter_work(slicen, maxSlice):
+            for l in self.read_lines(work):
                 l = l.decode("utf-8")
                 if l[0] in ['[', ',']:
                     l = l[1:]
                 elif l[-1] == ']':
                     l = l[:-1]            
                 l = l.strip()
+                if not l:
+                    continue
 
                 # Find id and check if already exists before processing JSON
                 what = self.get_identifier_raw(l)
@@ -120,4 +120,7 @@ class OldDnbLoader:
                     xps = x/t
                     ttls = self.total / xps
                     print(f"{x} in {t} = {xps}/s --> {ttls} total ({ttls/3600} hrs)")
+            self.out_cache.commit()
+            self.write_checkpoint(slicen, n + 1)
         self.out_cache.commit()
+        self.clear_checkpoint(slicen)
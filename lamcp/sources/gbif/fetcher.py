@@ -1,5 +1,5 @@
 
-from lux_pipeline.process.base.fetcher import Fetcher
+from ..base.fetcher import Fetcher
 
 # URI is https://www.gbif.org/species/212
 # API is https://api.gbif.org/v1/species/212
@@ -1,11 +1,16 @@
-from lux_pipeline.process.base.fetcher import Fetcher
+from ..base.fetcher import Fetcher
+from ..base.network import circuit_breaker, get_host
 
 # Store the raw RDF/XML as a value inside the JSON blob
 # Then mapper can sort it out
 class GnFetcher(Fetcher):
-    
+    def __init__(self, config):
+        Fetcher.__init__(self, config)
+        # GeoNames limits are per hour, so back off for that long
+        self.throttle_cooldown = config.get("throttle_cooldown", 3600)
+
     def post_process(self, data, identifier):
         if 'Please throttle your requests' in str(data):
-            self.allow_network = False
+            circuit_breaker.trip(get_host(self.fetch_uri), self.throttle_cooldown)
             return None
         return data
@@ -1,7 +1,11 @@
 from lux_pipeline.process.base.loader import Loader
-import os
+from ..base.loader import DumpLoader
+from ..base.spatial import get_spatial_index
 from cromulent import model, vocab
+from array import array
+import numpy as np
 import time
+import os
 
 # The zip file has a CSV, but the names don't have languages :(
 # Maybe useful for reconciliation though (see LCNAF)
@@ -28,51 +32,142 @@ import time
 #modification date : date of last modification in yyyy-MM-dd format
 
 
-class GnLoader(Loader):     
+def load_hierarchy(path):
+    # hierarchy.txt (parent, child, type) as two int arrays: the children,
+    # sorted, and their parents. Much smaller than a dict of strings, and
+    # a chunk's worth of parents is one searchsorted
+    parents = array('q')
+    children = array('q')
+    with open(path, 'rb') as fh:
+        for l in fh:
+            (p, c, t) = l.split(b'\t', 2)
+            parents.append(int(p))
+            children.append(int(c))
+    parents = np.frombuffer(parents, dtype=np.int64)
+    children = np.frombuffer(children, dtype=np.int64)
+    order = np.argsort(children, kind='stable')
+    (children, parents) = (children[order], parents[order])
+    # As with the dict, the last parent listed for a child wins
+    last = np.ones(len(children), dtype=bool)
+    last[:-1] = children[1:] != children[:-1]
+    return (children[last], parents[last])
+
+
+class GnLoader(DumpLoader, Loader):
 
     def __init__(self, config): 
         Loader.__init__(self, config)
+        self.config = config
+        self.configs = config['all_configs']
         self.namespace = config['namespace']
-        hiers = os.path.join(self.in_path, 'hierarchy.txt')
+        # Loader's in_path is the directory; DumpLoader reads the dump itself
+        self.in_dir = self.in_path
+        self.in_path = os.path.join(self.in_dir, 'allCountries.txt')
+        hiers = os.path.join(self.in_dir, 'hierarchy.txt')
         if os.path.exists(hiers):
-            with open(hiers) as fh:
-                self.child_parent = {}
-                for l in fh.readlines():
-                    (p,c,t) = l.split('\t')
-                    self.child_parent[c] = p
-        self.total = 12363290
+            (self.hier_children, self.hier_parents) = load_hierarchy(hiers)
+        else:
+            self.hier_children = self.hier_parents = np.zeros(0, dtype=np.int64)
+        self.total = config.get('totalRecords', 12363290)
+        # Parallel load: number of worker processes, and bytes of dump per chunk of work
+        self.processes = config.get('load_processes', os.cpu_count() or 1)
+        self.load_chunk_bytes = config.get('load_chunk_bytes', 1 << 23)
+        # Places also go into the local spatial index, if configured
+        self.spatial_index = get_spatial_index(config)
+        self.templates = None
+
+    def make_templates(self):
+        # Every record is the same shape, so build one with cromulent to get
+        # the structure (and the factory's settings), and fill in the values
+        # per row rather than building and serializing the object graph
+        top = model.Place(ident="x", label="x")
+        top.identified_by = vocab.PrimaryName(content="x")
+        top.identified_by = vocab.AlternateName(content="x")
+        top.defined_by = "x"
+        top.part_of = model.Place(ident="x")
+        js = model.factory.toJSON(top)
+        names = []
+        for nm in js['identified_by']:
+            nm = {k: v for (k, v) in nm.items() if k != 'id'}
+            names.append(nm)
+        part = {k: v for (k, v) in js['part_of'][0].items()}
+        return (list(js.keys()), js.get('@context', None), js['type'], names[0], names[1], part)
+
+    def get_parents(self, gnids):
+        # parent id (or 0) for each of gnids
+        if not len(self.hier_children):
+            return np.zeros(len(gnids), dtype=np.int64)
+        ids = np.array(gnids, dtype=np.int64)
+        idx = np.searchsorted(self.hier_children, ids)
+        idx[idx >= len(self.hier_children)] = 0
+        found = self.hier_children[idx] == ids
+        return np.where(found, self.hier_parents[idx], 0)
+
+    def process_lines(self, lines):
+        # Runs in the worker processes
+        # Returns (gnid, record) pairs, and rows for the spatial index
+        if self.templates is None:
+            self.templates = self.make_templates()
+        (keys, context, typ, primary, alternate, part) = self.templates
+        ns = self.namespace
+        rows = []
+        for l in lines:
+            stuff = l.decode('utf-8').split('\t')
+            if len(stuff) > 5 and stuff[0].isdigit():
+                rows.append(stuff)
+        parents = self.get_parents([int(r[0]) for r in rows]).tolist()
+        records = []
+        places = []
+        for stuff, parent in zip(rows, parents):
+            gnid = stuff[0]
+            name = stuff[1]
+            lat = stuff[4]
+            lng = stuff[5]
+            names = [dict(primary, content=name)]
+            for a in stuff[3].split(','):
+                if a and a != name:
+                    names.append(dict(alternate, content=a))
+            values = {'@context': context, 'id': f"{ns}{gnid}", 'type': typ, '_label': name, 'identified_by': names}
+            if lat and lng:
+                values['defined_by'] = f"POINT ( {lng} {lat} )"
+                if self.spatial_index is not None:
+                    places.append((gnid, name, stuff[7] if len(stuff) > 7 else '', float(lng), float(lat), None, None))
+            if parent:
+                values['part_of'] = [dict(part, id=f"{ns}{parent}")]
+            records.append((gnid, {k: values[k] for k in keys if k in values}))
+        return (records, places)
+
+    def load(self, slicen=None, maxSlice=None):
+        # allCountries.txt is streamed in chunks to a pool of processes that
+        # build the records, which come back in order to be written in bulk
+        # along with their places for the spatial index
+        self.start_load(slicen, maxSlice)
+        start = time.time()
+        x = 0
+        next_report = 100000
 
-    def load(self):
-        allc = os.path.join(self.in_path, 'allCountries.txt')
-        with open(allc) as fh:
-            start = time.time()
-            x = 0
-            for l in fh.readlines():
-                x += 1
-                stuff = l.split('\t')
-                gnid = stuff[0]
-                if not gnid in self.out_cache:
-                    name = stuff[1]
-                    alt = stuff[3]
-                    alts = alt.split(',')
-                    lat = stuff[4]
-                    lng = stuff[5]
-                    parent = self.child_parent.get(gnid, None)
+        if self.spatial_index is not None:
+            self.spatial_index.start_bulk()
+        self.out_cache.start_bulk()
+        for n, records, places in self.run_work(slicen, maxSlice):
+            for gnid, data in records:
+                self.out_cache.set_bulk(data, identifier=gnid)
+            if places:
+                self.spatial_index.add_many('geonames', places)
 
-                    ident = f"{self.namespace}{gnid}"
-                    top = model.Place(ident=ident,label=name)
-                    top.identified_by = vocab.PrimaryName(content=name)
-                    for a in alts:
-                        if a != name:
-                            top.identified_by = vocab.AlternateName(content=a)
-                    if lat and lng:
-                        top.defined_by = f"POINT ( {lng} {lat} )"
-                    if parent:
-                        top.part_of = model.Place(ident=f"{self.namespace}{parent}")
-                    data = model.factory.toJSON(top)
-                    self.out_cache[gnid] = data
-                    if not x % 10000:
-                        t = time.time() - start
-                        xps = x/t
-                        ttls = self.total / xps
-                        print(f"{x} in {t} = {xps}/s --> {ttls} total ({ttls/3600} hrs)")
+            x += len(records)
+            if x >= next_report:
+                next_report += 100000
+                t = time.time() - start
+                xps = x/t
+                ttls = self.total / xps
+                print(f"{x} in {t} = {xps}/s --> {ttls} total ({ttls/3600} hrs)")
+                self.out_cache.end_bulk()
+                self.out_cache.commit()
+                self.write_checkpoint(slicen, n + 1)
+                self.out_cache.start_bulk()
+        self.out_cache.end_bulk()
+        self.out_cache.commit()
+        if self.spatial_index is not None:
+            self.spatial_index.end_bulk()
+        self.clear_checkpoint(slicen)
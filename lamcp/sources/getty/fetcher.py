@@ -24,7 +24,8 @@ class GettyFetcher(Fetcher):
 
             try:
                 print(f"Fetching {newurl}")
-                resp = self.session.get(newurl)
+                with self.limiter.limit():
+                    resp = self.session.get(newurl)
             except Exception as e:
                 # FIXME: Log network failure
                 print(e)
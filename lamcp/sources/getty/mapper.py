@@ -1,6 +1,7 @@
 from cromulent import model, vocab
-from ..base.mapper import Mapper
+from ..base.mapper import Mapper, get_constants
 from ..base.date_utils import test_birth_death, make_datetime
+from .resolver import GettyResolver
 import datetime
 import logging
 
@@ -25,11 +26,7 @@ class GettyMapper(Mapper):
         }
         self.ignore_name_classifications = ["http://vocab.getty.edu/term/type/UsedForTerm"]
 
-        self.statements = {}
-        for name, thing in vocab.inst_js.items():  ### FIXME: This is terrible and will break
-            if "metatype" in thing and thing["metatype"] == "brief text":
-                self.statements[thing["id"]] = getattr(vocab, name)
-
+        self.statements = dict(get_constants().statement_classes)
         self.statements["300080102"] = vocab.BiographyStatement
         self.statements["300435416"] = vocab.Description
         self.ignore_statements = ["300418049"]
@@ -45,7 +42,7 @@ class GettyMapper(Mapper):
         self.active_flag = "http://vocab.getty.edu/aat/300393177"
         self.role_flag = "http://vocab.getty.edu/aat/300435108"
 
-        self.aat_language_ids = [x.id for x in self.process_langs.values()]
+        self.aat_language_ids = get_constants().aat_language_ids
 
     def process_getty_name(self, js):
         if not "content" in js:
@@ -569,6 +566,9 @@ class GettyMagicMapper(Mapper):
         self.tgn = TgnMapper(cfg)
         self.aat = AatMapper(cfg)
 
+    def make_resolver(self, config):
+        return GettyResolver(self, config)
+
     def transform(self, record, rectype, reference=False):
         ident = record["identifier"]
         if ident.startswith("aat/"):
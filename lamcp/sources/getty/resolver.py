@@ -0,0 +1,80 @@
+import ujson as json
+import logging
+from ..base.reference import ReferenceResolver
+
+logger = logging.getLogger("lamcp")
+
+
+class GettyResolver(ReferenceResolver):
+    # Ask the GVP endpoint for just the preferred label and type of a batch
+    # of aat/, ulan/ and tgn/ identifiers, rather than the full JSON-LD
+
+    def __init__(self, mapper, config):
+        ReferenceResolver.__init__(self, mapper, config)
+        self.sparql_uri = config.get("reference_sparql", "http://vocab.getty.edu/sparql.json")
+        self.base = "http://vocab.getty.edu/"
+
+    def make_query(self, identifiers):
+        values = " ".join([f"<{self.base}{x}>" for x in identifiers])
+        return f"""PREFIX gvp: <http://vocab.getty.edu/ontology#>
+PREFIX xl: <http://www.w3.org/2008/05/skos-xl#>
+SELECT ?s ?label ?type WHERE {{
+  VALUES ?s {{ {values} }}
+  OPTIONAL {{ ?s gvp:prefLabelGVP/xl:literalForm ?label }}
+  OPTIONAL {{ ?s a ?type . FILTER(?type IN (gvp:PersonConcept, gvp:GroupConcept)) }}
+}}"""
+
+    def get_class(self, identifier, label, typ):
+        (vocab, num) = identifier.split("/", 1)
+        if vocab == "tgn":
+            return "Place"
+        elif vocab == "ulan":
+            if typ.endswith("GroupConcept"):
+                return "Group"
+            elif typ.endswith("PersonConcept"):
+                return "Person"
+            return None
+        elif vocab == "aat":
+            data = {"id": f"{self.base}{identifier}", "type": "Type", "_label": label}
+            return self.mapper.aat.guess_type(data).__name__
+        return None
+
+    def lookup_many(self, identifiers):
+        identifiers = [x for x in identifiers if x.split("/", 1)[0] in ["aat", "ulan", "tgn"]]
+        if not identifiers:
+            return {}
+        try:
+            with self.limiter.limit():
+                resp = self.get_session().get(
+                    self.sparql_uri, params={"query": self.make_query(identifiers)}, timeout=self.timeout
+                )
+            if resp.status_code != 200:
+                raise ValueError(f"status {resp.status_code}")
+            rows = json.loads(resp.text)["results"]["bindings"]
+        except Exception as e:
+            logger.error(f"Getty reference query failed, falling back to full records: {e}")
+            return ReferenceResolver.lookup_many(self, identifiers)
+
+        labels = {}
+        types = {}
+        for row in rows:
+            ident = row["s"]["value"].replace(self.base, "")
+            if "label" in row:
+                labels[ident] = row["label"]["value"]
+            if "type" in row:
+                types[ident] = row["type"]["value"]
+
+        results = {}
+        fallback = []
+        for ident in identifiers:
+            if not ident in labels:
+                fallback.append(ident)
+                continue
+            cls = self.get_class(ident, labels[ident], types.get(ident, ""))
+            if cls is None:
+                fallback.append(ident)
+            else:
+                results[ident] = (cls, labels[ident])
+        if fallback:
+            results.update(ReferenceResolver.lookup_many(self, fallback))
+        return results
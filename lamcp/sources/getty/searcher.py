@@ -34,8 +34,11 @@ class GettySearcher(Searcher):
 
         sparql = SPARQLWrapper("http://vocab.getty.edu/sparql/")
         sparql.setReturnFormat(JSON)
+        # Don't leave threads behind once the federated search has given up
+        sparql.setTimeout(self.config.get("search_deadline", 10))
         sparql.setQuery(q)
-        res = sparql.query().convert()
+        with self.limiter.limit():
+            res = sparql.query().convert()
         results = []
         for item in res["results"]["bindings"]:
             results.append(item["subject"]["value"])
@@ -1,5 +1,5 @@
 
-from lux_pipeline.process.base.fetcher import Fetcher
+from ..base.fetcher import Fetcher
 
 #LGBTQ+ adoption: https://homosaurus.org/v3/homoit0000809.jsonld
 #
@@ -1,7 +1,7 @@
 
 # Base fetcher does the right thing so far
 
-from lux_pipeline.process.base.fetcher import Fetcher
+from ..base.fetcher import Fetcher
 from SPARQLWrapper import SPARQLWrapper, JSON
 
 
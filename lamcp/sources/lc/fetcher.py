@@ -1,5 +1,5 @@
 
-from lux_pipeline.process.base.fetcher import Fetcher
+from ..base.fetcher import Fetcher
 
 prefx = {
     "skos":"http://www.w3.org/2004/02/skos/core#",
@@ -1,6 +1,11 @@
 from lux_pipeline.process.base.index_loader import IndexLoader
+from ..base.codec import compact_store
 
 class LCIndexLoader(IndexLoader):
+    def get_storage(self):
+        (index, eqindex) = IndexLoader.get_storage(self)
+        return (index, compact_store(eqindex, self.config))
+
     def acquire_record(self, record):
         if "data" in record:
             rec = record["data"]
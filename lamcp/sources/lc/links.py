@@ -0,0 +1,70 @@
+import os
+import time
+import sqlite3
+import logging
+from ..base.dump import open_dump
+from ..base.codec import encode, decode
+
+logger = logging.getLogger("lamcp")
+
+# LC's external_links.nt, as an on-disk map of LC identifier --> close and
+# exact external authorities, built by streaming the triples once and then
+# looked up per record while loading, instead of holding it all in memory.
+# Identifiers and targets are stored in the compact form from codec.py
+
+
+class ExternalLinks(object):
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS links (ident BLOB, target BLOB, PRIMARY KEY (ident, target)) WITHOUT ROWID")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS source (path TEXT, size INTEGER, mtime REAL)")
+
+    def is_current(self, nt_path):
+        st = os.stat(nt_path)
+        row = self.conn.execute("SELECT path, size, mtime FROM source").fetchone()
+        return row is not None and tuple(row) == (nt_path, st.st_size, st.st_mtime)
+
+    def build(self, nt_path, batch=100000):
+        start = time.time()
+        self.conn.execute("PRAGMA synchronous=OFF")
+        self.conn.execute("DELETE FROM links")
+        self.conn.execute("DELETE FROM source")
+        n = 0
+        rows = []
+        with open_dump(nt_path) as fh:
+            for line in fh:
+                # FIXME:  This needs to test for narrower / broader external authority and omit
+                if line.startswith(b"<http://id.loc.gov/authorities/") and (
+                    b"CloseExternalAuthority" in line or b"ExactExternalAuthority" in line
+                ):
+                    # Split into triples
+                    (s, p, o) = line.decode("utf-8").rstrip()[:-1].split(" ", 2)
+                    identifier = s.rsplit("/", 1)[1][:-1]
+                    tgt = o.strip()[1:-1]
+                    rows.append((encode(identifier), encode(tgt)))
+                    if len(rows) >= batch:
+                        self.conn.executemany("INSERT OR IGNORE INTO links VALUES (?, ?)", rows)
+                        n += len(rows)
+                        rows = []
+        if rows:
+            self.conn.executemany("INSERT OR IGNORE INTO links VALUES (?, ?)", rows)
+            n += len(rows)
+        st = os.stat(nt_path)
+        self.conn.execute("INSERT INTO source VALUES (?, ?, ?)", (nt_path, st.st_size, st.st_mtime))
+        self.conn.commit()
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        print(f"Loaded {n} external links in {time.time() - start}")
+
+    def get(self, identifier, default=None):
+        targets = [decode(t) for (t,) in self.conn.execute("SELECT target FROM links WHERE ident = ?", (encode(identifier),))]
+        return targets if targets else default
+
+    def __getitem__(self, identifier):
+        targets = self.get(identifier)
+        if targets is None:
+            raise KeyError(identifier)
+        return targets
+
+    def __contains__(self, identifier):
+        return self.conn.execute("SELECT 1 FROM links WHERE ident = ? LIMIT 1", (encode(identifier),)).fetchone() is not None
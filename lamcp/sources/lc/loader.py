@@ -1,5 +1,6 @@
 
 from lux_pipeline.process.base.loader import Loader
+from .links import ExternalLinks
 import re
 import os
 aboutre = re.compile('"about": "(.+?)"')
@@ -10,7 +11,6 @@ class LcLoader(Loader):
     # but present in the individual records from LC
     # this code syncs the dump file records with the online record
     def old_load(self):
-        self.extAuths = {}
         # https://id.loc.gov/download/externallinks.nt.zip 
         elp = self.config.get('externalLinksPath', 'external_links.nt')
         if not elp.startswith('/'):
@@ -20,19 +20,11 @@ class LcLoader(Loader):
                 if not os.path.exists(elp2):
                     raise ValueError("Could not find LC's external_links file")
             elp = elp2
-        with open(elp) as fh:
-            for line in fh.readlines():
-                # FIXME:  This needs to test for narrower / broader external authority and omit
-                if line.startswith('<http://id.loc.gov/authorities/') and \
-                    ("CloseExternalAuthority" in line or "ExactExternalAuthority" in line):
-                    # Split into triples
-                    (s,p,o) = line[:-2].split(' ', 2)
-                    identifier = s.rsplit('/', 1)[1][:-1]
-                    tgt = o.strip()[1:-1]
-                    try:
-                        self.extAuths[identifier].append(tgt)
-                    except:
-                        self.extAuths[identifier] = [tgt]
+        # Links go to an on-disk map, rebuilt only when the file changes
+        dbp = self.config.get('externalLinksDbPath', os.path.join(self.config['all_configs'].temp_dir, 'lc_external_links.sqlite'))
+        self.extAuths = ExternalLinks(dbp)
+        if not self.extAuths.is_current(elp):
+            self.extAuths.build(elp)
         return Loader.load(self)
 
     def get_identifier_raw(self, l):
@@ -70,8 +62,8 @@ class LcLoader(Loader):
             return None
 
         # Add in madsrdf:hasCloseExternalAuthority to the record from extAuths        
-        if ident in self.extAuths:
-            closeAuths = self.extAuths[ident]
+        closeAuths = self.extAuths.get(ident)
+        if closeAuths:
             graph = js['@graph']
             if type(graph) != list:
                 graph = [graph]
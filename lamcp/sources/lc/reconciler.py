@@ -1,7 +1,12 @@
 from lux_pipeline.process.base.reconciler import LmdbReconciler
+from ..base.codec import compact_store
 
 
 class LcshReconciler(LmdbReconciler):
+    def __init__(self, config):
+        LmdbReconciler.__init__(self, config)
+        self.id_index = compact_store(getattr(self, "id_index", None), config)
+
     def should_reconcile(self, rec, reconcileType="all"):
         if not LmdbReconciler.should_reconcile(self, rec, reconcileType):
             return False
@@ -31,6 +36,10 @@ class LcshReconciler(LmdbReconciler):
 
 
 class LcnafReconciler(LmdbReconciler):
+    def __init__(self, config):
+        LmdbReconciler.__init__(self, config)
+        self.id_index = compact_store(getattr(self, "id_index", None), config)
+
     def should_reconcile(self, rec, reconcileType="all"):
         if not LmdbReconciler.should_reconcile(self, rec, reconcileType):
             return False
@@ -1,7 +1,6 @@
 from ..base.searcher import Searcher
 from urllib.parse import urlencode
 import json
-import requests
 
 
 class LuxSearcher(Searcher):
@@ -22,7 +21,8 @@ class LuxSearcher(Searcher):
 
         qec = urlencode({"q": json.dumps(q)})
         qurl += qec
-        resp = requests.get(qurl, headers=self.headers)
+        with self.limiter.limit():
+            resp = self.session.get(qurl)
 
         recs = []
 
@@ -1,13 +1,14 @@
-import requests
+from ..base.network import make_session
 
 
 class Fetcher:
     def __init__(self, config):
         self.endpoint = "https://collectionapi.metmuseum.org/public/collection/v1/objects/{identifier}"
+        self.session = make_session()
 
     def fetch(self, identifier):
         # "https://collectionapi.metmuseum.org/public/collection/v1/objects/nnnnnn"
         # --> {custom json format}
-        response = requests.get(self.endpoint.format({"identifier": identifier}))
+        response = self.session.get(self.endpoint.format({"identifier": identifier}))
         response.raise_for_status()
         return {"data": response.json(), "source": "met"}
@@ -1,14 +1,15 @@
-import requests
+from ..base.network import make_session
 
 
 class Searcher:
     def __init__(self, config):
         self.endpoint = "https://collectionapi.metmuseum.org/public/collection/v1/search"
+        self.session = make_session()
 
     def harvest(self, q):
         # "https://collectionapi.metmuseum.org/public/collection/v1/objects?metadataDate=YYYY-MM-DD"
         # --> {"total": int, "objectIDs": List[int]}
         # if metadataDate, then only those modified since given date
-        response = requests.get(self.endpoint, params={"q": q})
+        response = self.session.get(self.endpoint, params={"q": q})
         response.raise_for_status()
         return response.json()["objectIDs"]
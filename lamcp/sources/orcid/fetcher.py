@@ -1,4 +1,4 @@
-from lux_pipeline.process.base.fetcher import Fetcher
+from ..base.fetcher import Fetcher
 
 class OrcidFetcher(Fetcher):
     def fetch(self, identifier):
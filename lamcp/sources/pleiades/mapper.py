@@ -1,5 +1,6 @@
 # from lux_pipeline.process.base.mapper import Mapper
 from ..base.mapper import Mapper
+from ..base.geometry import GeometryWriter
 from cromulent import model, vocab
 import re
 
@@ -8,6 +9,7 @@ class PleiadesMapper(Mapper):
     def __init__(self, config):
         Mapper.__init__(self, config)
         self.factory.auto_assign_id = False
+        self.geometry = GeometryWriter(config)
         # pass
 
     def guess_type(self, data):
@@ -17,28 +19,9 @@ class PleiadesMapper(Mapper):
         # Default to Place for everything else, including records with placeTypeURIs
         return model.Place
 
-    def geojson_to_wkt(self, geom):
-        """Convert a GeoJSON geometry dict to a WKT string."""
-        t = geom.get("type")
-        coords = geom.get("coordinates")
-        if t == "Point":
-            return f"POINT ({coords[0]} {coords[1]})"
-        elif t == "Polygon":
-            # Polygon: list of linear rings (first is exterior)
-            rings = []
-            for ring in coords:
-                rings.append(", ".join(f"{x} {y}" for x, y in ring))
-            return f"POLYGON (({rings[0]}))"
-        elif t == "MultiPolygon":
-            polys = []
-            for poly in coords:
-                rings = []
-                for ring in poly:
-                    rings.append(", ".join(f"{x} {y}" for x, y in ring))
-                polys.append(f"(({rings[0]}))")
-            return f"MULTIPOLYGON ({', '.join(polys)})"
-        # Add more types as needed
-        return None
+    def geojson_to_wkt(self, geom, identifier=None):
+        """Convert a GeoJSON geometry dict to a WKT string, simplified and rounded."""
+        return self.geometry.to_wkt(geom, identifier)
 
     def bbox_to_wkt(self, bbox):
         """Convert a bounding box [minLon, minLat, maxLon, maxLat] to a WKT Polygon string."""
@@ -154,7 +137,7 @@ class PleiadesMapper(Mapper):
         # Add geospatial data: geometry, bbox, reprPoint (in that order)
         wkt = None
         if "geometry" in rec and rec["geometry"]:
-            wkt = self.geojson_to_wkt(rec["geometry"])
+            wkt = self.geojson_to_wkt(rec["geometry"], recid)
         elif "bbox" in rec and rec["bbox"]:
             wkt = self.bbox_to_wkt(rec["bbox"])
         elif "boundingBox" in rec and rec["boundingBox"]:
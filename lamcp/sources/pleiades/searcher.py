@@ -1,6 +1,5 @@
 from ..base.searcher import Searcher
 from lxml import etree
-import requests
 
 
 # https://pleiades.stoa.org/search_rss?portal_type%3Alist=Place&review_state%3Alist=published&Title=Zucchabar
@@ -13,7 +12,8 @@ class PleiadesSearcher(Searcher):
 
     def search(self, query, lang="", entity_type=""):
         qurl = self.endpoint.format(QUERY=query, LANG=lang, ENTITY_TYPE=entity_type)
-        resp = requests.get(qurl, headers=self.headers)
+        with self.limiter.limit():
+            resp = self.session.get(qurl)
         if resp.status_code == 200:
             data = resp.text
         else:
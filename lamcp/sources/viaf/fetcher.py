@@ -1,4 +1,5 @@
-from lux_pipeline.process.base.fetcher import Fetcher
+from ..base.fetcher import Fetcher
+from ..base.network import circuit_breaker, get_host
 import requests
 
 class ViafFetcher(Fetcher):
@@ -9,17 +10,24 @@ class ViafFetcher(Fetcher):
             return None
 
         url = self.make_fetch_uri(identifier)
+        known = self.check_networkmap(url, identifier)
+        if type(known) == str:
+            return self.fetch(known)
+        elif known is not None:
+            return None
         try:
             print(f"Fetching {url}")
-            resp = self.session.get(url, allow_redirects=False)
+            with self.limiter.limit():
+                resp = self.session.get(url, allow_redirects=False)
         except:
             # Failed to open network, resolve DNS, or similar
             # FIXME: log
             print(f"Failed to get response from {url}")
-            self.networkmap[url] = 0
+            self.record_failure(url, 0)
             return None
         if resp.status_code == 200:
             # Got a response
+            circuit_breaker.record_success(get_host(url))
             ct = resp.headers.get('content-type', '')
             if 'xml' in ct:
                 value = resp.text
@@ -64,7 +72,7 @@ class ViafFetcher(Fetcher):
             # URL returned fail status
             # FIXME: log
             print(f"Got failure {resp.status_code} from {url}")
-            self.networkmap[url] = resp.status_code
+            self.record_failure(url, resp.status_code)
             return None
         return {'data': data, 'identifier': identifier, 'source': self.name}
 
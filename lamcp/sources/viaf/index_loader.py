@@ -1,5 +1,7 @@
 from lux_pipeline.process.base.index_loader import IndexLoader
-import gzip
+from ..base.dump import external_sort
+from ..base.codec import compact_store
+import glob
 import time
 import os
 
@@ -20,44 +22,53 @@ class ViafIndexLoader(IndexLoader):
 
         total = 115000000  # approx as of 2024-04
         (index, eqindex) = self.get_storage()
+        eqindex = compact_store(eqindex, self.config)
 
         # Now use data extracted from records
-        # Merge and sort
-        outfn = os.path.join(self.configs.temp_dir, f"viaf_sort_equivs.csv")
-        if not os.path.exists(outfn):
-            fns = os.path.join(self.configs.temp_dir, f"viaf_equivs_*.csv")
-            os.system(f"sort {fns} > {outfn}")
+        # The slice files are merged in sorted order, never holding more than
+        # sort_memory_mb of lines, and written to the index in batches
+        max_bytes = self.config.get("sort_memory_mb", 256) << 20
+        batch_size = self.config.get("index_batch_size", 100000)
+        fns = sorted(glob.glob(os.path.join(self.configs.temp_dir, "viaf_equivs_*.csv")))
 
-        with open(outfn) as fh:
-            l = fh.readline()
-            n = 1
-            start = time.time()
-            updates = {}
-            while l:
-                l = l.strip()
-                # l = l.decode("utf-8")
-                ident, viaf = l.split("\t")
+        start = time.time()
+        n = 0
+        written = 0
+        write_time = 0
+        updates = {}
+        for l in external_sort(fns, self.configs.temp_dir, max_bytes, prefix="viaf_equivs"):
+            n += 1
+            if n == 1:
+                print(f"Sorted runs in {time.time() - start}")
+            l = l.decode("utf-8").strip()
+            ident, viaf = l.split("\t")
 
-                if ":" in ident:
-                    (pfx, ident) = ident.split(":")
-                    ident = ident.replace(" ", "")
-                    if pfx in viaf_prefixes:
-                        if pfx == "LC":
-                            # test for sh vs n
-                            if ident[0] == "s":
-                                pfx = "LCSH"
-                        p = viaf_prefixes[pfx]
-                        updates[f"{p}:{ident}"] = f"{viaf}"
-                l = fh.readline()
-                n += 1
-                if not n % 100000:
-                    durn = time.time() - start
-                    nps = n / durn
-                    ttld = total / nps
-                    print(f"Read: {n} / {total} in {durn} = {nps} ==> {ttld} secs")
+            if ":" in ident:
+                (pfx, ident) = ident.split(":")
+                ident = ident.replace(" ", "")
+                if pfx in viaf_prefixes:
+                    if pfx == "LC":
+                        # test for sh vs n
+                        if ident[0] == "s":
+                            pfx = "LCSH"
+                    p = viaf_prefixes[pfx]
+                    updates[f"{p}:{ident}"] = f"{viaf}"
+                    if len(updates) >= batch_size:
+                        wstart = time.time()
+                        eqindex.update(updates)
+                        write_time += time.time() - wstart
+                        written += len(updates)
+                        updates = {}
+            if not n % 100000:
+                durn = time.time() - start
+                nps = n / durn
+                ttld = total / nps
+                print(f"Read: {n} / {total} in {durn} = {nps} ==> {ttld} secs; wrote {written} in {write_time} secs")
 
-        start = time.time()
-        eqindex.update(updates)
-        end = time.time()
-        durn = end - start
-        print(f"Load: {durn} = {n/durn}/sec")
+        if updates:
+            wstart = time.time()
+            eqindex.update(updates)
+            write_time += time.time() - wstart
+            written += len(updates)
+        durn = time.time() - start
+        print(f"Load: {n} lines, {written} equivs in {durn} = {n/durn if durn else 0}/sec; writing took {write_time}")
@@ -1,9 +1,11 @@
 from lux_pipeline.process.base.reconciler import LmdbReconciler
+from ..base.codec import compact_store
 
 
 class ViafReconciler(LmdbReconciler):
     def __init__(self, config):
         LmdbReconciler.__init__(self, config)
+        self.id_index = compact_store(getattr(self, "id_index", None), config)
 
         self.viaf_prefixes = {
             "ISNI": "isni",
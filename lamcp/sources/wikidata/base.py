@@ -1,5 +1,70 @@
+from cromulent import model
+
 # Process configs needed for multiple classes
 
+# P31 (instance of) values that are enough to know the class
+# None means the entity isn't anything useful
+useful_instance_of = {
+    "Q4167410": None,  # Disambiguation page ... this isn't anything so abort
+    "Q5": model.Person,  # Human = Person
+    "Q4830453": model.Group,
+    "Q43229": model.Group,
+    "Q16334295": model.Group,
+    "Q167037": model.Group,
+    "Q783794": model.Group,
+    "Q163740": model.Group,
+    "Q1530022": model.Group,
+    "Q34770": model.Language,
+    "Q1288568": model.Language,
+    "Q33742": model.Language,
+    "Q20162172": model.Language,
+    "Q436240": model.Language,
+    "Q2315359": model.Language,
+    "Q515": model.Place,
+    "Q6256": model.Place,
+    "Q3624078": model.Place,
+    "Q7275": model.Place,
+    "Q28575": model.Place,
+    "Q82794": model.Place,
+    "Q3957": model.Place,
+    "Q1549591": model.Place,
+    "Q702492": model.Place,
+    "Q35657": model.Place,
+    "Q106458883": model.Place,
+    "Q34876": model.Place,
+    "Q486972": model.Place,
+    "Q15284": model.Place,
+    "Q532": model.Place,
+    "Q8502": model.Place,
+    "Q484170": model.Place,
+    "Q42744322": model.Place,
+    "Q747074": model.Place,
+    "Q208469": model.MeasurementUnit,
+    "Q1978718": model.MeasurementUnit,
+    "Q11344": model.Material,
+    "Q1371562": model.MeasurementUnit,
+    "Q1790144": model.MeasurementUnit,
+    "Q3647172": model.MeasurementUnit,
+    "Q3550873": model.MeasurementUnit,
+    "Q12418": model.HumanMadeObject,
+    "Q45585": model.HumanMadeObject,
+    "Q175036": model.HumanMadeObject,
+    "Q698487": model.HumanMadeObject,
+    "Q464782": model.HumanMadeObject,
+    "Q83872": model.HumanMadeObject,
+    "Q1044742": model.HumanMadeObject,
+    "Q1404472": model.Period,
+    "Q45805": model.Period,
+    "Q184963": model.Period,
+    "Q11761": model.Period,
+    "Q9903": model.Period,
+    "Q173034": model.Activity,
+    "Q901769": model.Activity,
+    "Q688909": model.Activity,
+    "Q193155": model.Activity,
+    "Q459447": model.Activity,
+}
+
 
 class WdConfigManager(object):
     def __init__(self, config):
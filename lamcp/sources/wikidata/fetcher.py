@@ -1,7 +1,20 @@
+import ujson as json
+import logging
 from lamcp.sources.base.fetcher import Fetcher
+from lamcp.sources.base.network import circuit_breaker, get_host
+
+logger = logging.getLogger("lamcp")
 
 
 class WikidataFetcher(Fetcher):
+    def __init__(self, config):
+        Fetcher.__init__(self, config)
+        self.fetch_many_uri = config.get(
+            "fetch_many", "https://www.wikidata.org/w/api.php?action=wbgetentities&format=json&ids={identifiers}"
+        )
+        # API limit for ids per wbgetentities call
+        self.fetch_many_size = 50
+
     def validate_identifier(self, identifier):
         if not identifier.startswith("Q") or not len(identifier) >= 2 or not identifier[1:].isdigit():
             return False
@@ -12,6 +25,54 @@ class WikidataFetcher(Fetcher):
             identifier = "Q" + identifier[1:]
         return Fetcher.make_fetch_uri(self, identifier)
 
+    def fetch_many(self, identifiers):
+        # Fetch many entities in as few calls as possible
+        # Returns a dict of identifier to record, omitting any that failed
+        results = {}
+        todo = []
+        for ident in identifiers:
+            if ident.startswith("q"):
+                ident = "Q" + ident[1:]
+            if self.validate_identifier(ident) and not ident in todo:
+                todo.append(ident)
+        if not self.enabled or not todo:
+            return results
+
+        for start in range(0, len(todo), self.fetch_many_size):
+            chunk = todo[start : start + self.fetch_many_size]
+            url = self.fetch_many_uri.format(identifiers="|".join(chunk))
+            if not circuit_breaker.allow(get_host(url)):
+                logger.debug(f"Not fetching {url}; circuit open")
+                break
+            try:
+                with self.limiter.limit():
+                    resp = self.session.get(url, timeout=self.timeout)
+            except:
+                logger.error(f"Failed to get response from {url}")
+                self.record_failure(url, 0)
+                continue
+            if resp.status_code != 200:
+                logger.error(f"Got failure {resp.status_code} from {url}")
+                self.record_failure(url, resp.status_code)
+                continue
+            circuit_breaker.record_success(get_host(url))
+            try:
+                entities = json.loads(resp.text).get("entities", {})
+            except:
+                logger.error(f"Failed to parse response from {url}")
+                continue
+            for ident, js in entities.items():
+                if "missing" in js:
+                    self.networkmap[self.make_fetch_uri(ident)] = 404
+                    continue
+                try:
+                    data = self.post_process(js, ident)
+                except Exception as e:
+                    logger.error(f"Failed to process {ident} from {url}: {e}")
+                    continue
+                results[ident] = {"data": data, "source": self.name, "identifier": ident}
+        return results
+
     def post_process(self, js, identifier):
         new = {}
         if "entities" in js:
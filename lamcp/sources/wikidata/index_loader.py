@@ -1,44 +1,122 @@
 
 import os
 import sys
-import ujson as json
 import time
-import gzip
-from .loader import WdLoader
-from .fetcher import WdFetcher
-from .base import WdConfigManager
+import heapq
+from ..base.codec import compact_store
+from ..base.dump import run_parallel, reduce_runs
 from lux_pipeline.process.base.index_loader import IndexLoader
 
 
+def sort_equivs(job):
+	# In a worker: sorted runs of one equivs file, each holding about max_bytes
+	# of it in memory, with the last mapping for a key in the run winning
+	(path, temp_dir, max_bytes) = job
+	name = os.path.basename(path).rsplit('.', 1)[0]
+	runs = []
+	updates = {}
+	size = 0
+
+	def flush():
+		run = os.path.join(temp_dir, f"{name}_{len(runs)}.run")
+		with open(run, 'w') as out:
+			out.writelines([f"{x},{updates[x]}\n" for x in sorted(updates)])
+		runs.append(run)
+		updates.clear()
+
+	with open(path) as fh:
+		for l in fh:
+			l = l.strip()
+			if not l:
+				continue
+			(x,y) = l.rsplit(',', 1)
+			updates[x] = y
+			size += len(l) + 100
+			if size >= max_bytes:
+				flush()
+				size = 0
+	if updates:
+		flush()
+	return runs
+
+
+def read_run(run, order):
+	with open(run) as fh:
+		for l in fh:
+			(x,y) = l.rstrip('\n').rsplit(',', 1)
+			yield (x, order, y)
+
+
+def merge_equivs(runs):
+	# Yield (key, mapping) in key order, with the mapping from the latest run
+	# winning, as sort_equivs does within a run
+	last = None
+	for (x, order, y) in heapq.merge(*[read_run(r, i) for i, r in enumerate(runs)]):
+		if last is not None and x != last[0]:
+			yield last
+		last = (x, y)
+	if last is not None:
+		yield last
+
+
+def merge_equiv_lines(runs):
+	for (x, y) in merge_equivs(runs):
+		yield f"{x},{y}\n".encode('utf-8')
+
+
 class WdFileIndexLoader(IndexLoader):
-	# Load diffs in the normal load-csv-map way
-	def load(self):
+	# Load the equivs that WdLoader wrote (the diffs are left for the reconciler)
+	# Each slice file is deduplicated and sorted in its own worker, into runs
+	# of bounded size; the runs are then merged, so the index gets its keys
+	# in order and in big batches
+
+	def get_files(self, prefix):
+		files = [os.path.join(self.configs.temp_dir, x) for x in os.listdir(self.configs.temp_dir) if x.startswith(prefix) and x.endswith('.csv')]
+		files.sort()
+		return files
+
+	def get_max_merge(self):
+		# Most runs to have open at once when merging
+		return self.config.get('max_merge_runs', 256)
+
+	def sort_files(self, fn, files):
+		max_bytes = self.config.get('sort_memory_mb', 256) << 20
+		processes = self.config.get('load_processes', os.cpu_count() or 1)
+		jobs = [(x, self.configs.temp_dir, max_bytes) for x in files]
+		return list(run_parallel(fn, jobs, min(processes, len(jobs) or 1)))
+
+	def load_equivs(self, eqindex, batch_size):
 		n = 0
 		ttl = 23000000 # estimate as of 2024-04
-		(index, eqindex) = self.get_storage()
 		start = time.time()
+		runs = [r for rs in self.sort_files(sort_equivs, self.get_files('wd_equivs_')) for r in rs]
+		print(f"Sorted equivs into {len(runs)} runs in {int(time.time()-start)} secs")
+		sys.stdout.flush()
 
-		files = [x for x in os.listdir(self.configs.temp_dir) if x.startswith('wd_equivs_')]
-		files.sort()
-		print("Starting...")
+		# runs are in file order, so for the same key the later file wins, as before
+		# and partial merges keep that order
+		runs = reduce_runs(runs, self.configs.temp_dir, 'wd_equivs', self.get_max_merge(), merge_equiv_lines)
 		updates = {}
-		for fn in files:
-			print(fn)
-			with open(os.path.join(self.configs.temp_dir, fn)) as efh:
-				l = efh.readline().strip()
-
-				while l:
-					(x,y) = l.rsplit(',', 1)
-					updates[x] = y
-					n += 1
-					l = efh.readline().strip()
-					if not n % 100000:
-						eqindex.update(updates)
-						updates = {}
-						# eqindex.commit()
-						durn = time.time()-start
-						print(f"{n} of {ttl} in {int(durn)} = {n/durn}/sec -> {ttl/(n/durn)} secs")
-						sys.stdout.flush()
-
-		eqindex.update(updates)
+		try:
+			for (x, y) in merge_equivs(runs):
+				updates[x] = y
+				n += 1
+				if len(updates) >= batch_size:
+					eqindex.update(updates)
+					updates = {}
+					durn = time.time()-start
+					print(f"{n} of {ttl} in {int(durn)} = {n/durn}/sec -> {ttl/(n/durn)} secs")
+					sys.stdout.flush()
+			eqindex.update(updates)
+		finally:
+			for r in runs:
+				os.remove(r)
+		return n
+
+	def load(self):
+		(index, eqindex) = self.get_storage()
+		eqindex = compact_store(eqindex, self.config)
+		batch_size = self.config.get('index_batch_size', 100000)
+		print("Starting...")
+		self.load_equivs(eqindex, batch_size)
 		# eqindex.commit()
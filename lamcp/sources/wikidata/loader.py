@@ -1,19 +1,22 @@
-
 from lux_pipeline.process.base.loader import Loader
-from .fetcher import WdFetcher
-from .base import WdConfigManager
+from .fetcher import WikidataFetcher as WdFetcher
+from .base import WdConfigManager, useful_instance_of
+from ..base.loader import DumpLoader
 import ujson as json
-import gzip
 import time
 import os
 
-class WdLoader(WdFetcher, WdConfigManager, Loader):
+
+class WdLoader(WdFetcher, WdConfigManager, DumpLoader, Loader):
 
     def __init__(self, config):
         WdConfigManager.__init__(self, config)
         WdFetcher.__init__(self, config)
         Loader.__init__(self, config)
         self.skip_lines = 0
+        # Parallel load: number of worker processes, and bytes of dump per chunk of work
+        self.processes = config.get("load_processes", os.cpu_count() or 1)
+        self.load_chunk_bytes = config.get("load_chunk_bytes", 1 << 23)
 
     def get_identifier_raw(self, line):
         ididx = line.find('"id":"Q')
@@ -33,63 +36,105 @@ class WdLoader(WdFetcher, WdConfigManager, Loader):
         # Call on Fetcher parent class
         return self.post_process(js, identifier)
 
+    def guess_type_name(self, rec):
+        # Class name for the local type index (see type_index.py)
+        mapper = self.config.get("mapper", None)
+        if mapper is not None:
+            cls = mapper.guess_type(rec)
+        else:
+            cls = None
+            for p in rec.get("P31", []):
+                if p in useful_instance_of:
+                    cls = useful_instance_of[p]
+                    break
+        return cls.__name__ if cls is not None else ""
+
+    def process_lines(self, lines):
+        # Runs in the worker processes
+        # Returns the records, plus the equivs, diffs and types as CSV text
+        records = []
+        equivs = []
+        diffs = []
+        types = []
+        for l in lines:
+            if len(l) < 3 or self.filter_line(l):
+                # [ and ] around the entities
+                continue
+            l = l.decode('utf-8').strip()
+            what = self.get_identifier_raw(l)
+            if l.endswith(','):
+                js = json.loads(l[:-1])
+            else:
+                js = json.loads(l)
+
+            try:
+                new = self.post_process_json(js, what)
+            except:
+                print(f"Failed to process {l}")
+                raise
+            records.append((what, new))
+
+            # Create intermediate files for indexing
+            sames, dfs = self.process_equivs({'data':new})
+            for sx,sy in sames:
+                equivs.append(f'{sx},{sy}\n')
+            for dx,dy in dfs:
+                diffs.append(f'{dx},{dy}\n')
+            typ = self.guess_type_name(new)
+            if typ:
+                types.append(f'{what},{typ}\n')
+
+        # Normalize every date in the chunk at once, rather than one at a
+        # time when each record is mapped
+        mapper = self.config.get("mapper", None)
+        if mapper is not None:
+            mapper.add_date_ranges([new for what, new in records])
+        return (records, ''.join(equivs), ''.join(diffs), ''.join(types))
+
     def load(self, slicen=None, maxSlice=None):
         # ensure we have the dump file
         # self.fetch_dump()
 
-        with gzip.open(self.in_path, "rt") as fh, \
-            open(os.path.join(self.configs.temp_dir, f'wd_equivs_{slicen}.csv'), 'w') as efh, \
-            open(os.path.join(self.configs.temp_dir, f'wd_diffs_{slicen}.csv'), 'w') as dfh:
+        # The dump is decompressed once, here, and the lines are parsed and
+        # processed in chunks by a pool of processes. Results come back in order
+        # and are written in bulk, with only a few chunks in memory at once.
+        # With an indexed dump the workers decompress their own blocks, and a
+        # restart carries on from the last checkpoint; blocks after it are
+        # loaded again, which may repeat a few equivs/diffs rows
 
+        resumed = self.start_load(slicen, maxSlice)
+        mode = 'a' if resumed else 'w'
+        with open(os.path.join(self.configs.temp_dir, f'wd_equivs_{slicen}.csv'), mode) as efh, \
+            open(os.path.join(self.configs.temp_dir, f'wd_diffs_{slicen}.csv'), mode) as dfh, \
+            open(os.path.join(self.configs.temp_dir, f'wd_types_{slicen}.csv'), mode) as tfh:
 
-            fh.readline() # chomp initial [
-            x = 0 
-            l = 1
             done_x = 0
+            next_report = 10000
 
             self.out_cache.start_bulk()
             start = time.time()
-            while l:
-                l = fh.readline()
-                if not l:
-                    break
-                if maxSlice is not None and x % maxSlice - slicen != 0:
-                    x += 1
-                    continue
-
-                x += 1
-                if self.filter_line(l):
-                    continue
-                done_x += 1
-                l = l.decode('utf-8').strip()
-                what = self.get_identifier_raw(l)
-                if l.endswith(','):
-                    js = json.loads(l[:-1])
-                else:
-                    js = json.loads(l)
-
-                try:
-                    new = self.post_process_json(js, what)
-                except:
-                    print(f"Failed to process {l}")
-                    raise
-                    continue
-                self.out_cache.set_bulk(new, identifier=what)
-
-                # Create intermediate files for indexing
-                sames, diffs = self.process_equivs({'data':new})
-                for sx,sy in sames:
-                    efh.write(f'{sx},{sy}\n')
-                for dx,dy in diffs:
-                    dfh.write(f'{dx},{dy}\n')
-
-                if not done_x % 10000:
+            for n, records, equivs, diffs, types in self.run_work(slicen, maxSlice):
+                for what, new in records:
+                    self.out_cache.set_bulk(new, identifier=what)
+                efh.write(equivs)
+                dfh.write(diffs)
+                tfh.write(types)
+
+                done_x += len(records)
+                if done_x >= next_report:
+                    next_report += 10000
                     t = time.time() - start
-                    xps = x/t
+                    xps = done_x/t
                     ttls = self.total / xps
-                    print(f"{x} in {t} = {xps}/s --> {ttls} total ({ttls/3600} hrs)")
+                    print(f"{done_x} in {t} = {xps}/s --> {ttls} total ({ttls/3600} hrs)")
                     self.out_cache.end_bulk()
+                    self.out_cache.commit()
+                    efh.flush()
+                    dfh.flush()
+                    tfh.flush()
+                    self.write_checkpoint(slicen, n + 1)
                     self.out_cache.start_bulk()
 
         self.out_cache.end_bulk()
         self.out_cache.commit()
+        self.clear_checkpoint(slicen)
@@ -1,6 +1,7 @@
-from .base import WdConfigManager
+from .base import WdConfigManager, useful_instance_of
+from .resolver import WikidataResolver
 from ..base.mapper import Mapper
-from ..base.date_utils import make_datetime
+from ..base.date_utils import make_datetime, make_datetimes
 from cromulent import model, vocab
 from shapely.geometry import Polygon
 
@@ -11,6 +12,27 @@ class WikidataMapper(Mapper, WdConfigManager):
         Mapper.__init__(self, config)
         self.precision_map = {11: "D", 12: "h", 13: "m", 14: "s", 10: "M", 9: "Y"}
         self.process_all_langs = False
+
+        # Properties whose values are passed to get_reference by the process_* functions
+        # These are resolved together in one batch before the record is built
+        self.batch_references = config.get("batch_references", True)
+        self.reference_props = [
+            "P463",
+            "P108",
+            "P1344",
+            "P112",
+            "P361",
+            "P131",
+            "P17",
+            "P170",
+            "P176",
+            "P921",
+            "P50",
+            "P123",
+            "P180",
+            "P710",
+            "P488",
+        ]
         self.gender_map = {
             "Q6581072": vocab.instances["female"],
             "Q6581097": vocab.instances["male"],
@@ -90,7 +112,7 @@ class WikidataMapper(Mapper, WdConfigManager):
 
         return (date, precision)
 
-    def make_datetime(self, date, precision=11):
+    def trim_date(self, date, precision=11):
         if precision < 9:
             # 8 = decade, 7 = century, 6 = millenium
             # Log and ignore for now
@@ -110,11 +132,54 @@ class WikidataMapper(Mapper, WdConfigManager):
                 date = yy
             elif precision == 10:
                 date = f"{yy}-{mm}"
+        return date
 
+    def make_datetime(self, date, precision=11):
+        date = self.trim_date(date, precision)
+        if date is None:
+            return None
         res = make_datetime(date, precision=self.precision_map[precision])
         if res:
             return res
 
+    def date_range(self, value):
+        # (begin, end) for a time value, from the range WdLoader worked out
+        # when the record was loaded if there is one (see add_date_ranges)
+        if type(value) == list:
+            value = value[0]
+        if type(value) == dict and "range" in value:
+            return tuple(value["range"]) if value["range"] else None
+        (date, precision) = self.clean_date(value)
+        return self.make_datetime(date, precision)
+
+    def add_date_ranges(self, records):
+        # Work out the (begin, end) of every time value in a batch of records
+        # with one call to make_datetimes, and keep it with the value as "range"
+        # (None if it has no usable range)
+        found = []
+        dates = []
+        precisions = []
+        for rec in records:
+            for vals in rec.values():
+                if type(vals) != list:
+                    continue
+                for v in vals:
+                    if type(v) == dict and "time" in v and "precision" in v:
+                        try:
+                            (date, precision) = self.clean_date(v)
+                            date = self.trim_date(date, precision)
+                        except:
+                            date = None
+                        if date is None:
+                            v["range"] = None
+                        else:
+                            found.append(v)
+                            dates.append(date)
+                            precisions.append(self.precision_map[precision])
+        if found:
+            for v, res in zip(found, make_datetimes(dates, precisions)):
+                v["range"] = list(res) if res else None
+
     def guess_type(self, data):
         # using P31 is not possible to determine the class, as the class hierarchy
         # is self-contradictory in wikidata
@@ -138,67 +203,6 @@ class WikidataMapper(Mapper, WdConfigManager):
             # Actually a record
             data = data["data"]
 
-        useful_instance_of = {
-            "Q4167410": None,  # Disambiguation page ... this isn't anything so abort
-            "Q5": model.Person,  # Human = Person
-            "Q4830453": model.Group,
-            "Q43229": model.Group,
-            "Q16334295": model.Group,
-            "Q167037": model.Group,
-            "Q783794": model.Group,
-            "Q163740": model.Group,
-            "Q1530022": model.Group,
-            "Q34770": model.Language,
-            "Q1288568": model.Language,
-            "Q33742": model.Language,
-            "Q20162172": model.Language,
-            "Q436240": model.Language,
-            "Q2315359": model.Language,
-            "Q515": model.Place,
-            "Q6256": model.Place,
-            "Q3624078": model.Place,
-            "Q7275": model.Place,
-            "Q28575": model.Place,
-            "Q82794": model.Place,
-            "Q3957": model.Place,
-            "Q1549591": model.Place,
-            "Q702492": model.Place,
-            "Q35657": model.Place,
-            "Q106458883": model.Place,
-            "Q34876": model.Place,
-            "Q486972": model.Place,
-            "Q15284": model.Place,
-            "Q532": model.Place,
-            "Q8502": model.Place,
-            "Q484170": model.Place,
-            "Q42744322": model.Place,
-            "Q747074": model.Place,
-            "Q208469": model.MeasurementUnit,
-            "Q1978718": model.MeasurementUnit,
-            "Q11344": model.Material,
-            "Q1371562": model.MeasurementUnit,
-            "Q1790144": model.MeasurementUnit,
-            "Q3647172": model.MeasurementUnit,
-            "Q3550873": model.MeasurementUnit,
-            "Q12418": model.HumanMadeObject,
-            "Q45585": model.HumanMadeObject,
-            "Q175036": model.HumanMadeObject,
-            "Q698487": model.HumanMadeObject,
-            "Q464782": model.HumanMadeObject,
-            "Q83872": model.HumanMadeObject,
-            "Q1044742": model.HumanMadeObject,
-            "Q1404472": model.Period,
-            "Q45805": model.Period,
-            "Q184963": model.Period,
-            "Q11761": model.Period,
-            "Q9903": model.Period,
-            "Q173034": model.Activity,
-            "Q901769": model.Activity,
-            "Q688909": model.Activity,
-            "Q193155": model.Activity,
-            "Q459447": model.Activity,
-        }
-
         if "P31" in data:
             for p in data["P31"]:
                 if p in useful_instance_of:
@@ -291,6 +295,19 @@ class WikidataMapper(Mapper, WdConfigManager):
         else:
             return class_dist["type"]
 
+    def make_resolver(self, config):
+        return WikidataResolver(self, config)
+
+    def prefetch_references(self, data):
+        # Resolve everything that get_reference will be asked for in one batch
+        wanted = []
+        for prop in self.reference_props:
+            for val in data.get(prop, []):
+                if type(val) == str and not val in wanted:
+                    wanted.append(val)
+        if wanted:
+            self.resolver.resolve_many(wanted)
+
     def process_only_label(self, data, top):
         for lang in self.must_have:
             if lang in data["prefLabel"]:
@@ -561,9 +578,10 @@ class WikidataMapper(Mapper, WdConfigManager):
 
         bdate = data.get("P569", None)
         if bdate:
+            span = self.date_range(bdate)
             bdate, precision = self.clean_date(bdate)
             try:
-                bstart, bend = self.make_datetime(bdate, precision)
+                bstart, bend = span
             except TypeError:
                 bstart = None
             if bstart is not None:
@@ -591,9 +609,10 @@ class WikidataMapper(Mapper, WdConfigManager):
 
         ddate = data.get("P570", None)
         if ddate:
+            span = self.date_range(ddate)
             ddate, precision = self.clean_date(ddate)
             try:
-                dstart, dend = self.make_datetime(ddate, precision)
+                dstart, dend = span
             except TypeError:
                 dstart = None
             if dstart is not None:
@@ -665,9 +684,10 @@ class WikidataMapper(Mapper, WdConfigManager):
 
         bdate = data.get("P571", None)
         if bdate:
+            span = self.date_range(bdate)
             bdate, precision = self.clean_date(bdate)
             try:
-                bstart, bend = self.make_datetime(bdate, precision)
+                bstart, bend = span
             except TypeError:
                 bstart = None
             if bstart is not None:
@@ -705,9 +725,10 @@ class WikidataMapper(Mapper, WdConfigManager):
 
         ddate = data.get("P576", None)
         if ddate:
+            span = self.date_range(ddate)
             ddate, precision = self.clean_date(ddate)
             try:
-                dstart, dend = self.make_datetime(ddate, precision)
+                dstart, dend = span
             except TypeError:
                 dstart = None
             if dstart is not None:
@@ -919,9 +940,10 @@ class WikidataMapper(Mapper, WdConfigManager):
             bstart = None
             prod = model.Production()
             if bdate:
+                span = self.date_range(bdate)
                 bdate, precision = self.clean_date(bdate)
                 try:
-                    bstart, bend = self.make_datetime(bdate, precision)
+                    bstart, bend = span
                 except TypeError:
                     bstart = None
                 if bstart is not None:
@@ -1002,9 +1024,10 @@ class WikidataMapper(Mapper, WdConfigManager):
             for el in enc_loc:
                 enc.took_place_at = model.Place(ident=self.expand_uri(el))
         if enc_date:
+            span = self.date_range(enc_date)
             enc_date, precision = self.clean_date(enc_date)
             try:
-                bstart, bend = self.make_datetime(enc_date, precision)
+                bstart, bend = span
             except TypeError:
                 bstart = None
             if bstart is not None:
@@ -1059,9 +1082,10 @@ class WikidataMapper(Mapper, WdConfigManager):
                 for p in cre_place:
                     cre.took_place_at = model.Place(ident=self.expand_uri(p))
             if cre_date:
+                span = self.date_range(cre_date)
                 bdate, precision = self.clean_date(cre_date)
                 try:
-                    bstart, bend = self.make_datetime(bdate, precision)
+                    bstart, bend = span
                 except TypeError:
                     bstart = None
                 if bstart is not None:
@@ -1086,9 +1110,10 @@ class WikidataMapper(Mapper, WdConfigManager):
                 for p in pub_place:
                     pub.took_place_at = model.Place(ident=self.expand_uri(p))
             if pub_date:
+                span = self.date_range(pub_date)
                 bdate, precision = self.clean_date(pub_date)
                 try:
-                    bstart, bend = self.make_datetime(bdate, precision)
+                    bstart, bend = span
                 except TypeError:
                     bstart = None
                 if bstart is not None:
@@ -1151,18 +1176,20 @@ class WikidataMapper(Mapper, WdConfigManager):
         ts = model.TimeSpan()
 
         if startTime:
+            span = self.date_range(startTime)
             startTime, precision = self.clean_date(startTime)
             try:
-                bstart, bend = self.make_datetime(startTime, precision)
+                bstart, bend = span
                 ts.begin_of_the_begin = bstart
                 ts.end_of_the_begin = bend
             except TypeError:
                 pass
 
         if endTime:
+            span = self.date_range(endTime)
             endTime, precision = self.clean_date(endTime)
             try:
-                estart, eend = self.make_datetime(endTime, precision)
+                estart, eend = span
                 ts.begin_of_the_end = estart
                 ts.end_of_the_end = eend
             except TypeError:
@@ -1210,6 +1237,8 @@ class WikidataMapper(Mapper, WdConfigManager):
         if reference:
             self.process_only_label(data, top)
         else:
+            if self.batch_references:
+                self.prefetch_references(data)
             # Do common properties
             self.process_labels(data, top)
             self.process_equivalents(data, top)
@@ -1,12 +1,14 @@
 
 from .base import WdConfigManager
 from lux_pipeline.process.base.reconciler import LmdbReconciler
+from ..base.codec import compact_store
 
 class WdReconciler(LmdbReconciler, WdConfigManager):
 
     def __init__(self, config):
         WdConfigManager.__init__(self, config)
         LmdbReconciler.__init__(self, config)
+        self.id_index = compact_store(getattr(self, "id_index", None), config)
         self.ext_hash = {
             "http://id.worldcat.org/fast/": "fast",
             "http://vocab.getty.edu/aat/": "aat",
@@ -0,0 +1,85 @@
+import ujson as json
+import logging
+from ..base.reference import ReferenceResolver
+from .base import useful_instance_of
+
+logger = logging.getLogger("lamcp")
+
+
+class WikidataResolver(ReferenceResolver):
+    # Ask the query service for just the labels and P31 of a batch of entities.
+    # Entities whose class can't be known from P31 fall back to the batched
+    # wbgetentities fetch and the full type guessing in the mapper
+
+    def __init__(self, mapper, config):
+        ReferenceResolver.__init__(self, mapper, config)
+        self.sparql_uri = config.get("reference_sparql", "https://query.wikidata.org/sparql")
+
+    def make_query(self, identifiers):
+        langs = ", ".join([f'"{x}"' for x in list(self.mapper.must_have) + ["mul"]])
+        values = " ".join([f"wd:{x}" for x in identifiers])
+        return f"""SELECT ?item ?type ?label WHERE {{
+  VALUES ?item {{ {values} }}
+  OPTIONAL {{ ?item wdt:P31 ?type }}
+  OPTIONAL {{ ?item rdfs:label ?label . FILTER(LANG(?label) IN ({langs})) }}
+}}"""
+
+    def pick_label(self, labels):
+        for lang in list(self.mapper.must_have) + ["mul"]:
+            if labels.get(lang, ""):
+                return labels[lang]
+        return ""
+
+    def lookup_many(self, identifiers):
+        identifiers = [x for x in identifiers if self.mapper.fetcher.validate_identifier(x)]
+        if not identifiers:
+            return {}
+        types = {}
+        labels = {}
+        try:
+            with self.limiter.limit():
+                resp = self.get_session().get(
+                    self.sparql_uri,
+                    params={"query": self.make_query(identifiers), "format": "json"},
+                    headers={"Accept": "application/sparql-results+json"},
+                    timeout=self.timeout,
+                )
+            if resp.status_code != 200:
+                raise ValueError(f"status {resp.status_code}")
+            rows = json.loads(resp.text)["results"]["bindings"]
+        except Exception as e:
+            logger.error(f"Wikidata reference query failed, falling back to full records: {e}")
+            rows = None
+
+        results = {}
+        fallback = []
+        if rows is None:
+            fallback = identifiers
+        else:
+            for row in rows:
+                qid = row["item"]["value"].rsplit("/", 1)[-1]
+                if "type" in row:
+                    typ = row["type"]["value"].rsplit("/", 1)[-1]
+                    types.setdefault(qid, []).append(typ)
+                if "label" in row:
+                    lbl = row["label"]
+                    labels.setdefault(qid, {})[lbl.get("xml:lang", "")] = lbl["value"]
+
+            for qid in identifiers:
+                found = False
+                crmcls = None
+                for typ in types.get(qid, []):
+                    if typ in useful_instance_of:
+                        found = True
+                        crmcls = useful_instance_of[typ]
+                        break
+                if not found:
+                    fallback.append(qid)
+                elif crmcls is not None:
+                    results[qid] = (crmcls.__name__, self.pick_label(labels.get(qid, {})))
+
+        if fallback:
+            records = self.mapper.fetcher.fetch_many(fallback)
+            for qid in fallback:
+                results[qid] = self.lookup_record(records.get(qid, None))
+        return results
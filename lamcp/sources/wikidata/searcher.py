@@ -8,9 +8,7 @@ class WikidataSearcher(Searcher):
             "https://www.wikidata.org/w/api.php?action=wbsearchentities&format=json&search={QUERY}&language={LANG}"
         )
 
-    def search(self, query, lang="", entity_type=""):
-        # Implement search logic here
-        results = super().search(query, lang, entity_type)
+    def process_results(self, results):
         ids = {}
         for hit in results["search"]:
             if not hit["id"] in ids:
@@ -0,0 +1,118 @@
+import os
+import sys
+import glob
+import time
+import sqlite3
+import logging
+
+logger = logging.getLogger("lamcp")
+
+# Local index of Wikidata entity --> class name, built from the wd_types_*.csv
+# files that WdLoader writes, so that bulk loads of other sources can check the
+# class of the entities they link to without asking Wikidata for each one
+#   python -m lamcp.sources.wikidata.type_index <temp dir> [index path]
+
+
+class WdTypeIndex(object):
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # Q number as the rowid keeps the table small
+        self.conn.execute("CREATE TABLE IF NOT EXISTS types (qid INTEGER PRIMARY KEY, type TEXT NOT NULL)")
+        # The CSVs the index was built from, to notice when WdLoader has rewritten them
+        self.conn.execute("CREATE TABLE IF NOT EXISTS source (path TEXT, size INTEGER, mtime REAL)")
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM types").fetchone()[0]
+
+    def is_current(self, paths):
+        rows = set(tuple(r) for r in self.conn.execute("SELECT path, size, mtime FROM source"))
+        current = set()
+        for path in paths:
+            st = os.stat(path)
+            current.add((path, st.st_size, st.st_mtime))
+        return rows == current
+
+    def build(self, paths):
+        # Replace the whole index with the contents of the CSVs
+        self.conn.execute("PRAGMA synchronous=OFF")
+        self.conn.execute("DELETE FROM types")
+        self.conn.execute("DELETE FROM source")
+        self.conn.commit()
+        n = self.load_csv(paths)
+        for path in paths:
+            st = os.stat(path)
+            self.conn.execute("INSERT INTO source VALUES (?, ?, ?)", (path, st.st_size, st.st_mtime))
+        self.conn.commit()
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        return n
+
+    def add_many(self, types):
+        # {qid: class name} found some other way, eg fetched; "" if no class
+        rows = [(int(q[1:]), t) for q, t in types.items()]
+        self.conn.executemany("INSERT OR REPLACE INTO types VALUES (?, ?)", rows)
+        self.conn.commit()
+
+    def load_csv(self, paths, batch=100000):
+        # Lines are Q123,Person
+        n = 0
+        start = time.time()
+        for path in paths:
+            rows = []
+            with open(path) as fh:
+                for l in fh:
+                    (qid, typ) = l.strip().split(",")
+                    rows.append((int(qid[1:]), typ))
+                    if len(rows) >= batch:
+                        self.conn.executemany("INSERT OR REPLACE INTO types VALUES (?, ?)", rows)
+                        self.conn.commit()
+                        n += len(rows)
+                        rows = []
+            if rows:
+                self.conn.executemany("INSERT OR REPLACE INTO types VALUES (?, ?)", rows)
+                self.conn.commit()
+                n += len(rows)
+            print(f"Loaded {n} types in {time.time() - start}")
+        return n
+
+    def lookup_many(self, qids, batch=500):
+        # {qid: class name} for the qids that are in the index
+        nums = {}
+        for q in qids:
+            try:
+                nums[int(q[1:])] = q
+            except:
+                continue
+        results = {}
+        keys = sorted(nums)
+        for i in range(0, len(keys), batch):
+            chunk = keys[i : i + batch]
+            marks = ",".join(["?"] * len(chunk))
+            for num, typ in self.conn.execute(f"SELECT qid, type FROM types WHERE qid IN ({marks})", chunk):
+                results[nums[num]] = typ
+        return results
+
+
+def get_type_index(config):
+    # The type index for the wikidata config, (re)built from the CSVs if they
+    # have changed since it was last built
+    temp_dir = config["all_configs"].temp_dir
+    path = config.get("typeIndexPath", os.path.join(temp_dir, "wd_types.sqlite"))
+    index = WdTypeIndex(path)
+    fns = sorted(glob.glob(os.path.join(temp_dir, "wd_types_*.csv")))
+    if fns:
+        if not index.is_current(fns):
+            logger.info(f"Building Wikidata type index {path} from {len(fns)} files")
+            index.build(fns)
+    elif not len(index):
+        logger.warning(f"Wikidata type index {path} is empty and there are no wd_types_*.csv to build it")
+    return index
+
+
+if __name__ == "__main__":
+    temp_dir = sys.argv[1]
+    path = sys.argv[2] if len(sys.argv) > 2 else os.path.join(temp_dir, "wd_types.sqlite")
+    index = WdTypeIndex(path)
+    index.build(sorted(glob.glob(os.path.join(temp_dir, "wd_types_*.csv"))))
+    print(f"{path}: {len(index)} entities")
@@ -1,14 +1,22 @@
-from lux_pipeline.process.base.fetcher import Fetcher
+from ..base.fetcher import Fetcher
 import os, sys
+import asyncio
 import sqlite3
+import threading
 import ujson as json
 
 class WofFetcher(Fetcher):
-    
+
 
     def __init__(self, config):
         Fetcher.__init__(self, config)
         self.dumpdb = config['dumpFilePath']
+        # One read only connection per thread, kept open, with the db memory mapped
+        self.local = threading.local()
+        self.mmap_size = config.get('mmap_size', 1 << 30)
+        self.fetch_many_size = 200
+        # Records come from the local db, so caching them again is just a JSON round trip
+        self.cache_raw = False
 
     def make_fetch_uri(self, identifier):
         identifier = identifier.replace('.geojson', '')
@@ -27,28 +35,77 @@ class WofFetcher(Fetcher):
                     npid = ''
             return f"https://data.whosonfirst.org/{'/'.join(chunks)}/{identifier}.geojson"
 
+    def get_connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            if not os.path.exists(self.dumpdb):
+                return None
+            conn = sqlite3.connect(f"file:{self.dumpdb}?mode=ro", uri=True, check_same_thread=False)
+            conn.execute(f"PRAGMA mmap_size={self.mmap_size}")
+            self.local.conn = conn
+        return conn
+
+    def local_id(self, identifier):
+        if '/' in identifier:
+            identifier = identifier.rsplit('/', 1)[1]
+        return identifier.replace('.geojson', '')
+
+    def decode_body(self, jstr):
+        if type(jstr) == str:
+            return json.loads(jstr)
+        return jstr
+
+    def fetch_local(self, identifier):
+        # Record from the local db, or None if not there
+        conn = self.get_connection()
+        if conn is None:
+            return None
+        # Same SQL every time, so sqlite3 reuses the prepared statement
+        res = conn.execute("SELECT body FROM geojson WHERE id=?", (self.local_id(identifier), )).fetchone()
+        if res is None:
+            return None
+        return {'data': self.decode_body(res[0]), 'source': self.name, 'identifier': identifier}
+
     def fetch(self, identifier):
         # first check if we have the sqlite db
-        fn = self.dumpdb
-        if os.path.exists(fn):
-            conn = sqlite3.connect(f"file:{fn}?mode=ro", uri=True)
-            cursor = conn.cursor()
-            if '/' in identifier:
-                identifier = identifier.rsplit('/', 1)[1]
-            ident = identifier.replace('.geojson', '')
-            cursor.execute("SELECT body FROM geojson WHERE id=?", (ident, ))
-            res = cursor.fetchall()
-            try:
-                jstr = res[0][0]
-            except:
-                # Asked for something we don't have...
-                # pass to network
-                return Fetcher.fetch(self, identifier)
-            if type(jstr) == str:
-                js = json.loads(jstr)
-            else:
-                js = jstr
-            return {'data': js, 'source': self.name, 'identifier': identifier}
-
-        else:
+        rec = self.fetch_local(identifier)
+        if rec is None:
+            # Asked for something we don't have...
+            # pass to network
             return Fetcher.fetch(self, identifier)
+        return rec
+
+    async def afetch(self, identifier):
+        # The lookup and decoding a large GeoJSON body would hold up the loop,
+        # so do it all in a worker thread (each has its own connection)
+        return await asyncio.to_thread(self.fetch, identifier)
+
+    def fetch_many(self, identifiers, decode=True):
+        # Look up many places in one query per fetch_many_size
+        # Returns a dict of identifier to record, omitting any that failed
+        # With decode=False, data is the stored GeoJSON text
+        results = {}
+        todo = {}
+        for ident in identifiers:
+            todo.setdefault(self.local_id(ident), ident)
+        conn = self.get_connection()
+        if conn is not None and todo:
+            ids = list(todo)
+            n = self.fetch_many_size
+            # Pad the last chunk so there's only ever one statement to prepare
+            sql = f"SELECT id, body FROM geojson WHERE id IN ({','.join(['?'] * n)})"
+            for start in range(0, len(ids), n):
+                chunk = ids[start:start + n]
+                chunk += [chunk[-1]] * (n - len(chunk))
+                for (lid, body) in conn.execute(sql, chunk):
+                    ident = todo.get(str(lid), None)
+                    if ident is None or ident in results:
+                        continue
+                    data = self.decode_body(body) if decode else body
+                    results[ident] = {'data': data, 'source': self.name, 'identifier': ident}
+        for ident in todo.values():
+            if not ident in results:
+                rec = Fetcher.fetch(self, ident)
+                if rec is not None:
+                    results[ident] = rec
+        return results
@@ -16,5 +16,6 @@ setup(
         "numpy",
         "bs4",
         "pyluach",
+        "httpx",
     ],
 )
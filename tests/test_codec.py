@@ -0,0 +1,102 @@
+from lamcp.sources.base.codec import (
+    prefixes,
+    encode,
+    decode,
+    encode_text,
+    decode_text,
+    CompactIndex,
+    compact_store,
+)
+
+# Local parts to put after each prefix: numeric (packed), text, and the
+# awkward cases around the numeric form
+locals_ = ["0", "7", "79021164", "999999999999999999", "0123", "n79021164", "abc-def", "", "Ünïcødé", "名前"]
+
+
+def check(value):
+    data = encode(value)
+    assert type(data) is bytes
+    assert decode(data) == value
+    text = encode_text(value)
+    assert type(text) is str
+    assert decode_text(text) == value
+    # latin-1 is one char per byte
+    assert text.encode("latin-1") == data
+
+
+def test_every_prefix():
+    for p in prefixes:
+        for l in locals_:
+            check(p + l)
+
+
+def test_known_prefix_is_compact():
+    assert encode("lcnaf:n79021164") == bytes([prefixes.index("lcnaf:n") + 1 | 0x80]) + (79021164).to_bytes(4, "big")
+    assert len(encode("http://vocab.getty.edu/ulan/500115393")) == 5
+
+
+def test_unknown_prefix():
+    for value in [
+        "unknown:123",
+        "https://example.org/thing/123",
+        "https://example.org/thing/abc",
+        "urn:uuid:1b4e28ba-2fa1-11d2-883f-0016d3cca427",
+        "no-separators",
+        "12345",
+        "",
+    ]:
+        check(value)
+    # Unknown prefixes are kept as text, with code 0
+    assert encode("unknown:123")[0] == 0
+
+
+def test_non_ascii():
+    for value in [
+        "viaf:Ü123",
+        "wikidata:Qé",
+        "https://data.bnf.fr/ark:/12148/cb11888978p#ñ",
+        "ndl:東京",
+        "日本:123",
+        "http://id.ndl.go.jp/auth/ndlsh/00563838",
+        "gnd:\u0000￿",
+    ]:
+        check(value)
+
+
+def test_numbers_that_dont_round_trip_as_int():
+    # Leading zeros, signs and too many digits must stay as text
+    for value in ["viaf:007", "viaf:-1", "viaf:+1", "viaf:1.5", "viaf:" + "9" * 25]:
+        assert encode(value)[0] & 0x80 == 0
+        check(value)
+
+
+def test_compact_index():
+    store = {}
+    index = CompactIndex(store)
+    index["lcnaf:n79021164"] = "ulan:500115393"
+    index["ndl:東京"] = "wikidata:Q1490"
+    index.update({"viaf:123": "unknown:x", "aat:300033618": 5})
+
+    # Only encoded keys and string values are stored
+    assert encode_text("lcnaf:n79021164") in store
+    assert store[encode_text("lcnaf:n79021164")] == encode_text("ulan:500115393")
+    assert store[encode_text("aat:300033618")] == 5
+
+    assert index["lcnaf:n79021164"] == "ulan:500115393"
+    assert index["ndl:東京"] == "wikidata:Q1490"
+    assert index["viaf:123"] == "unknown:x"
+    assert index["aat:300033618"] == 5
+    assert "viaf:123" in index
+    assert "viaf:124" not in index
+    assert index.get("viaf:124", "missing") == "missing"
+    del index["viaf:123"]
+    assert "viaf:123" not in index
+    # Other methods go to the store
+    assert len(index.keys()) == 3
+
+
+def test_compact_store():
+    store = {}
+    assert compact_store(store, {}) is store
+    assert compact_store(None, {"compactEquivalents": True}) is None
+    assert isinstance(compact_store(store, {"compactEquivalents": True}), CompactIndex)
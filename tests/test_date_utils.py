@@ -0,0 +1,181 @@
+import copy
+from lamcp.sources.base.date_utils import (
+    make_datetime,
+    make_datetimes,
+    test_birth_death as birth_death_ok,
+    test_birth_death_many as birth_death_ok_many,
+    validate_timespans,
+    validate_timespans_many,
+)
+from lamcp.sources.wikidata.mapper import WikidataMapper
+
+# (value, precision) pairs for the batch and scalar versions to agree on
+dates = [
+    # full dates, with and without midnight
+    ("1879-03-14", ""),
+    ("1879-03-14T00:00:00", ""),
+    ("1879-03-14T00:00:00", "D"),
+    ("1879-03-14", "D"),
+    # partial precisions
+    ("1853-03", ""),
+    ("1853-03", "M"),
+    ("1606", ""),
+    ("1606", "Y"),
+    ("1606", "D"),
+    ("1853-03", "D"),
+    # leap days, and months of every length
+    ("2000-02-29", ""),
+    ("2024-02-29", "D"),
+    ("1900-02-29", ""),
+    ("2023-02-29", ""),
+    ("2024-02", "M"),
+    ("1900-02", "M"),
+    ("2023-04", "M"),
+    ("2023-12", "M"),
+    ("2023-04-31", ""),
+    ("2023-13", ""),
+    # BCE
+    ("-0044-03-15", ""),
+    ("-0044-03-15T00:00:00", "D"),
+    ("-0570", "Y"),
+    ("-0495", ""),
+    ("-0004-02-29", ""),
+    ("-0100-02", "M"),
+    ("44 BC", ""),
+    ("500 BCE", ""),
+    # early years and year zero
+    ("0079", "Y"),
+    ("0814-01-28", ""),
+    ("0000", ""),
+    ("0000-01-01", ""),
+    # left to the slow path
+    ("14.03.1879", ""),
+    ("13.07.v100", ""),
+    ("v356", ""),
+    ("19XX", ""),
+    ("ca. 1500", ""),
+    ("March 14, 1879", ""),
+    ("1879-03-14T12:30:00", ""),
+    ("1879-03-14T12:30:00", "s"),
+    ("9999-12-31", ""),
+    ("not a date", ""),
+    ("", ""),
+]
+
+
+def scalar(value, precision):
+    try:
+        return make_datetime(value, precision)
+    except:
+        return None
+
+
+def test_make_datetimes_matches_make_datetime():
+    batch = make_datetimes([d[0] for d in dates], [d[1] for d in dates])
+    for (value, precision), res in zip(dates, batch):
+        assert res == scalar(value, precision), (value, precision)
+
+
+def test_make_datetimes_default_precision():
+    values = [d[0] for d in dates if not d[1]]
+    assert make_datetimes(values) == [scalar(v, "") for v in values]
+
+
+def test_make_datetimes_one_bad_value_in_a_group():
+    # A bad day only drops that value, not the rest of its group
+    values = ["2023-02-28", "2023-02-29", "2023-03-01"]
+    res = make_datetimes(values)
+    assert res[0] == ("2023-02-28T00:00:00", "2023-02-28T23:59:59")
+    assert res[1] == scalar("2023-02-29", "")
+    assert res[2] == ("2023-03-01T00:00:00", "2023-03-01T23:59:59")
+
+
+def person(birth, death):
+    rec = {"type": "Person"}
+    if birth is not None:
+        rec["born"] = {"type": "Birth", "timespan": {"type": "TimeSpan", "begin_of_the_begin": birth}}
+    if death is not None:
+        rec["died"] = {"type": "Death", "timespan": {"type": "TimeSpan", "end_of_the_end": death}}
+    return rec
+
+
+def test_birth_death_many_matches_scalar():
+    people = [
+        person("1879-03-14T00:00:00", "1955-04-18T23:59:59"),
+        # too long, and died before being born
+        person("1700-01-01T00:00:00", "1900-01-01T00:00:00"),
+        person("1955-01-01T00:00:00", "1879-01-01T00:00:00"),
+        # BCE, both ways round
+        person("-0100-07-12T00:00:00", "-0044-03-15T23:59:59"),
+        person("-0044-03-15T00:00:00", "-0100-07-12T23:59:59"),
+        person("-0300-01-01T00:00:00", "-0100-01-01T00:00:00"),
+        # across year zero, and leap days
+        person("-0010-01-01T00:00:00", "0050-12-31T23:59:59"),
+        person("1896-02-29T00:00:00", "2000-02-29T23:59:59"),
+        # just under and just over the limit
+        person("1900-01-01T00:00:00", "2021-12-31T23:59:59"),
+        person("1900-01-01T00:00:00", "2022-01-02T00:00:00"),
+        # missing or unparsable dates pass
+        person("1879-03-14T00:00:00", None),
+        person(None, None),
+        person("sometime", "1955-04-18T23:59:59"),
+    ]
+    assert birth_death_ok_many(people) == [birth_death_ok(p) for p in people]
+    assert birth_death_ok_many([]) == []
+
+
+def event(typ, **props):
+    return {"type": typ, "timespan": dict({"type": "TimeSpan"}, **props)}
+
+
+def test_validate_timespans_many_matches_scalar():
+    recs = [
+        {
+            "type": "Person",
+            "born": event("Birth", begin_of_the_begin="1879-03-14", end_of_the_end="1879-03-14"),
+            "died": event("Death", begin_of_the_begin="1955-04", end_of_the_end="1955-04Z"),
+        },
+        {
+            "type": "Person",
+            "born": event("Birth", begin_of_the_begin="-0044", end_of_the_end="-0044"),
+            "died": event("Death", begin_of_the_begin="2023-02-29", end_of_the_end="9999-12-31"),
+        },
+        {
+            "type": "HumanMadeObject",
+            "produced_by": {
+                "type": "Production",
+                "part": [event("Production", begin_of_the_begin="2024-02", end_of_the_end="2024-02-29T00:00:00")],
+            },
+        },
+        {"type": "Group", "formed_by": event("Formation", begin_of_the_begin="ca. 1500", end_of_the_end="1600")},
+        {"type": "Type"},
+    ]
+    one = copy.deepcopy(recs)
+    for rec in one:
+        validate_timespans(rec)
+    many = copy.deepcopy(recs)
+    validate_timespans_many(many)
+    assert many == one
+    # and something was actually normalized
+    assert many != recs
+
+
+def test_wikidata_date_ranges():
+    # Ranges worked out in bulk when loading are the same as mapping each date
+    mapper = WikidataMapper({"name": "wikidata", "namespace": "http://www.wikidata.org/entity/", "fetch": ""})
+    values = [
+        {"time": "+1879-03-14T00:00:00Z", "precision": 11},
+        {"time": "+1853-03-00T00:00:00Z", "precision": 10},
+        {"time": "+1606-00-00T00:00:00Z", "precision": 9},
+        {"time": "-0044-03-15T00:00:00Z", "precision": 11},
+        {"time": "-0570-00-00T00:00:00Z", "precision": 9},
+        {"time": "+2000-02-29T00:00:00Z", "precision": 11},
+        {"time": "+1900-02-29T00:00:00Z", "precision": 11},
+        {"time": "+2000-00-00T00:00:00Z", "precision": 7},
+    ]
+    expected = [mapper.date_range(copy.deepcopy(v)) for v in values]
+    records = [{"P569": [v], "P31": ["Q5"]} for v in copy.deepcopy(values)]
+    mapper.add_date_ranges(records)
+    for rec, exp in zip(records, expected):
+        assert "range" in rec["P569"][0]
+        assert mapper.date_range(rec["P569"]) == exp
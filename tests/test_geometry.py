@@ -0,0 +1,111 @@
+import math
+import random
+from shapely import wkt as shapely_wkt
+from lamcp.sources.base.geometry import ramerdouglas, visvalingam, GeometryWriter
+
+
+def circle(n, r=1.0, cx=0.0, cy=0.0, jitter=0.0, seed=1):
+    # Closed ring of n + 1 points, optionally with noise on the radius
+    rnd = random.Random(seed)
+    pts = []
+    for i in range(n):
+        a = 2 * math.pi * i / n
+        rr = r + rnd.uniform(-jitter, jitter)
+        pts.append([cx + rr * math.cos(a), cy + rr * math.sin(a)])
+    pts.append(pts[0])
+    return pts
+
+
+def test_ramerdouglas_line():
+    # Straight line collapses to its ends, a corner is kept
+    assert ramerdouglas([[0, 0], [1, 0], [2, 0], [3, 0]], 0.1) == [[0, 0], [3, 0]]
+    assert ramerdouglas([[0, 0], [1, 0], [2, 1], [3, 0]], 0.1) == [[0, 0], [1, 0], [2, 1], [3, 0]]
+    assert ramerdouglas([[0, 0], [1, 1]], 0.1) == [[0, 0], [1, 1]]
+
+
+def test_ramerdouglas_closed_ring():
+    # Both ends are the same point, which used to divide by zero
+    ring = circle(200)
+    out = ramerdouglas(ring, 0.01)
+    assert out[0] == out[-1] == ring[0]
+    assert 4 <= len(out) < len(ring)
+    # Every point kept is from the input, in order
+    idx = [ring.index(p) for p in out[:-1]]
+    assert idx == sorted(idx)
+
+
+def test_ramerdouglas_long_line():
+    # Deep enough to have hit the recursion limit
+    line = [[i, (i % 2) * 0.5] for i in range(20000)]
+    assert len(ramerdouglas(line, 0.1)) == len(line)
+    assert len(ramerdouglas(line, 1)) == 2
+
+
+def test_visvalingam():
+    ring = circle(500, jitter=0.05)
+    for target in [4, 10, 50, 499]:
+        out = visvalingam(ring, target)
+        assert len(out) == target
+        assert out[0] == out[-1] == ring[0]
+        assert shapely_wkt.loads(f"POLYGON (({', '.join(f'{x} {y}' for x, y in out)}))").is_valid
+    # Never below a closed triangle, and short lines are returned as they are
+    assert len(visvalingam(ring, 1)) == 4
+    short = [[0, 0], [1, 0], [0, 1], [0, 0]]
+    assert visvalingam(short, 2) == short
+
+
+def check_wkt(wkt, max_points):
+    shape = shapely_wkt.loads(wkt)
+    assert shape.is_valid
+    points = wkt.count(",") + 1
+    assert points <= max_points
+    return shape
+
+
+def test_simplify_polygon_budget():
+    for budget in [20, 100, 350]:
+        writer = GeometryWriter({"polygon_points": budget})
+        geom = {"type": "Polygon", "coordinates": [circle(5000, r=10, jitter=0.5)]}
+        shape = check_wkt(writer.to_wkt(geom), budget)
+        assert shape.geom_type == "Polygon"
+        # Still roughly the same shape
+        assert abs(shape.area - math.pi * 100) < math.pi * 100 * 0.2
+
+
+def test_simplify_multipolygon_budget():
+    # An archipelago with more islands than the budget can give rings to,
+    # and a hole in the largest
+    polys = [[circle(2000, r=20, jitter=1), circle(500, r=5, seed=2)]]
+    for i in range(100):
+        polys.append([circle(50, r=0.5, cx=40 + i * 2, seed=i)])
+    geom = {"type": "MultiPolygon", "coordinates": polys}
+    budget = 350
+    shape = check_wkt(GeometryWriter({"polygon_points": budget}).to_wkt(geom), budget)
+    assert shape.geom_type == "MultiPolygon"
+    # The largest island kept its hole
+    largest = max(shape.geoms, key=lambda p: p.area)
+    assert len(largest.interiors) == 1
+
+
+def test_to_wkt_min_area_and_cache():
+    writer = GeometryWriter({})
+    tiny = {"type": "Polygon", "coordinates": [circle(10, r=0.001)]}
+    assert writer.to_wkt(tiny, "x", min_area=0.005) is None
+    assert writer.to_wkt(tiny, "x") is not None
+    assert writer.to_wkt({"type": "Point", "coordinates": [1.123456789, 2]}) == "POINT (1.12346 2.0)"
+    assert writer.to_wkt({"type": "Polygon", "coordinates": [[[0, 0], [1, 1]]]}, "bad") is None
+
+
+def test_simplify_drops_straight_runs():
+    # Dense but straight edges come down to the corners, rather than using
+    # up the budget on points that are on the line
+    edge = [i / 1000 for i in range(1000)]
+    ring = (
+        [[x, 0] for x in edge]
+        + [[1, y] for y in edge]
+        + [[1 - x, 1] for x in edge]
+        + [[0, 1 - y] for y in edge]
+        + [[0, 0]]
+    )
+    wkt = GeometryWriter({"polygon_points": 350}).to_wkt({"type": "Polygon", "coordinates": [ring]})
+    assert wkt == "POLYGON ((0.0 0.0, 1.0 0.0, 1.0 1.0, 0.0 1.0, 0.0 0.0))"
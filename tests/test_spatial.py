@@ -0,0 +1,137 @@
+import os
+import multiprocessing
+import pytest
+from lamcp.sources.base import spatial
+from lamcp.sources.base.spatial import SpatialIndex, parse_bbox, open_spatial_index, haversine_km
+
+
+def square(x, y, size, hole=None):
+    ring = [[x, y], [x + size, y], [x + size, y + size], [x, y + size], [x, y]]
+    rings = [ring]
+    if hole is not None:
+        (hx, hy, hs) = hole
+        rings.append([[hx, hy], [hx + hs, hy], [hx + hs, hy + hs], [hx, hy + hs], [hx, hy]])
+    return {"type": "Polygon", "coordinates": rings}
+
+
+@pytest.fixture
+def index(tmp_path):
+    idx = SpatialIndex({"path": str(tmp_path / "places.sqlite")})
+    idx.add_many(
+        "geonames",
+        [
+            ("1", "Centre", "P", 10.0, 50.0, None, None),
+            ("2", "Near", "P", 10.05, 50.0, None, None),
+            ("3", "Further", "P", 10.2, 50.0, None, None),
+            ("4", "Far", "P", 12.0, 50.0, None, None),
+        ],
+    )
+    idx.add_many(
+        "wof",
+        [
+            ("country", "Country", "country", None, None, None, square(0, 40, 20)),
+            ("region", "Region", "region", None, None, None, square(9, 49, 2, hole=(9.9, 49.9, 0.2))),
+            ("city", "City", "locality", 10.0, 50.0, None, square(9.95, 49.95, 0.1)),
+            ("point", "Point only", "venue", 10.0, 50.0, None, None),
+        ],
+    )
+    return idx
+
+
+def names(results):
+    return [r["name"] for r in results]
+
+
+def test_add_and_replace(index):
+    assert len(index) == 8
+    # Adding the same identifiers again replaces them, rather than duplicating
+    index.add_many("geonames", [("2", "Near renamed", "P", 10.06, 50.0, None, None)])
+    assert len(index) == 8
+    assert "Near renamed" in names(index.nearby(50.0, 10.0, 10))
+    assert not "Near" in names(index.nearby(50.0, 10.0, 10))
+    # Same identifier in another dataset is a different place
+    index.add_many("pleiades", [("2", "Other", "settlement", 10.0, 50.0, None, None)])
+    assert len(index) == 9
+    # Rows with no location are skipped
+    assert index.add_many("pleiades", [("x", "Nowhere", "", None, None, None, None)]) == 0
+    index.clear("pleiades")
+    assert len(index) == 8
+
+
+def test_nearby(index):
+    res = index.nearby(50.0, 10.0, radius_km=20, datasets=["geonames"])
+    assert names(res) == ["Centre", "Near", "Further"]
+    # Distances are right and in order
+    assert res[0]["distance_km"] == 0
+    assert abs(res[1]["distance_km"] - float(haversine_km(50.0, 10.0, [50.0], [10.05])[0])) < 0.01
+    assert res[1]["distance_km"] < res[2]["distance_km"]
+    assert names(index.nearby(50.0, 10.0, radius_km=5, datasets=["geonames"])) == ["Centre", "Near"]
+    assert names(index.nearby(50.0, 10.0, radius_km=20, limit=1, datasets=["geonames"])) == ["Centre"]
+    assert index.nearby(0.0, -100.0, radius_km=20) == []
+
+
+def test_within_bbox(index):
+    res = index.within_bbox(10.01, 49.9, 10.3, 50.1, datasets=["geonames"])
+    # Nearest the centre of the box first
+    assert names(res) == ["Further", "Near"]
+    assert names(index.within_bbox(11, 49, 13, 51, datasets=["geonames"])) == ["Far"]
+    assert index.within_bbox(100, 0, 101, 1) == []
+
+
+@pytest.mark.skipif(spatial.shapely is None, reason="needs shapely")
+def test_containing_order(index):
+    # Smallest first; point-only places are never containers
+    assert names(index.containing(50.0, 10.0)) == ["City", "Country"]
+    # Inside the region, outside its hole and the city
+    assert names(index.containing(49.5, 9.5)) == ["Region", "Country"]
+    assert names(index.containing(49.5, 9.5, limit=1)) == ["Region"]
+    assert names(index.containing(49.5, 9.5, datasets=["geonames"])) == []
+    assert index.containing(0.0, -100.0) == []
+
+
+def test_containing_needs_shapely(index, monkeypatch):
+    # Without shapely there's only the bounding box, so refuse rather than guess
+    monkeypatch.setattr(spatial, "shapely", None)
+    assert not spatial.containment_available()
+    with pytest.raises(RuntimeError):
+        index.containing(50.0, 10.0)
+
+
+def test_parse_bbox():
+    assert parse_bbox("1,2,3,4") == [1.0, 2.0, 3.0, 4.0]
+    assert parse_bbox(" -10.5, -20 ,10.5,20") == [-10.5, -20.0, 10.5, 20.0]
+    for bad in ["", "1,2,3", "1,2,3,4,5", "a,b,c,d", "3,0,1,2", "0,3,1,2", "nan,0,1,1", "0,0,inf,1"]:
+        with pytest.raises(ValueError):
+            parse_bbox(bad)
+
+
+def test_open_spatial_index(tmp_path):
+    path = str(tmp_path / "none.sqlite")
+    assert open_spatial_index({"path": path}) is None
+    assert open_spatial_index({}) is None
+    # Opening to query never creates the file
+    assert not os.path.exists(path)
+
+
+def add_slice(path, slicen):
+    idx = SpatialIndex({"path": path})
+    idx.start_bulk()
+    for b in range(20):
+        rows = [(f"{slicen}-{b}-{i}", "x", "P", slicen + i / 100, b, None, None) for i in range(50)]
+        idx.add_many("geonames", rows)
+    idx.end_bulk()
+
+
+def test_concurrent_writers(tmp_path):
+    # Loader slices write the same index from separate processes
+    path = str(tmp_path / "places.sqlite")
+    SpatialIndex({"path": path})
+    procs = [multiprocessing.Process(target=add_slice, args=(path, s)) for s in range(4)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    assert [p.exitcode for p in procs] == [0] * 4
+    idx = SpatialIndex({"path": path})
+    assert len(idx) == 4 * 20 * 50
+    assert idx.conn.execute("SELECT COUNT(*) FROM boxes").fetchone()[0] == len(idx)